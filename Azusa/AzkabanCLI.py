@@ -0,0 +1,90 @@
+#!/usr/local/bin/python2.7
+"""
+    Azusa command line interface.
+
+        azusa deploy --host https://azkaban:8443/ -u azkaban defs/etl.py defs/report.py
+        azusa watch --host http://localhost:8081/ -u azkaban defs/etl.py
+
+    :copyright: 2015, Tasuku OKUDA.
+"""
+
+import argparse
+import sys
+import time
+from getpass import getpass
+
+from AzkabanWeb import AjaxAPI
+from AzkabanDeploy import DeployPipeline, format_report
+from AzkabanWatch import Watcher
+
+
+def add_server_arguments(parser):
+    """ Azkaban connection arguments.
+
+    :type parser: argparse.ArgumentParser
+    """
+    parser.add_argument('-H', '--host', default="http://localhost:22300", help="Azkaban web server host")
+    parser.add_argument('-u', '--username', required=True, help="Azkaban login username")
+    parser.add_argument('-p', '--password', default=None, help="Azkaban login password (prompted if omitted)")
+    parser.add_argument('--log-level', default="INFO", help="DEBUG, INFO, WARNING or ERROR")
+
+
+def connect(args):
+    """ Logged-in AjaxAPI from parsed arguments.
+
+    :rtype: AjaxAPI
+    """
+    password = args.password if args.password is not None else getpass('Azkaban login password: ')
+    return AjaxAPI(args.host, args.username, password, log_level=args.log_level)
+
+
+def deploy(args):
+    api = connect(args)
+    pipeline = DeployPipeline(api, out_dir=args.out_dir, build_workers=args.build_workers,
+                              upload_workers=args.upload_workers, force=args.force, schedule=args.schedule,
+                              prune_schedules=args.prune_schedules)
+    start = time.time()
+    results = pipeline.run(args.modules)
+    print format_report(results, time.time() - start)
+    return 1 if any(r.error is not None for r in results) else 0
+
+
+def watch(args):
+    api = connect(args)
+    Watcher(api, args.modules, out_dir=args.out_dir, interval=args.interval, schedule=args.schedule).run()
+    return 0
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(prog='azusa', description="Azusa - Azkaban project builder & uploader")
+    subparsers = parser.add_subparsers(dest='command')
+
+    deploy_parser = subparsers.add_parser('deploy', help="build and upload project definition modules")
+    add_server_arguments(deploy_parser)
+    deploy_parser.add_argument('modules', nargs='+', help="definition module paths or dotted names")
+    deploy_parser.add_argument('--out-dir', default='.azusa', help="directory for built zips and deploy state")
+    deploy_parser.add_argument('--build-workers', type=int, default=None, help="build processes (default: CPUs)")
+    deploy_parser.add_argument('--upload-workers', type=int, default=4, help="concurrent uploads")
+    deploy_parser.add_argument('--force', action='store_true', help="upload unchanged projects too")
+    deploy_parser.add_argument('--schedule', action='store_true', help="create and update declared schedules")
+    deploy_parser.add_argument('--prune-schedules', action='store_true',
+                               help="with --schedule, also remove schedules which are not declared")
+    deploy_parser.set_defaults(func=deploy)
+
+    watch_parser = subparsers.add_parser('watch', help="rebuild and upload changed flows on every edit")
+    add_server_arguments(watch_parser)
+    watch_parser.add_argument('modules', nargs='+', help="definition module paths or dotted names")
+    watch_parser.add_argument('--out-dir', default='.azusa', help="directory for built zips")
+    watch_parser.add_argument('--interval', type=float, default=1.0, help="polling interval seconds")
+    watch_parser.add_argument('--schedule', action='store_true', help="create and update declared schedules")
+    watch_parser.set_defaults(func=watch)
+
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_arguments(argv)
+    return args.func(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,270 @@
+#!/usr/local/bin/python2.7
+"""
+    Deploy pipeline: load project definitions, build zips in parallel and upload them.
+
+    A definition module provides Projects by one of:
+
+        def create_projects(): return [Project(...), ...]
+        projects = [Project(...), ...]
+        any Project object at module level
+
+    Zips are built on a process pool (one task per module) by BatchPackager, which renders
+    each project once for both the zip and its hash. Each zip is uploaded as soon as it is ready, unchanged projects (same hash as the last
+    successful deploy to the host) are not uploaded again. With schedule=True, declared
+    schedules are reconciled against one schedule listing fetched at start. Undeclared
+    schedules are removed only with prune_schedules=True.
+
+    :copyright: 2015, Tasuku OKUDA.
+"""
+
+import collections
+import hashlib
+import imp
+import importlib
+import json
+import multiprocessing
+import os
+import threading
+import time
+import traceback
+from multiprocessing.pool import ThreadPool
+
+from AzkabanJob import Project
+from AzkabanPackage import BatchPackager, entries_digest, render_entries
+from AzkabanSchedule import ScheduleReconciler
+
+
+BuiltProject = collections.namedtuple('BuiltProject', ['module', 'name', 'description', 'schedules',
+                                                       'zip_path', 'digest', 'build_seconds'])
+
+DeployResult = collections.namedtuple('DeployResult', ['module', 'project', 'digest', 'skipped', 'error', 'timings'])
+
+
+def load_module(module_ref, force_reload=False):
+    """ Import definition module by file path or dotted module name.
+
+    Files are executed on every call. Dotted modules are imported once, unless force_reload.
+
+    :param module_ref: such as 'flows/etl.py' or 'mypackage.flows'
+    :type module_ref: str
+    :param force_reload: Execute an already imported dotted module again.
+    :type force_reload: bool
+    :rtype: module
+    """
+    if module_ref.endswith('.py') or os.path.sep in module_ref:
+        path = os.path.abspath(module_ref)
+        name = "azusa_def_{0}".format(hashlib.sha1(path).hexdigest()[:12])
+        return imp.load_source(name, path)
+    module = importlib.import_module(module_ref)
+    if force_reload:
+        module = reload(module)
+    return module
+
+
+def load_projects(module):
+    """ Projects defined in module.
+
+    :type module: module
+    :rtype: list
+    """
+    if callable(getattr(module, 'create_projects', None)):
+        projects = module.create_projects()
+    elif hasattr(module, 'projects'):
+        projects = module.projects
+    else:
+        projects = [value for key, value in sorted(vars(module).items()) if isinstance(value, Project)]
+    projects = list(projects)
+    for project in projects:
+        if not isinstance(project, Project):
+            raise TypeError("{0} is not Project.".format(project))
+    return projects
+
+
+def project_digest(project):
+    """ SHA-256 of the files in project zip. (independent of zip timestamps)
+
+    :type project: Project
+    :rtype: str
+    """
+    return entries_digest(render_entries(project))
+
+
+def build_module(module_ref, out_dir):
+    """ Build zips of all projects in module. (run in worker process)
+
+    :return: BuiltProject list.
+    :rtype: list
+    """
+    projects = load_projects(load_module(module_ref))
+    results = BatchPackager(out_dir, processes=1, overwrite=True).package(projects)
+    return [BuiltProject(module_ref, project.name, project.description, dict(project.schedules),
+                         result.path, result.digest, result.seconds)
+            for project, result in zip(projects, results)]
+
+
+def _build_task(args):
+    module_ref, out_dir = args
+    try:
+        return module_ref, build_module(module_ref, out_dir), None
+    except Exception:
+        return module_ref, [], traceback.format_exc()
+
+
+class DeployPipeline(object):
+    """ Build and upload project definition modules to one Azkaban Web Server.
+    """
+
+    def __init__(self, api, out_dir='.azusa', state_path=None, build_workers=None, upload_workers=4,
+                 force=False, schedule=False, prune_schedules=False):
+        """
+        :param api: Logged-in AjaxAPI.
+        :type api: AzkabanWeb.AjaxAPI
+        :param out_dir: Directory for built zips.
+        :type out_dir: str
+        :param state_path: JSON file remembering deployed hashes. (default: <out_dir>/deploy-state.json)
+        :type state_path: str
+        :param build_workers: Build processes. (default: CPU count)
+        :type build_workers: int
+        :param upload_workers: Concurrent uploads.
+        :type upload_workers: int
+        :param force: Upload even if hash is unchanged.
+        :type force: bool
+        :param schedule: Create and update Project.schedules after upload.
+        :type schedule: bool
+        :param prune_schedules: Also remove schedules of flows not in Project.schedules.
+        :type prune_schedules: bool
+        """
+        self.api = api
+        self.out_dir = out_dir
+        self.state_path = state_path or os.path.join(out_dir, 'deploy-state.json')
+        self.build_workers = build_workers or multiprocessing.cpu_count()
+        self.upload_workers = upload_workers
+        self.force = force
+        self.schedule = schedule
+        self.prune_schedules = prune_schedules
+        self.__lock = threading.Lock()
+
+    def load_state(self):
+        """ project name -> deployed hash, for this host.
+
+        :rtype: dict
+        """
+        if not os.path.exists(self.state_path):
+            return {}
+        with open(self.state_path) as f:
+            return json.load(f).get(self.api.base_url, {})
+
+    def save_state(self, deployed):
+        """
+        :param deployed: project name -> deployed hash, for this host.
+        :type deployed: dict
+        """
+        state = {}
+        if os.path.exists(self.state_path):
+            with open(self.state_path) as f:
+                state = json.load(f)
+        state[self.api.base_url] = deployed
+        tmp_path = "{0}.tmp".format(self.state_path)
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f, indent=2, sort_keys=True)
+        os.rename(tmp_path, self.state_path)
+
+    def run(self, module_refs):
+        """ Build all modules and upload changed projects.
+
+        :param module_refs: Definition module paths or names.
+        :type module_refs: list
+        :return: DeployResult list. timings has 'build', 'upload' and 'schedule' seconds.
+        :rtype: list
+        """
+        if not os.path.exists(self.out_dir):
+            os.makedirs(self.out_dir)
+        deployed = self.load_state()
+        current_schedules = []
+        if self.schedule:
+            current_schedules = self.api.fetch_schedules()
+        results = []
+        uploads = ThreadPool(self.upload_workers)
+        builds = multiprocessing.Pool(min(self.build_workers, max(len(module_refs), 1)))
+        try:
+            pending = []
+            tasks = [(module_ref, self.out_dir) for module_ref in module_refs]
+            for module_ref, built_projects, error in builds.imap_unordered(_build_task, tasks):
+                if error is not None:
+                    self.api.logger.error("Cannot build %s\n%s", module_ref, error)
+                    results.append(DeployResult(module_ref, None, None, False, error, {}))
+                    continue
+                for built in built_projects:
+                    self.api.logger.info("Built %s (%.3fs)", built.name, built.build_seconds)
+                    pending.append(uploads.apply_async(self.__deploy, (built, deployed, current_schedules)))
+            for async_result in pending:
+                results.append(async_result.get())
+        finally:
+            builds.close()
+            builds.join()
+            uploads.close()
+            uploads.join()
+            self.save_state(deployed)
+        return results
+
+    def __deploy(self, built, deployed, current_schedules):
+        """ Upload and schedule one built project. (run in upload thread)
+
+        :rtype: DeployResult
+        """
+        timings = {'build': built.build_seconds}
+        skipped = False
+        try:
+            with self.__lock:
+                unchanged = deployed.get(built.name) == built.digest
+            project_ids = {}
+            if unchanged and not self.force:
+                self.api.logger.info("Skip uploading %s: unchanged (%s)", built.name, built.digest[:12])
+                skipped = True
+            else:
+                start = time.time()
+                self.api.create_project(built.name, built.description, if_not_exists=True)
+                project_ids[built.name] = self.api.upload_project(built.name, built.zip_path)['projectId']
+                timings['upload'] = time.time() - start
+                with self.__lock:
+                    deployed[built.name] = built.digest
+            if self.schedule:
+                start = time.time()
+                reconciler = ScheduleReconciler(self.api)
+                changes = reconciler.plan([built], current=current_schedules, prune=self.prune_schedules)
+                for change, result in reconciler.apply(changes, project_ids=project_ids):
+                    if isinstance(result, Exception):
+                        raise result
+                timings['schedule'] = time.time() - start
+            return DeployResult(built.module, built.name, built.digest, skipped, None, timings)
+        except Exception as e:
+            self.api.logger.error("Cannot deploy %s: %r", built.name, e)
+            return DeployResult(built.module, built.name, built.digest, skipped, e, timings)
+
+
+def format_report(results, total_seconds=None):
+    """ Per-project stage timings table.
+
+    :param results: DeployResult list.
+    :type results: list
+    :param total_seconds: Wall-clock seconds of the whole pipeline.
+    :type total_seconds: float
+    :rtype: str
+    """
+    lines = ["{0:<40} {1:<8} {2:>9} {3:>9} {4:>9}".format('project', 'result', 'build[s]', 'upload[s]', 'sched[s]')]
+    totals = collections.Counter()
+    for r in results:
+        status = 'error' if r.error is not None else ('skipped' if r.skipped else 'deployed')
+        cells = []
+        for stage in ('build', 'upload', 'schedule'):
+            if stage in r.timings:
+                totals[stage] += r.timings[stage]
+                cells.append("{0:>9.3f}".format(r.timings[stage]))
+            else:
+                cells.append("{0:>9}".format('-'))
+        lines.append("{0:<40} {1:<8} {2}".format(r.project or r.module, status, ' '.join(cells)))
+    lines.append("{0:<40} {1:<8} {2:>9.3f} {3:>9.3f} {4:>9.3f}".format(
+        'total (sum)', '', totals['build'], totals['upload'], totals['schedule']))
+    if total_seconds is not None:
+        lines.append("wall clock: {0:.3f}s".format(total_seconds))
+    return '\n'.join(lines)
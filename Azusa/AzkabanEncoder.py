@@ -0,0 +1,250 @@
+#!/usr/local/bin/python2.7
+"""
+    Encoder / decoder of .job and .properties files.
+
+    Azkaban loads these files with java.util.Properties, so the text follows its
+    escaping rules (backslash escapes for '\\', '=', ':', '#', '!', tab, newlines,
+    form feed, spaces in keys and a leading space in values, and \\uXXXX for
+    non-ASCII characters). Keys are written in sorted order, one per line.
+
+    decode(encode(params)) gives back every value as the string Azkaban sees.
+
+    :copyright: 2015, Tasuku OKUDA.
+"""
+
+import collections
+import re
+import sys
+
+_ESCAPES = {
+    u'\\': u'\\\\', u'=': u'\\=', u':': u'\\:', u'#': u'\\#', u'!': u'\\!',
+    u'\t': u'\\t', u'\n': u'\\n', u'\r': u'\\r', u'\f': u'\\f',
+}
+_UNESCAPES = {u't': u'\t', u'n': u'\n', u'r': u'\r', u'f': u'\f'}
+_LINE_BREAK = re.compile(u'\r\n|\r|\n')
+
+_KEY_SPECIAL = re.compile(r'[\\=:#!\t\n\r\f ]|[^\x20-\x7e]')
+_VALUE_SPECIAL = re.compile(r'^ |[\\=:#!\t\n\r\f]|[^\x20-\x7e]')
+_UNICODE_KEY_SPECIAL = re.compile(u'[\\\\=:#!\\t\\n\\r\\f ]|[^\\x20-\\x7e]')
+_UNICODE_VALUE_SPECIAL = re.compile(u'^ |[\\\\=:#!\\t\\n\\r\\f]|[^\\x20-\\x7e]')
+
+
+def _escape_unicode(text, key):
+    """ Escape text character by character. (slow path)
+
+    :type text: unicode
+    :type key: bool
+    :rtype: str
+    """
+    out = []
+    for i, char in enumerate(text):
+        if char == u' ':
+            out.append(u'\\ ' if key or i == 0 else u' ')
+        elif char in _ESCAPES:
+            out.append(_ESCAPES[char])
+        elif u'\x20' < char < u'\x7f':
+            out.append(char)
+        else:
+            code = ord(char)
+            if code > 0xffff:
+                code -= 0x10000
+                out.append(u'\\u{0:04X}\\u{1:04X}'.format(0xd800 + (code >> 10), 0xdc00 + (code & 0x3ff)))
+            else:
+                out.append(u'\\u{0:04X}'.format(code))
+    return str(u''.join(out))
+
+
+def escape(text, key=False):
+    """ Escape key or value text for java.util.Properties.
+
+    :param text: text. (str is read as UTF-8)
+    :type text: str or unicode
+    :param key: True for a key, which escapes all spaces.
+    :type key: bool
+    :rtype: str
+    """
+    if isinstance(text, str):
+        if (_KEY_SPECIAL if key else _VALUE_SPECIAL).search(text) is None:
+            return text
+        return _escape_unicode(text.decode('utf-8'), key)
+    if (_UNICODE_KEY_SPECIAL if key else _UNICODE_VALUE_SPECIAL).search(text) is None:
+        return str(text)
+    return _escape_unicode(text, key)
+
+
+def format_value(value):
+    """ Convert python value to the (unescaped) property string.
+
+    :param value: str, unicode, int, long, float, bool, list/tuple of them, or dict (its keys)
+    :return: str or unicode
+    :raises TypeError: Unsupported type.
+    """
+    if isinstance(value, basestring):
+        return value
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, (int, long)):
+        return str(value)
+    if isinstance(value, float):
+        return repr(value)
+    if isinstance(value, (list, tuple)):
+        return ','.join([format_value(x) for x in value])
+    if isinstance(value, collections.Mapping):
+        return ','.join(value.keys())
+    raise TypeError("Not support {0} type yet".format(type(value)))
+
+
+class PropertiesEncoder(object):
+    """ Encoder with a cache of escaped keys, shared by all rendered files.
+    """
+
+    def __init__(self):
+        self.__keys = {}
+
+    def lines(self, params):
+        """ key=value lines of params in sorted key order.
+
+        :type params: dict or collections.Mapping
+        :rtype: list
+        """
+        keys = self.__keys
+        needs_escape = _VALUE_SPECIAL.search
+        lines = []
+        items = params.items()
+        items.sort()
+        for key, value in items:
+            escaped_key = keys.get(key)
+            if escaped_key is None:
+                escaped_key = keys[key] = escape(key, key=True)
+            value_type = type(value)
+            if value_type is list:
+                try:
+                    value = ','.join(value)
+                    value_type = type(value)
+                except TypeError:
+                    pass
+            if value_type is str and needs_escape(value) is None:
+                lines.append(escaped_key + '=' + value)
+            else:
+                lines.append(escaped_key + '=' + escape(format_value(value)))
+        return lines
+
+    def encode(self, params):
+        """
+        :type params: dict or collections.Mapping
+        :rtype: str
+        """
+        return '\n'.join(self.lines(params))
+
+    def render_all(self, files):
+        """ Render many files sharing this encoder's key cache.
+
+        :param files: objects with params, such as Command, Flow, Properties.
+        :type files: list
+        :return: texts in the same order.
+        :rtype: list
+        """
+        lines = self.lines
+        return ['\n'.join(lines(azkaban_file.params)) for azkaban_file in files]
+
+
+_DEFAULT_ENCODER = PropertiesEncoder()
+
+
+def encode(params):
+    """ Encode params to .job / .properties text.
+
+    :type params: dict or collections.Mapping
+    :rtype: str
+    """
+    return _DEFAULT_ENCODER.encode(params)
+
+
+def render_all(files):
+    """ Render texts of many files. (see PropertiesEncoder.render_all)
+
+    :rtype: list
+    """
+    return PropertiesEncoder().render_all(files)
+
+
+def _logical_lines(text):
+    """ Join continuation lines, skip blank and comment lines. (java.util.Properties.load)
+    """
+    pending = None
+    for line in _LINE_BREAK.split(text):
+        stripped = line.lstrip(u' \t\f')
+        if pending is None and (not stripped or stripped[0] in u'#!'):
+            continue
+        backslashes = len(stripped) - len(stripped.rstrip(u'\\'))
+        if backslashes % 2 == 1:
+            pending = (pending or u'') + stripped[:-1]
+            continue
+        yield (pending or u'') + stripped
+        pending = None
+    if pending is not None:
+        yield pending
+
+
+def _join_surrogates(chars):
+    """ Join UTF-16 surrogate pairs written as two \\uXXXX escapes. (for wide unicode builds)
+    """
+    out = []
+    for char in chars:
+        if out and u'\udc00' <= char <= u'\udfff' and u'\ud800' <= out[-1] <= u'\udbff' and sys.maxunicode > 0xffff:
+            code = 0x10000 + ((ord(out[-1]) - 0xd800) << 10) + (ord(char) - 0xdc00)
+            out[-1] = unichr(code)
+        else:
+            out.append(char)
+    return u''.join(out)
+
+
+def _unescape(text):
+    out = []
+    i = 0
+    while i < len(text):
+        char = text[i]
+        if char != u'\\' or i + 1 == len(text):
+            out.append(char)
+            i += 1
+            continue
+        char = text[i + 1]
+        if char == u'u':
+            out.append(unichr(int(text[i + 2:i + 6], 16)))
+            i += 6
+        else:
+            out.append(_UNESCAPES.get(char, char))
+            i += 2
+    return _join_surrogates(out)
+
+
+def decode(text):
+    """ Parse .job / .properties text like java.util.Properties.load.
+
+    :param text: file content. (str is read as ISO-8859-1 like Java)
+    :type text: str or unicode
+    :return: key -> value
+    :rtype: collections.OrderedDict
+    """
+    if isinstance(text, str):
+        text = text.decode('latin-1')
+    params = collections.OrderedDict()
+    for line in _logical_lines(text):
+        i = 0
+        while i < len(line):
+            char = line[i]
+            if char == u'\\':
+                i += 2
+                continue
+            if char in u'=: \t\f':
+                break
+            i += 1
+        key = line[:i]
+        if line[i:i + 1] in (u'=', u':'):
+            rest = line[i + 1:].lstrip(u' \t\f')
+        else:
+            rest = line[i:].lstrip(u' \t\f')
+            if rest[:1] in (u'=', u':'):
+                rest = rest[1:].lstrip(u' \t\f')
+        params[_unescape(key)] = _unescape(rest)
+    return params
@@ -0,0 +1,430 @@
+#!/usr/local/bin/python2.7
+"""
+    In-process fake of Azkaban Web Server for integration and load testing.
+
+    It implements the endpoints which AjaxAPI uses (login, manager, schedule, executor and
+    index?all) with in-memory state, and can inject latency and errors.
+
+        with FakeAzkabanServer(latency=0.01, error_rate=0.05) as server:
+            api = AjaxAPI(server.url, 'azkaban', 'azkaban')
+
+    :copyright: 2015, Tasuku OKUDA.
+"""
+
+import BaseHTTPServer
+import Cookie
+import SocketServer
+import calendar
+import cgi
+import collections
+import io
+import json
+import random
+import re
+import threading
+import time
+import urlparse
+import uuid
+import zipfile
+from datetime import datetime, timedelta
+
+from AzkabanEncoder import decode
+
+
+class FakeAzkabanServer(object):
+    """ Fake Azkaban Web Server running on a background thread.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, users=None, latency=0.0, error_rate=0.0,
+                 execution_time=0.0, execution_failure_rate=0.0, seed=None):
+        """
+        :param host: Listen address.
+        :type host: str
+        :param port: Listen port. (0: any free port)
+        :type port: int
+        :param users: Accepted username-password pairs. (None: accept any user)
+        :type users: dict
+        :param latency: Seconds to wait before each response, or (min, max) seconds.
+        :type latency: float or tuple
+        :param error_rate: Probability to answer a request with HTTP 500.
+        :type error_rate: float
+        :param execution_time: Seconds which an executed flow keeps RUNNING.
+        :type execution_time: float
+        :param execution_failure_rate: Probability that an executed flow ends with FAILED.
+        :type execution_failure_rate: float
+        :param seed: Random seed for latency and errors.
+        :type seed: int
+        """
+        self.users = users
+        self.latency = latency
+        self.error_rate = error_rate
+        self.execution_time = execution_time
+        self.execution_failure_rate = execution_failure_rate
+        self.random = random.Random(seed)
+        self.lock = threading.RLock()
+        self.sessions = set()
+        self.projects = collections.OrderedDict()
+        self.schedules = collections.OrderedDict()
+        self.__schedule_seq = 0
+        self.executions = collections.OrderedDict()
+        self.request_count = collections.Counter()
+        self.__server = _ThreadingHTTPServer((host, port), _Handler)
+        self.__server.fake = self
+        self.__thread = None
+
+    @property
+    def url(self):
+        """ Base URL to pass to AjaxAPI.
+
+        :rtype: str
+        """
+        host, port = self.__server.server_address[:2]
+        return "http://{0}:{1}/".format(host, port)
+
+    def start(self):
+        """ Start serving on a daemon thread.
+
+        :return: self
+        """
+        self.__thread = threading.Thread(target=self.__server.serve_forever, name='FakeAzkabanServer')
+        self.__thread.daemon = True
+        self.__thread.start()
+        return self
+
+    def stop(self):
+        """ Stop serving and close the socket.
+        """
+        if self.__thread is not None:
+            self.__server.shutdown()
+            self.__thread.join()
+            self.__thread = None
+        self.__server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def login(self, username, password):
+        """
+        :rtype: dict
+        """
+        if self.users is not None and self.users.get(username) != password:
+            return {'error': "Incorrect Login. Username/Password not found."}
+        session_id = str(uuid.uuid4())
+        with self.lock:
+            self.sessions.add(session_id)
+        return {'status': 'success', 'session.id': session_id}
+
+    def create_project(self, name, description):
+        """
+        :rtype: dict
+        """
+        with self.lock:
+            if name in self.projects:
+                return {'status': 'error', 'message': "Active project with name {0} already exists in db.".format(name)}
+            self.projects[name] = {'id': len(self.projects) + 1, 'name': name, 'description': description,
+                                   'version': 0, 'flows': collections.OrderedDict(), 'lastModified': time.time()}
+        return {'status': 'success', 'path': "manager?project={0}".format(name), 'action': 'redirect'}
+
+    def upload_project(self, name, zip_bytes):
+        """
+        :rtype: dict
+        """
+        try:
+            flows = self.load_flows(zip_bytes)
+        except (zipfile.BadZipfile, ValueError) as e:
+            return {'error': "Installation Failed. {0}".format(e)}
+        with self.lock:
+            if name not in self.projects:
+                return {'error': "Installation Failed. Project '{0}' doesn't exist.".format(name)}
+            project = self.projects[name]
+            project['version'] += 1
+            project['flows'] = flows
+            project['lastModified'] = time.time()
+            return {'status': 'success', 'projectId': project['id'], 'version': project['version']}
+
+    @staticmethod
+    def load_flows(zip_bytes):
+        """ Load flows from project zip like Azkaban. (a flow is a job which no job depends on)
+
+        :param zip_bytes: Project zip content.
+        :type zip_bytes: str
+        :return: flow name to the list of graph nodes.
+        :rtype: collections.OrderedDict
+        """
+        jobs = collections.OrderedDict()
+        with zipfile.ZipFile(io.BytesIO(zip_bytes)) as project_zip:
+            for path in sorted(project_zip.namelist()):
+                if not path.endswith('.job'):
+                    continue
+                params = decode(project_zip.read(path))
+                name = path.rsplit('/', 1)[-1][:-len('.job')]
+                dependencies = [x.strip() for x in params.get('dependencies', '').split(',') if x.strip()]
+                jobs[name] = {'id': name, 'type': params.get('type', 'command'), 'in': dependencies}
+        if not jobs:
+            raise ValueError("No job files in zip.")
+        depended = set(dep for job in jobs.values() for dep in job['in'])
+        flows = collections.OrderedDict()
+        for name in jobs:
+            if name in depended:
+                continue
+            nodes, stack, seen = [], [name], set([name])
+            while stack:
+                job = jobs.get(stack.pop())
+                if job is None:
+                    continue
+                nodes.append(dict((k, v) for k, v in job.items() if k != 'in' or v))
+                for dep in job['in']:
+                    if dep not in seen:
+                        seen.add(dep)
+                        stack.append(dep)
+            flows[name] = nodes
+        return flows
+
+    def schedule_flow(self, project_name, project_id, flow_name, schedule_time, schedule_date, period):
+        """
+        :rtype: dict
+        """
+        with self.lock:
+            project = self.projects.get(project_name)
+            if project is None or str(project['id']) != str(project_id):
+                return {'error': "Project {0} does not exist.".format(project_name)}
+            if flow_name not in project['flows']:
+                return {'error': "Flow {0} cannot be found in project {1}.".format(flow_name, project_name)}
+            try:
+                first_time, period_millis = self.__parse_schedule(schedule_time, schedule_date, period)
+            except ValueError as e:
+                return {'error': str(e)}
+            key = (project_name, flow_name)
+            if key in self.schedules:
+                schedule_id = self.schedules[key]['scheduleid']
+            else:
+                self.__schedule_seq += 1
+                schedule_id = self.__schedule_seq
+            self.schedules[key] = {'scheduleid': schedule_id, 'projectname': project_name, 'flowname': flow_name,
+                                   'time': first_time, 'period': period_millis, 'history': False}
+        return {'status': 'success', 'message': "{0}.{1} scheduled.".format(project_name, flow_name)}
+
+    TIMEZONES = {'UTC': 0, 'GMT': 0, 'JST': 9 * 3600}
+    PERIODS = {'M': timedelta(days=30), 'w': timedelta(weeks=1), 'd': timedelta(days=1),
+               'h': timedelta(hours=1), 'm': timedelta(minutes=1), 's': timedelta(seconds=1)}
+
+    @classmethod
+    def __parse_schedule(cls, schedule_time, schedule_date, period):
+        """ Parse scheduleFlow parameters to (first time millis, period millis) like loadFlow response.
+        """
+        hour, minute, ampm, zone = (schedule_time or '').split(',')
+        local = datetime.strptime("{0} {1}:{2} {3}".format(schedule_date, hour, minute, ampm), '%m/%d/%Y %I:%M %p')
+        if zone not in cls.TIMEZONES:
+            raise ValueError("Unknown timezone {0}".format(zone))
+        first_time = (calendar.timegm(local.timetuple()) - cls.TIMEZONES[zone]) * 1000
+        if not period:
+            return first_time, 0
+        match = re.match(r'^(\d+)([Mwdhms])$', period)
+        if match is None:
+            raise ValueError("Invalid period {0}".format(period))
+        delta = cls.PERIODS[match.group(2)] * int(match.group(1))
+        return first_time, int(delta.total_seconds() * 1000)
+
+    def remove_schedule(self, schedule_id):
+        """
+        :rtype: dict
+        """
+        with self.lock:
+            for key, schedule in self.schedules.items():
+                if str(schedule['scheduleid']) == str(schedule_id):
+                    del self.schedules[key]
+                    return {'status': 'success', 'message': "Schedule {0} removed.".format(schedule_id)}
+        return {'error': "Schedule with ID {0} does not exist".format(schedule_id)}
+
+    def execute_flow(self, project_name, flow_name):
+        """
+        :rtype: dict
+        """
+        with self.lock:
+            project = self.projects.get(project_name)
+            if project is None or flow_name not in project['flows']:
+                return {'error': "Flow {0} cannot be found in project {1}.".format(flow_name, project_name)}
+            exec_id = len(self.executions) + 1
+            start = time.time()
+            self.executions[exec_id] = {
+                'execid': exec_id, 'project': project_name, 'projectId': project['id'], 'flow': flow_name,
+                'startTime': int(start * 1000), 'endTime': int((start + self.execution_time) * 1000),
+                'failed': self.random.random() < self.execution_failure_rate, 'killed': False,
+                'nodes': [node['id'] for node in project['flows'][flow_name]]}
+        return {'project': project_name, 'flow': flow_name, 'execid': exec_id}
+
+    def cancel_flow(self, exec_id):
+        """
+        :rtype: dict
+        """
+        with self.lock:
+            execution = self.executions.get(exec_id)
+            if execution is None or self.__status(execution) != 'RUNNING':
+                return {'error': "Execution {0} is not running.".format(exec_id)}
+            execution['killed'] = True
+            execution['endTime'] = int(time.time() * 1000)
+        return {}
+
+    def fetch_execution(self, exec_id):
+        """
+        :rtype: dict
+        """
+        with self.lock:
+            execution = self.executions.get(exec_id)
+            if execution is None:
+                return {'error': "Cannot find execution '{0}'".format(exec_id)}
+            status = self.__status(execution)
+            end_time = execution['endTime'] if status != 'RUNNING' else -1
+            return {'execid': exec_id, 'project': execution['project'], 'projectId': execution['projectId'],
+                    'flow': execution['flow'], 'flowId': execution['flow'], 'status': status,
+                    'startTime': execution['startTime'], 'endTime': end_time,
+                    'nodes': [{'id': node, 'status': status, 'startTime': execution['startTime'], 'endTime': end_time}
+                              for node in execution['nodes']]}
+
+    def fetch_flow_executions(self, project_name, flow_name, start, length):
+        """
+        :rtype: dict
+        """
+        with self.lock:
+            project = self.projects.get(project_name)
+            if project is None:
+                return {'error': "Project {0} does not exist.".format(project_name)}
+            executions = [e for e in reversed(self.executions.values())
+                          if e['project'] == project_name and e['flow'] == flow_name]
+            page = [{'execId': e['execid'], 'projectId': e['projectId'], 'flowId': flow_name,
+                     'startTime': e['startTime'],
+                     'endTime': e['endTime'] if self.__status(e) != 'RUNNING' else -1,
+                     'status': self.__status(e), 'submitUser': 'azkaban'}
+                    for e in executions[start:start + length]]
+        return {'project': project_name, 'projectId': project['id'], 'flow': flow_name,
+                'from': start, 'length': length, 'total': len(executions), 'executions': page}
+
+    @staticmethod
+    def __status(execution):
+        if execution['killed']:
+            return 'KILLED'
+        if time.time() * 1000 < execution['endTime']:
+            return 'RUNNING'
+        return 'FAILED' if execution['failed'] else 'SUCCEEDED'
+
+    def index_html(self):
+        """ Project list page like /index?all.
+
+        :rtype: str
+        """
+        with self.lock:
+            items = ''.join(
+                '<li><div class="project-info"><h4><a href="manager?project={0}">{0}</a></h4>'
+                '<p class="project-description">{1}</p>'
+                '<p class="project-last-modified">Last modified on <strong>{2}</strong> by <strong>azkaban</strong>.</p>'
+                '</div></li>'.format(
+                    cgi.escape(name), cgi.escape(project['description'] or ''),
+                    time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(project['lastModified'])))
+                for name, project in self.projects.items())
+        return '<html><body><ul id="project-list">{0}</ul></body></html>'.format(items)
+
+    def dispatch(self, method, path, params, cookies):
+        """ Route one request.
+
+        :return: (HTTP status, content type, body)
+        :rtype: tuple
+        """
+        endpoint = path.strip('/').split('/')[0]
+        action = params.get('ajax') or params.get('action')
+        with self.lock:
+            self.request_count[(endpoint, action)] += 1
+        if isinstance(self.latency, tuple):
+            time.sleep(self.random.uniform(*self.latency))
+        elif self.latency:
+            time.sleep(self.latency)
+        if self.error_rate and self.random.random() < self.error_rate:
+            return 500, 'text/plain', 'Injected error'
+        if endpoint == '' and action == 'login':
+            return self.__json(self.login(params.get('username'), params.get('password')))
+        if endpoint == 'index':
+            if cookies.get('azkaban.browser.session.id') not in self.sessions:
+                return 200, 'text/html', '<html><body>Login</body></html>'
+            return 200, 'text/html', self.index_html()
+        if params.get('session.id') not in self.sessions:
+            return self.__json({'error': 'session'})
+        if endpoint == 'manager' and action == 'create':
+            return self.__json(self.create_project(params.get('name'), params.get('description')))
+        if endpoint == 'manager' and action == 'upload':
+            return self.__json(self.upload_project(params.get('project'), params.get('file') or ''))
+        if endpoint == 'manager' and action == 'fetchprojectflows':
+            with self.lock:
+                project = self.projects.get(params.get('project'))
+                if project is None:
+                    return self.__json({'error': "Project {0} doesn't exist.".format(params.get('project'))})
+                return self.__json({'project': project['name'], 'projectId': project['id'],
+                                    'flows': [{'flowId': flow} for flow in project['flows']]})
+        if endpoint == 'manager' and action == 'fetchflowgraph':
+            with self.lock:
+                project = self.projects.get(params.get('project'))
+                if project is None or params.get('flow') not in project['flows']:
+                    return self.__json({'error': "Flow {0} not found.".format(params.get('flow'))})
+                return self.__json({'project': project['name'], 'projectId': project['id'],
+                                    'flow': params['flow'], 'nodes': project['flows'][params['flow']]})
+        if endpoint == 'manager' and action == 'fetchFlowExecutions':
+            return self.__json(self.fetch_flow_executions(params.get('project'), params.get('flow'),
+                                                          int(params.get('start', 0)), int(params.get('length', 25))))
+        if endpoint == 'schedule' and action == 'scheduleFlow':
+            period = params.get('period') if params.get('is_recurring') == 'on' else None
+            return self.__json(self.schedule_flow(params.get('projectName'), params.get('projectId'),
+                                                  params.get('flow'), params.get('scheduleTime'),
+                                                  params.get('scheduleDate'), period))
+        if endpoint == 'schedule' and action == 'loadFlow':
+            with self.lock:
+                return self.__json({'items': self.schedules.values()})
+        if endpoint == 'schedule' and action == 'removeSched':
+            return self.__json(self.remove_schedule(params.get('scheduleId')))
+        if endpoint == 'executor' and action == 'executeFlow':
+            return self.__json(self.execute_flow(params.get('project'), params.get('flow')))
+        if endpoint == 'executor' and action == 'fetchexecflow':
+            return self.__json(self.fetch_execution(int(params.get('execid', 0))))
+        if endpoint == 'executor' and action == 'cancelFlow':
+            return self.__json(self.cancel_flow(int(params.get('execid', 0))))
+        return 404, 'text/plain', "Unknown endpoint {0} {1}".format(method, path)
+
+    @staticmethod
+    def __json(body):
+        return 200, 'application/json', json.dumps(body)
+
+
+class _ThreadingHTTPServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    request_queue_size = 4096
+
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        url = urlparse.urlparse(self.path)
+        self.__reply(url.path, dict(urlparse.parse_qsl(url.query, keep_blank_values=True)))
+
+    def do_POST(self):
+        url = urlparse.urlparse(self.path)
+        form = cgi.FieldStorage(fp=self.rfile, headers=self.headers,
+                                environ={'REQUEST_METHOD': 'POST',
+                                         'CONTENT_TYPE': self.headers.getheader('content-type', '')})
+        params = dict(urlparse.parse_qsl(url.query, keep_blank_values=True))
+        for key in form.keys():
+            params[key] = form.getfirst(key)
+        self.__reply(url.path, params)
+
+    def __reply(self, path, params):
+        cookies = Cookie.SimpleCookie(self.headers.getheader('cookie', ''))
+        status, content_type, body = self.server.fake.dispatch(
+            self.command, path, params, dict((k, v.value) for k, v in cookies.items()))
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
@@ -0,0 +1,193 @@
+#!/usr/local/bin/python2.7
+"""
+    Multi-host client which deploys one Project to many Azkaban Web Servers.
+
+        fleet = Fleet(['https://staging:8443/', 'https://prod-jp:8443/'], username, password)
+        result = fleet.deploy(project, schedules=[('flowA', datetime(2015, 5, 30, 10), '1d')])
+        result.raise_for_failures()
+
+    :copyright: 2015, Tasuku OKUDA.
+"""
+
+import collections
+import shutil
+import tempfile
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+
+from AzkabanWeb import AjaxAPI
+
+
+HostResult = collections.namedtuple('HostResult', ['host', 'value', 'error', 'seconds'])
+
+
+class FleetResult(collections.Mapping):
+    """ Per-host results of one Fleet operation. (host -> HostResult)
+    """
+
+    def __init__(self, results):
+        """
+        :param results: host results in the order of Fleet.hosts.
+        :type results: list
+        """
+        self.__results = collections.OrderedDict((r.host, r) for r in results)
+
+    def __len__(self):
+        return len(self.__results)
+
+    def __iter__(self):
+        return iter(self.__results)
+
+    def __getitem__(self, host):
+        return self.__results[host]
+
+    @property
+    def succeeded(self):
+        """ Hosts which finished without error.
+
+        :rtype: list
+        """
+        return [host for host, r in self.__results.items() if r.error is None]
+
+    @property
+    def failed(self):
+        """ Hosts which raised an error.
+
+        :rtype: list
+        """
+        return [host for host, r in self.__results.items() if r.error is not None]
+
+    def raise_for_failures(self):
+        """
+        :raises Fleet.FleetError: Any host failed.
+        """
+        if self.failed:
+            raise Fleet.FleetError(
+                "Failed on {0}/{1} hosts: {2}".format(
+                    len(self.failed), len(self), ', '.join(
+                        "{0} ({1!r})".format(host, self[host].error) for host in self.failed)),
+                self)
+
+
+class Fleet(object):
+    """ AjaxAPI for many Azkaban Web Servers, called concurrently.
+    """
+
+    def __init__(self, hosts, username, password, max_workers=8, log_level="INFO", instrument=None, credentials=None):
+        """
+        :param hosts: Azkaban API base URLs.
+        :type hosts: list
+        :param username: Azkaban login username
+        :type username: str
+        :param password: Azkaban login password
+        :type password: str
+        :param max_workers: Maximum number of hosts processed at the same time.
+        :type max_workers: int
+        :param log_level: Log level to output stdout
+        :type log_level: str
+        :param instrument: Hooks shared by all hosts' AjaxAPI.
+        :type instrument: AzkabanMetrics.Instrument
+        :param credentials: Per-host (username, password) overriding the common one.
+        :type credentials: dict
+        """
+        self.__hosts = list(hosts)
+        self.__username = username
+        self.__password = password
+        self.__max_workers = max_workers
+        self.__log_level = log_level
+        self.__instrument = instrument
+        self.__credentials = credentials or {}
+        self.__apis = {}
+        self.__lock = threading.Lock()
+
+    @property
+    def hosts(self):
+        """
+        :rtype: list
+        """
+        return list(self.__hosts)
+
+    def api(self, host):
+        """ Logged-in AjaxAPI of host. (login once and reused)
+
+        :param host: Azkaban API base URL.
+        :type host: str
+        :rtype: AjaxAPI
+        """
+        with self.__lock:
+            api = self.__apis.get(host)
+        if api is None:
+            username, password = self.__credentials.get(host, (self.__username, self.__password))
+            api = AjaxAPI(host, username, password, log_level=self.__log_level, instrument=self.__instrument)
+            with self.__lock:
+                api = self.__apis.setdefault(host, api)
+        return api
+
+    def map(self, func, hosts=None):
+        """ Call func(api) for every host concurrently.
+
+        An exception of one host does not stop the others, it is kept in HostResult.error.
+
+        :param func: function taking AjaxAPI.
+        :type func: callable
+        :param hosts: Target hosts. (default: all hosts)
+        :type hosts: list
+        :rtype: FleetResult
+        """
+        hosts = self.__hosts if hosts is None else list(hosts)
+
+        def run(host):
+            start = time.time()
+            try:
+                return HostResult(host, func(self.api(host)), None, time.time() - start)
+            except Exception as e:
+                return HostResult(host, None, e, time.time() - start)
+
+        if not hosts:
+            return FleetResult([])
+        pool = ThreadPool(min(self.__max_workers, len(hosts)))
+        try:
+            return FleetResult(pool.map(run, hosts))
+        finally:
+            pool.close()
+            pool.join()
+
+    def deploy(self, project, schedules=None, out_dir=None):
+        """ Build project zip once, then create, upload and schedule it on every host.
+
+        :param project: Project to deploy.
+        :type project: AzkabanJob.Project
+        :param schedules: (flow name, start datetime, recurring period or None) list.
+        :type schedules: list
+        :param out_dir: Directory to keep the zip file. (default: temporary directory, removed afterwards)
+        :type out_dir: str
+        :return: HostResult.value is dict of 'create', 'upload' and 'schedule' (list) responses.
+        :rtype: FleetResult
+        """
+        tmp_dir = None
+        if out_dir is None:
+            out_dir = tmp_dir = tempfile.mkdtemp(prefix='azusa_')
+        try:
+            zip_path = project.create_zipfile(out_dir, overwrite=True, instrument=self.__instrument)
+
+            def deploy_host(api):
+                responses = {
+                    'create': api.create_project(project.name, project.description, if_not_exists=True),
+                    'upload': api.upload_project(project.name, zip_path),
+                    'schedule': [],
+                }
+                for flow_name, start_datetime, recurring_period in schedules or []:
+                    responses['schedule'].append(
+                        api.schedule_flow(project.name, flow_name, start_datetime, recurring_period=recurring_period))
+                return responses
+
+            return self.map(deploy_host)
+        finally:
+            if tmp_dir is not None:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    class FleetError(Exception):
+        """ Exception when some hosts failed. (args[1] is the FleetResult)
+        """
+        pass
@@ -0,0 +1,333 @@
+#!/usr/local/bin/python2.7
+"""
+    Columnar execution history analytics. (requires numpy)
+
+    Execution history is fetched concurrently, page by page, into an ExecutionTable.
+    The table keeps one NumPy array per column instead of a dict per execution, and
+    its helpers (percentiles, failure rates, slowest ranking) are computed per key
+    with sorting and cumulative sums, without a Python loop over executions.
+
+        fetcher = HistoryFetcher(api)
+        flows = fetcher.fetch_flows([('etl', 'daily'), ('etl', 'hourly')])
+        jobs = fetcher.fetch_jobs(flows)
+        for key, seconds, count in jobs.slowest(10, q=90):
+            print key, seconds, count
+
+    Pages are fetched at the same time, so executions started meanwhile may shift
+    pages. Duplicated executions are dropped, and the newest ones may be missed.
+
+    :copyright: 2015, Tasuku OKUDA.
+"""
+
+from multiprocessing.pool import ThreadPool
+
+import numpy as np
+
+
+STATUSES = ('READY', 'PREPARING', 'RUNNING', 'PAUSED', 'SUCCEEDED', 'KILLED', 'FAILED', 'FAILED_FINISHING',
+            'SKIPPED', 'DISABLED', 'QUEUED', 'FAILED_SUCCEEDED', 'CANCELLED', 'UNKNOWN')
+STATUS_CODES = dict((status, code) for code, status in enumerate(STATUSES))
+
+# Statuses of executions which ran to the end. Failure rates are computed over them.
+FINAL_STATUSES = ('SUCCEEDED', 'FAILED', 'KILLED')
+FAILURE_STATUSES = ('FAILED', 'KILLED')
+
+_UNKNOWN = STATUS_CODES['UNKNOWN']
+
+
+def _status_mask(status, statuses):
+    return np.in1d(status, [STATUS_CODES[s] for s in statuses])
+
+
+class ExecutionTable(object):
+    """ Executions in columns.
+
+    :keys: Labels indexed by the key column, such as (project, flow) or (project, flow, job).
+    :exec_id: Execution ids. (int64)
+    :key: Index of keys. (int32)
+    :start: Start times in epoch millis. (int64)
+    :end: End times in epoch millis. (int64, -1 if not finished)
+    :status: Index of STATUSES. (int8)
+    """
+
+    def __init__(self, keys, exec_id, key, start, end, status):
+        self.keys = list(keys)
+        self.exec_id = np.asarray(exec_id, dtype=np.int64)
+        self.key = np.asarray(key, dtype=np.int32)
+        self.start = np.asarray(start, dtype=np.int64)
+        self.end = np.asarray(end, dtype=np.int64)
+        self.status = np.asarray(status, dtype=np.int8)
+
+    @classmethod
+    def from_chunks(cls, keys, chunks):
+        """ Concatenate (exec_id, key, start, end, status) array tuples.
+
+        :type keys: list
+        :type chunks: list
+        :rtype: ExecutionTable
+        """
+        if not chunks:
+            return cls(keys, [], [], [], [], [])
+        return cls(keys, *[np.concatenate(column) for column in zip(*chunks)])
+
+    def __len__(self):
+        return len(self.exec_id)
+
+    def __repr__(self):
+        return "{0}({1} executions, {2} keys)".format(type(self).__name__, len(self), len(self.keys))
+
+    def select(self, mask):
+        """ Rows where mask is True. (keys are kept)
+
+        :param mask: bool array or indices.
+        :rtype: ExecutionTable
+        """
+        return ExecutionTable(self.keys, self.exec_id[mask], self.key[mask], self.start[mask], self.end[mask],
+                              self.status[mask])
+
+    def statuses(self):
+        """ Status names of rows.
+
+        :rtype: numpy.ndarray
+        """
+        return np.array(STATUSES, dtype=object)[self.status]
+
+    def finished(self):
+        """ bool array of rows in FINAL_STATUSES.
+
+        :rtype: numpy.ndarray
+        """
+        return _status_mask(self.status, FINAL_STATUSES) & (self.end >= 0)
+
+    def durations(self):
+        """ Seconds from start to end. (NaN if not finished)
+
+        :rtype: numpy.ndarray
+        """
+        seconds = (self.end - self.start) / 1000.0
+        seconds[~self.finished()] = np.nan
+        return seconds
+
+    def counts(self):
+        """ Finished executions per key.
+
+        :rtype: numpy.ndarray
+        """
+        return np.bincount(self.key[self.finished()], minlength=len(self.keys))
+
+    def percentiles(self, q=(50, 90, 99)):
+        """ Duration percentiles of finished executions per key. (linear interpolation like numpy.percentile)
+
+        :param q: Percentiles in 0 to 100.
+        :type q: tuple
+        :return: Array of shape (len(keys), len(q)). (NaN for keys without finished executions)
+        :rtype: numpy.ndarray
+        """
+        finished = self.finished()
+        key = self.key[finished]
+        seconds = (self.end[finished] - self.start[finished]) / 1000.0
+        order = np.lexsort((seconds, key))
+        seconds = seconds[order]
+        counts = np.bincount(key, minlength=len(self.keys))
+        starts = np.cumsum(counts) - counts
+        result = np.full((len(self.keys), len(q)), np.nan)
+        present = counts > 0
+        for i, percent in enumerate(q):
+            position = starts[present] + (counts[present] - 1) * (percent / 100.0)
+            lower = np.floor(position).astype(np.int64)
+            upper = np.ceil(position).astype(np.int64)
+            result[present, i] = seconds[lower] + (seconds[upper] - seconds[lower]) * (position - lower)
+        return result
+
+    def failure_rates(self):
+        """ Ratio of FAILURE_STATUSES in finished executions per key. (NaN without finished executions)
+
+        :rtype: numpy.ndarray
+        """
+        finished = self.finished()
+        failed = finished & _status_mask(self.status, FAILURE_STATUSES)
+        total = np.bincount(self.key[finished], minlength=len(self.keys)).astype(np.float64)
+        failures = np.bincount(self.key[failed], minlength=len(self.keys))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return failures / total
+
+    def rolling_failure_rate(self, window=50, period=None):
+        """ Failure rate of the same key over preceding finished executions, at each execution.
+
+        :param window: Number of executions, including the current one.
+        :type window: int
+        :param period: Seconds before the start of the current one. (used instead of window if given)
+        :type period: float
+        :return: Rate per row, in the order of rows. (NaN for unfinished rows)
+        :rtype: numpy.ndarray
+        """
+        rows = np.flatnonzero(self.finished())
+        rows = rows[np.lexsort((self.start[rows], self.key[rows]))]
+        key = self.key[rows].astype(np.int64)
+        start = self.start[rows]
+        failed = _status_mask(self.status[rows], FAILURE_STATUSES).astype(np.int64)
+        failures = np.concatenate(([0], np.cumsum(failed)))
+        position = np.arange(len(rows))
+        if period is None:
+            first = np.maximum(np.searchsorted(key, key, side='left'), position + 1 - window)
+        else:
+            # (key, start) pairs are sorted, so one searchsorted finds the window of every row.
+            offset = start.min() if len(start) else 0
+            span = (start.max() - offset + 1) if len(start) else 1
+            composite = key * span + (start - offset)
+            first = np.searchsorted(composite, composite - int(period * 1000), side='left')
+            first = np.maximum(first, np.searchsorted(key, key, side='left'))
+        rates = np.full(len(self), np.nan)
+        rates[rows] = (failures[position + 1] - failures[first]) / (position + 1 - first).astype(np.float64)
+        return rates
+
+    def slowest(self, n=10, q=90):
+        """ Keys ranked by duration percentile.
+
+        :param n: Max number of keys.
+        :type n: int
+        :param q: Percentile to rank by. (0 to 100)
+        :type q: float
+        :return: (key, seconds, finished executions) list, slowest first.
+        :rtype: list
+        """
+        seconds = self.percentiles((q,))[:, 0]
+        ranked = np.flatnonzero(~np.isnan(seconds))
+        ranked = ranked[np.argsort(-seconds[ranked], kind='mergesort')][:n]
+        counts = self.counts()
+        return [(self.keys[i], float(seconds[i]), int(counts[i])) for i in ranked]
+
+
+def _unique_executions(table):
+    """ Drop executions fetched twice because pages shifted.
+    """
+    _, first = np.unique(table.exec_id * len(table.keys) + table.key, return_index=True)
+    return table.select(np.sort(first))
+
+
+class HistoryFetcher(object):
+    """ Fetch execution history with concurrent requests.
+    """
+
+    def __init__(self, api, max_workers=8, page_size=100):
+        """
+        :param api: Logged-in AjaxAPI.
+        :type api: AzkabanWeb.AjaxAPI
+        :param max_workers: Maximum number of requests at the same time.
+        :type max_workers: int
+        :param page_size: Executions per fetchFlowExecutions request.
+        :type page_size: int
+        """
+        self.api = api
+        self.max_workers = max_workers
+        self.page_size = page_size
+
+    def fetch_flows(self, flows, max_executions=None):
+        """ Flow executions, newest first per flow.
+
+        The first page of every flow tells its total, then the other pages of all flows are
+        fetched concurrently.
+
+        :param flows: (project name, flow name) list.
+        :type flows: list
+        :param max_executions: Max executions per flow. (default: all)
+        :type max_executions: int
+        :return: Table keyed by (project name, flow name).
+        :rtype: ExecutionTable
+        """
+        keys = [tuple(flow) for flow in flows]
+        page_size = self.page_size if max_executions is None else min(self.page_size, max_executions)
+
+        def fetch(task):
+            code, offset, length = task
+            project_name, flow_name = keys[code]
+            body = self.api.fetch_flow_executions(project_name, flow_name, start=offset, length=length)
+            executions = body.get('executions') or []
+            return body.get('total', 0), self.__flow_columns(code, executions)
+
+        pool = ThreadPool(self.max_workers)
+        try:
+            chunks = []
+            tasks = []
+            first_pages = pool.map(fetch, [(code, 0, page_size) for code in xrange(len(keys))])
+            for code, (total, columns) in enumerate(first_pages):
+                chunks.append(columns)
+                if max_executions is not None:
+                    total = min(total, max_executions)
+                for offset in xrange(page_size, total, page_size):
+                    tasks.append((code, offset, min(page_size, total - offset)))
+            for _, columns in pool.imap_unordered(fetch, tasks):
+                chunks.append(columns)
+        finally:
+            pool.close()
+            pool.join()
+        table = _unique_executions(ExecutionTable.from_chunks(keys, chunks))
+        self.api.logger.info("Fetched %d executions of %d flows in %d requests",
+                             len(table), len(keys), len(keys) + len(tasks))
+        return table
+
+    def fetch_jobs(self, flow_table):
+        """ Job executions of the given flow executions. (one fetchexecflow request per execution)
+
+        Jobs in embedded flows are named like 'subflow:job'.
+
+        :param flow_table: Table made by fetch_flows.
+        :type flow_table: ExecutionTable
+        :return: Table keyed by (project name, flow name, job id).
+        :rtype: ExecutionTable
+        """
+        executions = zip(flow_table.exec_id.tolist(), flow_table.key.tolist())
+        if not executions:
+            return ExecutionTable.from_chunks([], [])
+
+        def fetch(execution):
+            exec_id, code = execution
+            return exec_id, code, self.api.fetch_execution(exec_id).get('nodes') or []
+
+        keys = []
+        codes = {}
+        chunks = []
+        pool = ThreadPool(self.max_workers)
+        try:
+            for exec_id, code, nodes in pool.imap_unordered(fetch, executions, chunksize=16):
+                project_name, flow_name = flow_table.keys[code]
+                rows = list(self.__flatten(nodes))
+                key = np.empty(len(rows), dtype=np.int32)
+                for i, node in enumerate(rows):
+                    job_key = (project_name, flow_name, node['id'])
+                    if job_key not in codes:
+                        codes[job_key] = len(keys)
+                        keys.append(job_key)
+                    key[i] = codes[job_key]
+                start, end, status = self.__time_columns(rows)
+                chunks.append((np.full(len(rows), exec_id, dtype=np.int64), key, start, end, status))
+        finally:
+            pool.close()
+            pool.join()
+        table = ExecutionTable.from_chunks(keys, chunks)
+        self.api.logger.info("Fetched %d job executions of %d flow executions", len(table), len(executions))
+        return table
+
+    def __flow_columns(self, code, executions):
+        count = len(executions)
+        start, end, status = self.__time_columns(executions)
+        return (np.fromiter((e['execId'] for e in executions), np.int64, count),
+                np.full(count, code, dtype=np.int32), start, end, status)
+
+    @staticmethod
+    def __time_columns(records):
+        count = len(records)
+        return (np.fromiter((r.get('startTime', -1) for r in records), np.int64, count),
+                np.fromiter((r.get('endTime', -1) for r in records), np.int64, count),
+                np.fromiter((STATUS_CODES.get(r.get('status'), _UNKNOWN) for r in records), np.int8, count))
+
+    @classmethod
+    def __flatten(cls, nodes, prefix=''):
+        """ Job nodes including ones in embedded flows. (id is prefixed by the embedded flow)
+        """
+        for node in nodes:
+            node_id = prefix + node['id']
+            yield dict(node, id=node_id)
+            if node.get('nodes'):
+                for child in cls.__flatten(node['nodes'], prefix=node_id + ':'):
+                    yield child
@@ -12,7 +12,22 @@ import os
 import zipfile
 import collections
 import networkx as nx
-from AzkabanJobBase import AzkabanFileAbstruct, AzkabanJobAbstruct
+from AzkabanJobBase import AzkabanFileAbstruct, AzkabanJobAbstruct, Params
+from AzkabanEncoder import render_all
+from AzkabanMetrics import Instrument
+
+
+class Schedule(collections.namedtuple('Schedule', ['start_datetime', 'recurring_period'])):
+    """ Declared schedule of a flow. (see AjaxAPI.schedule_flow)
+
+    :start_datetime: The datetime to schedule the flow.
+    :recurring_period: The recursion period such as '1d'. (None if not recurring)
+    """
+
+    __slots__ = ()
+
+    def __new__(cls, start_datetime, recurring_period=None):
+        return super(Schedule, cls).__new__(cls, start_datetime, recurring_period)
 
 
 class Properties(AzkabanFileAbstruct):
@@ -40,7 +55,6 @@ class Command(AzkabanJobAbstruct):
         :param params:
         :type params: dict
         """
-        params.update({'type': 'command'})
         AzkabanJobAbstruct.__init__(self, 'command', name, params)
 
 
@@ -57,9 +71,8 @@ class Flow(AzkabanJobAbstruct):
         :type params: dict
         :type properties: Properties or dict
         """
-        params = params or {}
-        params.update({'type': 'flow', 'flow.name': name})
-        AzkabanJobAbstruct.__init__(self, 'flow', name, params)
+        AzkabanJobAbstruct.__init__(self, 'flow', name, params or {})
+        self.params._set('flow.name', name)
         if properties is None:
             self.__properties = None
         elif isinstance(properties, Properties):
@@ -68,8 +81,10 @@ class Flow(AzkabanJobAbstruct):
             self.__properties = Properties(self.name, properties)
         else:
             raise TypeError("properties is dict or Properties. (actual: {0})".format(type(properties)))
+        self.__scope = Params(self.__properties.params if self.__properties is not None else {})
         self.__graph = nx.DiGraph()
         self.__finish_command = Command(self.name, {'command': 'echo "Finish {0} at $(date)"'.format(self.name)})
+        self.__finish_command.params._set_parent(self.__scope)
         self.__graph.add_node(self.__finish_command)
 
     @property
@@ -88,6 +103,14 @@ class Flow(AzkabanJobAbstruct):
         """
         return self.__properties
 
+    @property
+    def scope(self):
+        """ Parameters layer inherited by jobs under this flow. (properties and parents' properties)
+
+        :rtype: Params
+        """
+        return self.__scope
+
     @property
     def finish_command(self):
         """ The last command of this Job.
@@ -138,6 +161,7 @@ class Flow(AzkabanJobAbstruct):
             raise self.DuplicatedJobError("{0} is already exists.".format(command))
         if not isinstance(command, Command):
             raise TypeError("{0} is not instance of Command".format(command))
+        self.__adopt(command)
         self.__graph.add_node(command)
         self.__append_finish_command(command)
         return command
@@ -152,6 +176,7 @@ class Flow(AzkabanJobAbstruct):
             raise self.DuplicatedJobError("{0} is already exists.".format(subflow))
         if not isinstance(subflow, Flow):
             raise TypeError("{0} is not instance of Flow".format(subflow))
+        self.__adopt(subflow)
         self.__graph.add_node(subflow)
         self.__append_finish_command(subflow)
         return subflow
@@ -166,6 +191,9 @@ class Flow(AzkabanJobAbstruct):
         """
         if (previous_job, next_job) in self.__graph.edges():
             raise self.DuplicatedDependenciesError("This dependencies {0} to {1} is already exists.".format(previous_job, next_job))
+        for job in (previous_job, next_job):
+            if job not in self.__graph:
+                self.__adopt(job)
         self.__set_dependencies(previous_job, next_job)
         self.__arrange_finish_command()
 
@@ -181,6 +209,37 @@ class Flow(AzkabanJobAbstruct):
             raise self.FinishCommandError("Do not remove finish command dependencies manually.")
         self.__remove_dependencies(previous_job, next_job)
 
+    def _restore(self, finish_command, jobs, edges):
+        """ Replace the graph with already arranged jobs and edges. (used by AzkabanSnapshot)
+
+        'dependencies' parameters are taken as they are and the finish command is not arranged again.
+
+        :param finish_command: The last command of this flow.
+        :type finish_command: Command
+        :param jobs: Other jobs in this flow.
+        :type jobs: list
+        :param edges: (previous job, next job) list.
+        :type edges: list
+        """
+        self.__graph = nx.DiGraph()
+        self.__finish_command = finish_command
+        for job in jobs:
+            self.__adopt(job)
+        self.__adopt(finish_command)
+        self.__graph.add_node(finish_command)
+        self.__graph.add_nodes_from(jobs)
+        self.__graph.add_edges_from(edges)
+
+    def __adopt(self, job):
+        """ Let job inherit this flow's parameters layer.
+
+        :param job: job placed under this flow.
+        :type job: Command or Flow
+        """
+        job.params._set_parent(self.__scope)
+        if isinstance(job, Flow):
+            job.scope._set_parent(self.__scope)
+
     def __set_dependencies(self, previous_job, next_job):
         """ Set job to 'dependencies' parameter.
 
@@ -253,6 +312,7 @@ class Project(collections.Set):
         self.__name = name
         self.__description = description
         self.__flows = set()
+        self.__schedules = {}
         if properties is None:
             self.__properties = None
         elif isinstance(properties, Properties):
@@ -261,6 +321,7 @@ class Project(collections.Set):
             self.__properties = Properties(self.name, properties)
         else:
             raise TypeError("properties is dict or Properties. (actual: {0})".format(type(properties)))
+        self.__scope = Params(self.__properties.params if self.__properties is not None else {})
 
     @property
     def name(self):
@@ -293,6 +354,14 @@ class Project(collections.Set):
         """
         return self.__flows
 
+    @property
+    def schedules(self):
+        """ Declared schedules of flows. (flow name -> Schedule)
+
+        :return: dict
+        """
+        return self.__schedules
+
     @property
     def properties(self):
         """ Properties under project.
@@ -301,6 +370,14 @@ class Project(collections.Set):
         """
         return self.__properties
 
+    @property
+    def scope(self):
+        """ Parameters layer inherited by all jobs in this project.
+
+        :rtype: Params
+        """
+        return self.__scope
+
     def __len__(self):
         return len(self.flows)
 
@@ -310,73 +387,127 @@ class Project(collections.Set):
     def __contains__(self, value):
         return value in self.flows
 
-    def add_flow(self, flow):
+    def add_flow(self, flow, schedule=None):
         """ Add new flow.
 
         :param flow: new appended flow.
+        :param schedule: Declared schedule of this flow, such as Schedule(datetime(2015, 5, 30, 10), '1d').
         :type flow: Flow
+        :type schedule: Schedule
         """
         if not isinstance(flow, Flow):
             raise TypeError("{0} is not Flow.".format(flow))
+        if schedule is not None and not isinstance(schedule, Schedule):
+            raise TypeError("{0} is not Schedule.".format(schedule))
+        flow.params._set_parent(self.__scope)
+        flow.scope._set_parent(self.__scope)
         self.__flows.add(flow)
+        if schedule is not None:
+            self.__schedules[flow.name] = schedule
 
-    def create_zipfile(self, out_dir='./', overwrite=False):
+    def create_zipfile(self, out_dir='./', overwrite=False, instrument=None, compression=zipfile.ZIP_STORED):
         """ Create new zipfile.
 
+        Packaging is done in 3 stages, which are reported to instrument:
+        'walk' (collect files from flow graphs), 'render' (job/properties text) and 'compress' (write zip).
+
         :param out_dir: output dir. (default: current directory)
         :param overwrite: Overwrite flag if already exists. (default: False)
+        :param instrument: Hooks to time each stage.
+        :param compression: zipfile.ZIP_STORED or zipfile.ZIP_DEFLATED.
         :type out_dir: str
         :type overwrite: bool
+        :type instrument: AzkabanMetrics.Instrument
+        :type compression: int
         :return: output full path
         """
+        instrument = instrument or Instrument()
         if not os.path.exists(out_dir):
             os.makedirs(out_dir)
         filepath = os.path.join(out_dir, self.filename)
         if os.path.exists(filepath) and not overwrite:
             raise IOError("Already exists. {0}".format(filepath))
-        with zipfile.ZipFile(filepath, mode='w') as project_zip:
-            for flow in self.flows:
-                self.__add_flow_to_zip(flow, project_zip, basedir=os.path.join(self.name, flow.name))
-            if self.properties is not None:
-                self.__add_properties_to_zip(self.properties, project_zip, basedir=self.name)
+        with instrument.stage('walk'):
+            entries = self.zip_entries()
+        with instrument.stage('render'):
+            texts = render_all([azkaban_file for _, azkaban_file in entries])
+            contents = zip([path for path, _ in entries], texts)
+        with instrument.stage('compress'):
+            with zipfile.ZipFile(filepath, mode='w', compression=compression) as project_zip:
+                for path, text in contents:
+                    project_zip.writestr(path, text)
         return filepath
 
-    def __add_flow_to_zip(self, flow, zipfile_obj, basedir='./'):
-        """ Write flow's job files into zipfile.
+    def save_snapshot(self, path):
+        """ Save flow graphs to a binary snapshot file. (see AzkabanSnapshot)
+
+        :param path: Snapshot file path.
+        :type path: str
+        :return: path
+        """
+        import AzkabanSnapshot
+        return AzkabanSnapshot.save(self, path)
+
+    @staticmethod
+    def load_snapshot(path, flows=None):
+        """ Load project saved by save_snapshot.
+
+        :param path: Snapshot file path.
+        :param flows: Names of flows to load. (default: all)
+        :type path: str
+        :type flows: list
+        :rtype: Project
+        """
+        import AzkabanSnapshot
+        return AzkabanSnapshot.load(path, flows=flows)
+
+    def zip_entries(self):
+        """ Files to be stored in the project zip, in archive order.
+
+        :return: list of (path in zipfile, Command or Flow or Properties)
+        :rtype: list
+        """
+        entries = []
+        for flow in self.flows:
+            entries.extend(self.flow_entries(flow))
+        if self.properties is not None:
+            entries.append((os.path.join(self.name, self.properties.filename), self.properties))
+        return entries
+
+    def flow_entries(self, flow):
+        """ Files of one flow (and its subflows) in the project zip.
+
+        :param flow: flow in this project.
+        :type flow: Flow
+        :return: list of (path in zipfile, Command or Flow or Properties)
+        :rtype: list
+        """
+        entries = []
+        self.__walk_flow(flow, entries, basedir=os.path.join(self.name, flow.name))
+        return entries
+
+    def __walk_flow(self, flow, entries, basedir='./'):
+        """ Collect flow's job files and properties file.
 
         :param flow: target flow
-        :param zipfile_obj: target zipfile object.
+        :param entries: list to append (path, file object)
         :param basedir: Basedir in zipfile. (default: root)
         :type flow: Flow
-        :type zipfile_obj: zipfile.ZipFile
+        :type entries: list
         :type basedir: str
         """
         if len(flow.last_nodes) != 1:
             raise self.MultipleLastJobError("{0} will be separated because it has multiple end node.".format(flow))
         for job in flow.jobs:
             if isinstance(job, Command):
-                zipfile_obj.writestr(os.path.join(basedir, job.filename), job.text)
+                entries.append((os.path.join(basedir, job.filename), job))
             elif isinstance(job, Flow):
-                zipfile_obj.writestr(os.path.join(basedir, job.filename), job.text)
-                self.__add_flow_to_zip(job, zipfile_obj, basedir=os.path.join(basedir, job.name))
+                entries.append((os.path.join(basedir, job.filename), job))
+                self.__walk_flow(job, entries, basedir=os.path.join(basedir, job.name))
             else:
                 raise TypeError("{0} is not Command and Flow.".format(job))
         if flow.properties is not None:
-            self.__add_properties_to_zip(flow.properties, zipfile_obj, basedir=basedir)
-
-    @staticmethod
-    def __add_properties_to_zip(properties, zipfile_obj, basedir='./'):
-        """ Write properties files into zipfile.
-
-        :param properties: target properties
-        :param zipfile_obj: target zipfile object
-        :param basedir: Basedir in zipfile. (default: root)
-        :type properties: Properties
-        :type zipfile_obj: zipfile.ZipFile
-        :type basedir: str
-        """
-        filepath = os.path.join(basedir, properties.filename)
-        zipfile_obj.writestr(filepath, properties.text)
+            entries.append((os.path.join(basedir, flow.properties.filename), flow.properties))
 
     class MultipleLastJobError(Exception):
         """ Unexcepted multiple last command in jobfile.
@@ -3,26 +3,167 @@
 
 import abc
 import collections
+from AzkabanEncoder import encode
 
 
-class Params(collections.Mapping):
+_MISSING = object()
+
+
+class Params(object):
     """ parameter of jobs and properties, such as key=value.
+
+    The given dict is never modified. Values written by Azusa itself (such as 'type' or 'dependencies')
+    go to a private overlay which is created on the first write, so one dict can be reused for many jobs.
+    Keys which are not set here are resolved lazily through the parent Params (Flow / Project properties)
+    by :meth:`resolve` and :meth:`effective`.
     """
 
-    def __init__(self, data):
-        self.__data = data
+    __slots__ = ('__base', '__local', '__parent')
+
+    def __init__(self, data, parent=None):
+        """
+        :param data: key-value parameters. (not copied, never modified)
+        :type data: dict or collections.Mapping
+        :param parent: Params of the enclosing properties layer.
+        :type parent: Params
+        """
+        self.__base = data if data is not None else {}
+        self.__local = None
+        self.__parent = parent
+
+    @property
+    def parent(self):
+        """ Params of the enclosing properties layer. (None at the top)
+
+        :rtype: Params
+        """
+        return self.__parent
 
     def __len__(self):
-        return len(self.__data)
+        if not self.__local:
+            return len(self.__base)
+        return len(self.__base) + sum(1 for key in self.__local if key not in self.__base)
 
     def __iter__(self):
-        return iter(self.__data)
+        for key in self.__base:
+            yield key
+        if self.__local:
+            for key in self.__local:
+                if key not in self.__base:
+                    yield key
 
-    def __contains__(self, value):
-        return value in self
+    def __contains__(self, key):
+        return (self.__local is not None and key in self.__local) or key in self.__base
 
     def __getitem__(self, key):
-        return self.__data[key]
+        if self.__local is not None and key in self.__local:
+            return self.__local[key]
+        return self.__base[key]
+
+    def __eq__(self, other):
+        if not isinstance(other, collections.Mapping):
+            return NotImplemented
+        return dict(self.items()) == dict(other.items())
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return "{0}({1!r})".format(type(self).__name__, dict(self.items()))
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def __merged(self):
+        """ Given data with the overlay applied. (the given dict itself if nothing is written)
+
+        :rtype: dict or collections.Mapping
+        """
+        if not self.__local:
+            return self.__base
+        merged = dict(self.__base)
+        merged.update(self.__local)
+        return merged
+
+    def keys(self):
+        return list(self)
+
+    def values(self):
+        return [self[key] for key in self]
+
+    def items(self):
+        return list(self.__merged().items())
+
+    def iterkeys(self):
+        return iter(self)
+
+    def itervalues(self):
+        return (self[key] for key in self)
+
+    def iteritems(self):
+        return iter(self.__merged().items())
+
+    def resolve(self, key, default=None):
+        """ Effective value of key, looked up through this Params and its parents.
+
+        :param key: parameter key.
+        :type key: str
+        :param default: returned value when no layer has the key.
+        :return: The value of the nearest layer.
+        """
+        params = self
+        while params is not None:
+            value = params.get(key, _MISSING)
+            if value is not _MISSING:
+                return value
+            params = params.parent
+        return default
+
+    def effective(self):
+        """ Effective parameters merged with all parent layers. (nearer layer wins)
+
+        :return: new dict
+        :rtype: dict
+        """
+        layers = []
+        params = self
+        while params is not None:
+            layers.append(params)
+            params = params.parent
+        merged = {}
+        for params in reversed(layers):
+            merged.update(params.iteritems())
+        return merged
+
+    def _set_parent(self, parent):
+        """
+
+        :param parent: Params of the enclosing properties layer.
+        :type parent: Params
+        """
+        self.__parent = parent
+
+    def _set(self, key, value):
+        """ Set value to the private overlay. (copy on write)
+
+        :param key: parameter key.
+        :type key: str
+        :param value: parameter value.
+        """
+        if self.__local is None:
+            self.__local = {}
+        self.__local[key] = value
+
+    def __own_dependencies(self):
+        """ 'dependencies' list owned by this Params. (copied from given data at first)
+
+        :rtype: list
+        """
+        if self.__local is None or 'dependencies' not in self.__local:
+            self._set('dependencies', list(self.__base.get('dependencies', [])))
+        return self.__local['dependencies']
 
     def _set_dependencies(self, dependent_job):
         """
@@ -30,9 +171,7 @@ class Params(collections.Mapping):
         :param dependent_job: Executed command or sub-flow before this command is executed.
         :type dependent_job: Command or Flow
         """
-        if 'dependencies' not in self.__data:
-            self.__data['dependencies'] = []
-        self.__data['dependencies'].append(dependent_job.basename)
+        self.__own_dependencies().append(dependent_job.basename)
 
     def _remove_dependencies(self, dependent_job):
         """
@@ -40,7 +179,10 @@ class Params(collections.Mapping):
         :param dependent_job: Removed registered command or sub-flow as dependencies before this command is executed.
         :type dependent_job: Command or Flow
         """
-        self.__data['dependencies'].remove(dependent_job.basename)
+        self.__own_dependencies().remove(dependent_job.basename)
+
+
+collections.Mapping.register(Params)
 
 
 class AzkabanFileAbstruct(object):
@@ -55,7 +197,7 @@ class AzkabanFileAbstruct(object):
         """
         :param name: Object unique name. It is used as filename.
         :type name: str
-        :param params: key-value parameters.
+        :param params: key-value parameters. (not modified)
         :type params: dict
         """
         self.__name = name
@@ -95,33 +237,11 @@ class AzkabanFileAbstruct(object):
 
     @property
     def text(self):
-        """ The file's text content.
+        """ The file's text content. (java.util.Properties format, see AzkabanEncoder)
 
         :rtype: str
         """
-        return self.__convert_dict_to_text(self.params)
-
-    @staticmethod
-    def __convert_dict_to_text(params):
-        """ Convert python dictionary type to key=value format text, such as .job, .properties in Azkaban.
-
-        :param params: key=value parameters. (This is used by .job, .properties in Azkaban)
-        :type params: dict or collections.Mapping
-        :return: key=value style text.
-        """
-
-        lines = []
-        for key, value in params.items():
-            if isinstance(value, list):
-                value = ','.join([str(x) for x in value])
-            elif isinstance(value, dict):
-                value = ','.join([k for k in value.keys()])
-            elif isinstance(value, int) or isinstance(value, str):
-                pass
-            else:
-                raise TypeError("Not support {0} type yet".format(type(value)))
-            lines.append("{0}={1}".format(key, value))
-        return '\n'.join(lines)
+        return encode(self.params)
 
 
 class AzkabanJobAbstruct(AzkabanFileAbstruct):
@@ -136,8 +256,8 @@ class AzkabanJobAbstruct(AzkabanFileAbstruct):
         """
         :param name: Properties' unique name. It is used as properties filename.
         :type name: str
-        :param params: Properties key-value parameters.
+        :param params: Properties key-value parameters. (not modified)
         :type params: dict
         """
-        params.update({'type': type_str})
         super(AzkabanJobAbstruct, self).__init__(name, params, 'job')
+        self.params._set('type', type_str)
@@ -0,0 +1,205 @@
+#!/usr/local/bin/python2.7
+"""
+    Instrumentation hooks for AjaxAPI requests and project packaging.
+
+    Pass an Instrument to AjaxAPI (instrument=...) or Project.create_zipfile (instrument=...).
+    MetricsCollector is the built-in one which exports Prometheus text format or JSON.
+
+    :copyright: 2015, Tasuku OKUDA.
+"""
+
+import bisect
+import contextlib
+import json
+import threading
+import time
+
+
+class Instrument(object):
+    """ No-op instrumentation hooks. Override the methods you need.
+    """
+
+    def on_request(self, endpoint, seconds, bytes_sent, bytes_received, error=None):
+        """ Called after every HTTP request of AjaxAPI.
+
+        :param endpoint: API action name, such as 'login', 'upload', 'scheduleFlow'.
+        :type endpoint: str
+        :param seconds: Elapsed seconds.
+        :type seconds: float
+        :param bytes_sent: Request body size.
+        :type bytes_sent: int
+        :param bytes_received: Response body size.
+        :type bytes_received: int
+        :param error: Error description if request failed on transport or HTTP status.
+        :type error: str
+        """
+        pass
+
+    def on_error(self, endpoint, error):
+        """ Called when Azkaban answered with an error. (AzkabanLoginError, AjaxAPIError)
+
+        :param endpoint: API action name.
+        :type endpoint: str
+        :param error: The exception to be raised.
+        :type error: Exception
+        """
+        pass
+
+    def on_stage(self, stage, seconds):
+        """ Called after a timed stage, such as 'walk', 'render', 'compress' of create_zipfile.
+
+        :param stage: Stage name.
+        :type stage: str
+        :param seconds: Elapsed seconds.
+        :type seconds: float
+        """
+        pass
+
+    @contextlib.contextmanager
+    def stage(self, stage):
+        """ Time the with-block and report it by on_stage.
+
+        :param stage: Stage name.
+        :type stage: str
+        """
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.on_stage(stage, time.time() - start)
+
+
+class Histogram(object):
+    """ Cumulative histogram with fixed upper bounds, such as Prometheus one.
+    """
+
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        """
+        :param buckets: Sorted upper bounds. (+Inf is added implicitly)
+        :type buckets: tuple
+        """
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self):
+        """ (upper bound, cumulative count) pairs, the last bound is '+Inf'.
+
+        :rtype: list
+        """
+        pairs, total = [], 0
+        for bound, count in zip(list(self.buckets) + ['+Inf'], self.counts):
+            total += count
+            pairs.append((bound, total))
+        return pairs
+
+
+class MetricsCollector(Instrument):
+    """ Thread-safe Instrument which keeps per-endpoint and per-stage metrics.
+    """
+
+    def __init__(self, prefix='azusa', buckets=Histogram.DEFAULT_BUCKETS):
+        """
+        :param prefix: Metric name prefix.
+        :type prefix: str
+        :param buckets: Histogram upper bounds in seconds.
+        :type buckets: tuple
+        """
+        self.prefix = prefix
+        self.__buckets = buckets
+        self.__lock = threading.Lock()
+        self.__latency = {}
+        self.__requests = {}
+        self.__errors = {}
+        self.__sent = {}
+        self.__received = {}
+        self.__stages = {}
+
+    def on_request(self, endpoint, seconds, bytes_sent, bytes_received, error=None):
+        with self.__lock:
+            self.__histogram(self.__latency, endpoint).observe(seconds)
+            self.__requests[endpoint] = self.__requests.get(endpoint, 0) + 1
+            self.__sent[endpoint] = self.__sent.get(endpoint, 0) + bytes_sent
+            self.__received[endpoint] = self.__received.get(endpoint, 0) + bytes_received
+            if error is not None:
+                self.__errors[endpoint] = self.__errors.get(endpoint, 0) + 1
+
+    def on_error(self, endpoint, error):
+        with self.__lock:
+            self.__errors[endpoint] = self.__errors.get(endpoint, 0) + 1
+
+    def on_stage(self, stage, seconds):
+        with self.__lock:
+            self.__histogram(self.__stages, stage).observe(seconds)
+
+    def __histogram(self, histograms, key):
+        if key not in histograms:
+            histograms[key] = Histogram(self.__buckets)
+        return histograms[key]
+
+    def to_dict(self):
+        """ Snapshot of all metrics.
+
+        :rtype: dict
+        """
+        with self.__lock:
+            endpoints = {}
+            for endpoint in set(self.__requests) | set(self.__errors):
+                latency = self.__latency.get(endpoint)
+                endpoints[endpoint] = {
+                    'requests': self.__requests.get(endpoint, 0),
+                    'errors': self.__errors.get(endpoint, 0),
+                    'bytes_sent': self.__sent.get(endpoint, 0),
+                    'bytes_received': self.__received.get(endpoint, 0),
+                    'seconds_sum': latency.sum if latency else 0.0,
+                    'seconds_buckets': latency.cumulative() if latency else [],
+                }
+            stages = dict((stage, {'count': h.count, 'seconds_sum': h.sum, 'seconds_buckets': h.cumulative()})
+                          for stage, h in self.__stages.items())
+        return {'endpoints': endpoints, 'stages': stages}
+
+    def to_json(self, **kwargs):
+        """
+        :rtype: str
+        """
+        return json.dumps(self.to_dict(), sort_keys=True, **kwargs)
+
+    def to_prometheus(self):
+        """ Prometheus text exposition format.
+
+        :rtype: str
+        """
+        metrics = self.to_dict()
+        name = self.prefix
+        lines = []
+
+        def histogram(metric, label, values):
+            lines.append("# TYPE {0} histogram".format(metric))
+            for key in sorted(values):
+                value = values[key]
+                for bound, count in value['seconds_buckets']:
+                    lines.append('{0}_bucket{{{1}="{2}",le="{3}"}} {4}'.format(metric, label, key, bound, count))
+                lines.append('{0}_sum{{{1}="{2}"}} {3!r}'.format(metric, label, key, value['seconds_sum']))
+                count = value['seconds_buckets'][-1][1] if value['seconds_buckets'] else 0
+                lines.append('{0}_count{{{1}="{2}"}} {3}'.format(metric, label, key, count))
+
+        def counter(metric, field):
+            lines.append("# TYPE {0} counter".format(metric))
+            for endpoint in sorted(metrics['endpoints']):
+                lines.append('{0}{{endpoint="{1}"}} {2}'.format(metric, endpoint, metrics['endpoints'][endpoint][field]))
+
+        histogram("{0}_request_seconds".format(name), 'endpoint', metrics['endpoints'])
+        counter("{0}_requests_total".format(name), 'requests')
+        counter("{0}_request_errors_total".format(name), 'errors')
+        counter("{0}_request_sent_bytes_total".format(name), 'bytes_sent')
+        counter("{0}_request_received_bytes_total".format(name), 'bytes_received')
+        histogram("{0}_stage_seconds".format(name), 'stage', metrics['stages'])
+        return '\n'.join(lines) + '\n'
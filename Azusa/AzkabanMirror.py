@@ -0,0 +1,241 @@
+#!/usr/local/bin/python2.7
+"""
+    Local mirror of the projects deployed on an Azkaban Web Server.
+
+    The project list page gives every project with its last modification, so one
+    request tells which projects were uploaded since the last refresh. Only those are
+    fetched again (fetchprojectflows and fetchflowgraph of each flow, concurrently).
+    The inventory is kept in a JSON file and turned into Project / Flow / Command graphs.
+
+        mirror = ServerMirror(api, 'inventory.json')
+        mirror.refresh()
+        for project in mirror.projects():
+            ...
+
+    Changes are detected by the last modification time on the project list page, which
+    has a resolution of one second. A project uploaded again within the same second as
+    the mirrored upload looks unchanged, until it is uploaded again or the mirror file is
+    removed.
+
+    Only the structure is mirrored: commands have their job type and dependencies,
+    but not the other job parameters, which fetchflowgraph does not return.
+
+    :copyright: 2015, Tasuku OKUDA.
+"""
+
+import collections
+import json
+import os
+from multiprocessing.pool import ThreadPool
+
+from AzkabanJob import Command, Flow, Project
+
+
+RefreshResult = collections.namedtuple('RefreshResult', ['fetched', 'removed', 'unchanged', 'failed', 'requests'])
+
+
+def _subflow_name(node, graphs):
+    """ Embedded flow name of a flow graph node. (None if node is not an embedded flow)
+    """
+    if node.get('type') != 'flow':
+        return None
+    name = node.get('flowId')
+    if name is None and node['id'].startswith('flow_'):
+        name = node['id'][len('flow_'):]
+    if name in graphs and node['id'] == "flow_{0}".format(name):
+        return name
+    return None
+
+
+def _build_job(node, name=None):
+    params = {}
+    if node.get('in'):
+        params['dependencies'] = list(node['in'])
+    command = Command(name or node['id'], params)
+    if node.get('type', 'command') != 'command':
+        command.params._set('type', node['type'])
+    return command
+
+
+def build_flow(name, graphs, dependencies=None, parents=()):
+    """ Flow from fetchflowgraph nodes. (embedded flows become subflows)
+
+    :param name: Flow name, which is also the id of its last job.
+    :type name: str
+    :param graphs: flow name -> nodes of all flows in the project.
+    :type graphs: dict
+    :param dependencies: 'dependencies' of this flow as a subflow job.
+    :type dependencies: list
+    :rtype: Flow
+    """
+    flow = Flow(name, {'dependencies': list(dependencies)} if dependencies else None)
+    finish_command = None
+    jobs = collections.OrderedDict()
+    for node in graphs[name]:
+        if node['id'] == name:
+            finish_command = _build_job(node)
+            continue
+        subflow = _subflow_name(node, graphs)
+        if subflow is not None and subflow not in parents:
+            jobs[node['id']] = build_flow(subflow, graphs, node.get('in'), parents + (name,))
+        else:
+            jobs[node['id']] = _build_job(node)
+    if finish_command is None:
+        finish_command = Command(name, {})
+    nodes = dict(jobs)
+    nodes[name] = finish_command
+    edges = [(nodes[dependency], nodes[node['id']])
+             for node in graphs[name] for dependency in node.get('in', []) if dependency in nodes]
+    flow._restore(finish_command, jobs.values(), edges)
+    return flow
+
+
+def build_project(name, record):
+    """ Project from a mirrored inventory record.
+
+    Flows embedded in another flow are only built as its subflows.
+
+    :type name: str
+    :param record: Inventory record. (see ServerMirror.inventory)
+    :type record: dict
+    :rtype: Project
+    """
+    graphs = record['flows']
+    embedded = set()
+    for nodes in graphs.values():
+        for node in nodes:
+            subflow = _subflow_name(node, graphs)
+            if subflow is not None:
+                embedded.add(subflow)
+    project = Project(name, record.get('description'))
+    for flow_name in sorted(graphs):
+        if flow_name not in embedded:
+            project.add_flow(build_flow(flow_name, graphs))
+    return project
+
+
+class ServerMirror(object):
+    """ Incrementally refreshed inventory of one Azkaban Web Server.
+    """
+
+    def __init__(self, api, path, max_workers=8):
+        """
+        :param api: Logged-in AjaxAPI.
+        :type api: AzkabanWeb.AjaxAPI
+        :param path: JSON file keeping the inventory.
+        :type path: str
+        :param max_workers: Maximum number of requests at the same time.
+        :type max_workers: int
+        """
+        self.api = api
+        self.path = path
+        self.max_workers = max_workers
+        self.__inventory = self.load()
+
+    @property
+    def inventory(self):
+        """ project name -> {'description', 'last_modified', 'projectId', 'flows': flow name -> nodes}
+
+        :rtype: dict
+        """
+        return self.__inventory
+
+    def load(self):
+        """ Inventory saved for this server. (empty if none)
+
+        :rtype: dict
+        """
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path) as f:
+            saved = json.load(f)
+        if saved.get('base_url') != self.api.base_url:
+            return {}
+        return saved.get('projects', {})
+
+    def save(self):
+        """ Write inventory. (replaced atomically)
+        """
+        tmp_path = "{0}.tmp".format(self.path)
+        with open(tmp_path, 'w') as f:
+            json.dump({'base_url': self.api.base_url, 'projects': self.__inventory}, f, sort_keys=True)
+        os.rename(tmp_path, self.path)
+
+    def refresh(self):
+        """ Fetch projects modified since the last refresh and drop deleted ones.
+
+        :rtype: RefreshResult
+        """
+        index = self.api.fetch_project_index()
+        requests = 1
+        stale = []
+        for entry in index:
+            record = self.__inventory.get(entry['name'])
+            if record is None or entry['last_modified'] is None or record['last_modified'] != entry['last_modified']:
+                stale.append(entry)
+        names = set(entry['name'] for entry in index)
+        removed = sorted(name for name in self.__inventory if name not in names)
+        for name in removed:
+            del self.__inventory[name]
+
+        def fetch_flows(entry):
+            try:
+                return entry, self.api.fetch_project_flows(entry['name']), None
+            except Exception as e:
+                return entry, None, e
+
+        def fetch_graph(task):
+            project_name, flow_name = task
+            try:
+                return project_name, flow_name, self.api.fetch_flow_jobs(project_name, flow_name)['nodes'], None
+            except Exception as e:
+                return project_name, flow_name, None, e
+
+        failed = set()
+        records = {}
+        pool = ThreadPool(self.max_workers)
+        try:
+            tasks = []
+            for entry, body, error in pool.imap_unordered(fetch_flows, stale):
+                requests += 1
+                if error is not None:
+                    self.api.logger.error("Cannot fetch flows of %s: %r", entry['name'], error)
+                    failed.add(entry['name'])
+                    continue
+                records[entry['name']] = {'description': entry['description'], 'last_modified': entry['last_modified'],
+                                          'projectId': body.get('projectId'), 'flows': {}}
+                tasks.extend((entry['name'], flow['flowId']) for flow in body.get('flows', []))
+            for project_name, flow_name, nodes, error in pool.imap_unordered(fetch_graph, tasks):
+                requests += 1
+                if error is not None:
+                    self.api.logger.error("Cannot fetch flow %s.%s: %r", project_name, flow_name, error)
+                    failed.add(project_name)
+                    continue
+                records[project_name]['flows'][flow_name] = nodes
+        finally:
+            pool.close()
+            pool.join()
+        fetched = sorted(name for name in records if name not in failed)
+        for name in fetched:
+            self.__inventory[name] = records[name]
+        self.save()
+        unchanged = sorted(names.difference(entry['name'] for entry in stale))
+        self.api.logger.info("Mirror refreshed: %d fetched, %d removed, %d unchanged, %d failed (%d requests)",
+                             len(fetched), len(removed), len(unchanged), len(failed), requests)
+        return RefreshResult(fetched, removed, unchanged, sorted(failed), requests)
+
+    def project(self, name):
+        """ Mirrored project.
+
+        :type name: str
+        :rtype: Project
+        :raises KeyError: Unknown project.
+        """
+        return build_project(name, self.__inventory[name])
+
+    def projects(self):
+        """ All mirrored projects in name order.
+
+        :rtype: list
+        """
+        return [self.project(name) for name in sorted(self.__inventory)]
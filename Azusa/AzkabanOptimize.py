@@ -0,0 +1,571 @@
+#!/usr/local/bin/python2.7
+"""
+    Optimization passes over built flows.
+
+    Passes never modify the given objects. A flow is copied into plain data
+    (FlowSpec), rewritten there and built again as new Flow objects, whose graphs
+    are restored at once instead of by set_dependencies.
+
+        project = inline_project(project, max_jobs=5)
+        project = partition_project(project, max_jobs=1000)
+        project, report = hoist_project(project)
+
+    :copyright: 2015, Tasuku OKUDA.
+"""
+
+import collections
+import math
+
+from AzkabanEncoder import render_all
+from AzkabanJob import Command, Flow, Project, Properties
+
+
+def _own_params(azkaban_file):
+    """ Own parameters without 'dependencies'.
+
+    :rtype: dict
+    """
+    params = dict(azkaban_file.params.items())
+    params.pop('dependencies', None)
+    return params
+
+
+def _merge_params(inherited, params):
+    """ params overriding inherited. (new dict)
+    """
+    merged = dict(inherited)
+    merged.update(params)
+    return merged
+
+
+class JobSpec(object):
+    """ Plain data of a command job.
+    """
+
+    def __init__(self, name, params):
+        """
+        :type name: str
+        :param params: Own parameters without 'dependencies'.
+        :type params: dict
+        """
+        self.name = name
+        self.params = params
+
+    @property
+    def basename(self):
+        return self.name
+
+
+class FlowSpec(object):
+    """ Plain data of a flow: jobs in order and their dependencies by basename.
+
+    The finish command depends on every job which no other job depends on, as in Flow.
+    """
+
+    def __init__(self, name, params, properties=None, finish_params=None):
+        """
+        :type name: str
+        :param params: Own parameters of the flow job without 'dependencies'.
+        :type params: dict
+        :param properties: (properties name, parameters) or None.
+        :type properties: tuple
+        :param finish_params: Own parameters of the finish command without 'dependencies'.
+        :type finish_params: dict
+        """
+        self.name = name
+        self.params = params
+        self.properties = properties
+        self.finish_params = finish_params if finish_params is not None else {
+            'command': 'echo "Finish {0} at $(date)"'.format(name)}
+        self.jobs = collections.OrderedDict()
+        self.dependencies = {}
+
+    @property
+    def basename(self):
+        return "flow_{0}".format(self.name)
+
+    @classmethod
+    def from_flow(cls, flow):
+        """ Copy flow and its subflows.
+
+        :type flow: Flow
+        :rtype: FlowSpec
+        """
+        properties = None
+        if flow.properties is not None:
+            properties = (flow.properties.name, dict(flow.properties.params.items()))
+        spec = cls(flow.name, _own_params(flow), properties, _own_params(flow.finish_command))
+        finish_command = flow.finish_command
+        for job in sorted(flow.jobs, key=lambda j: j.basename):
+            if job is finish_command:
+                continue
+            if isinstance(job, Flow):
+                spec.jobs[job.basename] = cls.from_flow(job)
+            else:
+                spec.jobs[job.basename] = JobSpec(job.name, _own_params(job))
+            spec.dependencies[job.basename] = list(job.params.get('dependencies', []))
+        return spec
+
+    def last_jobs(self):
+        """ Basenames of jobs which no other job depends on, in job order.
+
+        :rtype: list
+        """
+        depended = set()
+        for dependencies in self.dependencies.values():
+            depended.update(dependencies)
+        return [basename for basename in self.jobs if basename not in depended]
+
+    def job_count(self):
+        """ Number of job files of this flow and its subflows. (finish commands included)
+
+        :rtype: int
+        """
+        return 1 + sum(job.job_count() + 1 if isinstance(job, FlowSpec) else 1 for job in self.jobs.values())
+
+    def to_flow(self, dependencies=()):
+        """ Build Flow objects.
+
+        :param dependencies: 'dependencies' of this flow as a subflow job.
+        :type dependencies: list
+        :rtype: Flow
+        """
+        params = dict(self.params)
+        if dependencies:
+            params['dependencies'] = list(dependencies)
+        properties = Properties(*self.properties) if self.properties is not None else None
+        flow = Flow(self.name, params, properties=properties)
+        jobs = collections.OrderedDict()
+        for basename, job in self.jobs.items():
+            job_dependencies = self.dependencies.get(basename, [])
+            if isinstance(job, FlowSpec):
+                jobs[basename] = job.to_flow(job_dependencies)
+            else:
+                params = dict(job.params)
+                if job_dependencies:
+                    params['dependencies'] = list(job_dependencies)
+                jobs[basename] = Command(job.name, params)
+        last_jobs = self.last_jobs()
+        finish_params = dict(self.finish_params)
+        if last_jobs:
+            finish_params['dependencies'] = last_jobs
+        finish_command = Command(self.name, finish_params)
+        edges = [(jobs[dependency], jobs[basename])
+                 for basename, job_dependencies in self.dependencies.items() for dependency in job_dependencies]
+        edges.extend((jobs[basename], finish_command) for basename in last_jobs)
+        flow._restore(finish_command, jobs.values(), edges)
+        return flow
+
+
+def _replace_dependency(dependencies, basename, replacements):
+    """ Replace basename by replacements in place of it. (without duplicates)
+    """
+    out = []
+    for dependency in dependencies:
+        for name in (replacements if dependency == basename else [dependency]):
+            if name not in out:
+                out.append(name)
+    return out
+
+
+def _can_inline(parent, subflow):
+    """ Whether subflow can be inlined without changing job names or parameters.
+
+    Parameters of the subflow job itself (other than type and flow.name) would be lost,
+    and job names must stay unique in the parent.
+    """
+    if set(subflow.params) - set(['type', 'flow.name']):
+        return False
+    names = set(parent.jobs) - set([subflow.basename])
+    names.add(parent.name)
+    return not any(basename in names or basename == subflow.name for basename in subflow.jobs)
+
+
+def _inline_subflow(parent, subflow):
+    """ Move jobs of subflow into parent in place of the subflow job.
+
+    Sources of the subflow take the dependencies of the subflow job, and jobs which depended
+    on the subflow job depend on its sinks instead. Subflow properties are merged into the
+    own parameters (and properties of nested flows), so the effective parameters are kept.
+    """
+    basename = subflow.basename
+    upstreams = parent.dependencies.pop(basename)
+    sinks = subflow.last_jobs() if subflow.jobs else upstreams
+    inherited = subflow.properties[1] if subflow.properties is not None else {}
+    jobs = collections.OrderedDict()
+    for name, job in parent.jobs.items():
+        if name != basename:
+            jobs[name] = job
+            continue
+        for inner_name, inner_job in subflow.jobs.items():
+            inner_job.params = _merge_params(inherited, inner_job.params)
+            if isinstance(inner_job, FlowSpec) and inherited:
+                properties_name = inner_job.properties[0] if inner_job.properties is not None else inner_job.name
+                inner_params = inner_job.properties[1] if inner_job.properties is not None else {}
+                inner_job.properties = (properties_name, _merge_params(inherited, inner_params))
+            jobs[inner_name] = inner_job
+            parent.dependencies[inner_name] = list(subflow.dependencies[inner_name]) or list(upstreams)
+    parent.jobs = jobs
+    for name, dependencies in parent.dependencies.items():
+        if basename in dependencies:
+            parent.dependencies[name] = _replace_dependency(dependencies, basename, sinks)
+
+
+def inline_spec(spec, max_jobs=5):
+    """ Inline small subflows of FlowSpec in place, innermost first.
+
+    :type spec: FlowSpec
+    :param max_jobs: Subflows with at most this many jobs (finish command excluded) are inlined.
+    :type max_jobs: int
+    :return: Number of inlined subflows.
+    :rtype: int
+    """
+    inlined = 0
+    for job in spec.jobs.values():
+        if isinstance(job, FlowSpec):
+            inlined += inline_spec(job, max_jobs)
+    for job in list(spec.jobs.values()):
+        if isinstance(job, FlowSpec) and len(job.jobs) <= max_jobs and _can_inline(spec, job):
+            _inline_subflow(spec, job)
+            inlined += 1
+    return inlined
+
+
+def inline_subflows(flow, max_jobs=5):
+    """ Execution-equivalent copy of flow whose small subflows are flattened.
+
+    Each inlined subflow removes its flow job and finish command. Jobs run in the same
+    order with the same effective parameters, but their files move to the parent directory.
+
+    :type flow: Flow
+    :param max_jobs: Subflows with at most this many jobs (finish command excluded) are inlined.
+    :type max_jobs: int
+    :rtype: Flow
+    """
+    spec = FlowSpec.from_flow(flow)
+    inline_spec(spec, max_jobs)
+    return spec.to_flow()
+
+
+def inline_project(project, max_jobs=5):
+    """ Copy of project whose flows are processed by inline_subflows.
+
+    :type project: Project
+    :type max_jobs: int
+    :rtype: Project
+    """
+    optimized = Project(project.name, project.description, properties=project.properties)
+    for flow in sorted(project.flows, key=lambda f: f.name):
+        optimized.add_flow(inline_subflows(flow, max_jobs), schedule=project.schedules.get(flow.name))
+    return optimized
+
+
+def _all_names(spec, names):
+    """ Job basenames and flow names used in spec and its subflows.
+    """
+    names.add(spec.name)
+    for basename, job in spec.jobs.items():
+        names.add(basename)
+        if isinstance(job, FlowSpec):
+            _all_names(job, names)
+    return names
+
+
+def _topological_order(spec):
+    """ Reverse DFS postorder of jobs, which keeps chains and small branches contiguous.
+
+    :rtype: list
+    """
+    successors = dict((basename, []) for basename in spec.jobs)
+    for basename in spec.jobs:
+        for dependency in spec.dependencies.get(basename, []):
+            successors[dependency].append(basename)
+    visited = set()
+    postorder = []
+    for root in spec.jobs:
+        if root in visited or spec.dependencies.get(root):
+            continue
+        visited.add(root)
+        stack = [(root, iter(successors[root]))]
+        while stack:
+            node, children = stack[-1]
+            for child in children:
+                if child not in visited:
+                    visited.add(child)
+                    stack.append((child, iter(successors[child])))
+                    break
+            else:
+                stack.pop()
+                postorder.append(node)
+    postorder.reverse()
+    return postorder
+
+
+def _cut_points(order, spec, count, imbalance):
+    """ Split positions of order into count ranges.
+
+    Each split is placed within imbalance of its ideal position where the fewest
+    dependencies cross it. Ranges of a topological order keep the partition graph acyclic.
+
+    :rtype: list
+    """
+    size = len(order)
+    position = dict((basename, i) for i, basename in enumerate(order))
+    crossing = [0] * (size + 1)
+    for basename in order:
+        for dependency in spec.dependencies.get(basename, []):
+            crossing[position[dependency] + 1] += 1
+            crossing[position[basename] + 1] -= 1
+    for i in xrange(1, size + 1):
+        crossing[i] += crossing[i - 1]
+    part_size = size / float(count)
+    slack = int(part_size * imbalance / 2)
+    cuts = [0]
+    for k in xrange(1, count):
+        ideal = int(round(k * part_size))
+        low = max(cuts[-1] + 1, ideal - slack)
+        high = max(low, min(size - (count - k), ideal + slack))
+        cuts.append(min(xrange(low, high + 1), key=lambda p: (crossing[p], abs(p - ideal))))
+    cuts.append(size)
+    return cuts
+
+
+def _partition_once(spec, max_jobs, imbalance, names, level):
+    """ Move jobs of spec into balanced subflows. (one level)
+
+    :return: Number of cut dependencies.
+    :rtype: int
+    """
+    order = _topological_order(spec)
+    count = int(math.ceil(len(order) * (1 + imbalance) / float(max_jobs)))
+    count = min(count, len(order) - 1)
+    cuts = _cut_points(order, spec, count, imbalance)
+    part_of = {}
+    parts = []
+    for index in xrange(count):
+        name = "{0}_part{1}_{2}".format(spec.name, level, index)
+        while name in names or "flow_{0}".format(name) in names:
+            name += '_'
+        names.update([name, "flow_{0}".format(name)])
+        part = FlowSpec(name, {})
+        for basename in order[cuts[index]:cuts[index + 1]]:
+            part_of[basename] = part
+        parts.append(part)
+    cut = 0
+    part_dependencies = collections.defaultdict(list)
+    for basename, job in spec.jobs.items():
+        part = part_of[basename]
+        part.jobs[basename] = job
+        inner = []
+        for dependency in spec.dependencies.get(basename, []):
+            upstream = part_of[dependency]
+            if upstream is part:
+                inner.append(dependency)
+                continue
+            cut += 1
+            if upstream.basename not in part_dependencies[part.basename]:
+                part_dependencies[part.basename].append(upstream.basename)
+        part.dependencies[basename] = inner
+    spec.jobs = collections.OrderedDict((part.basename, part) for part in parts)
+    spec.dependencies = dict((part.basename, part_dependencies[part.basename]) for part in parts)
+    return cut
+
+
+def partition_spec(spec, max_jobs=1000, imbalance=0.1):
+    """ Split large FlowSpec (and its subflows) into nested subflows in place.
+
+    :type spec: FlowSpec
+    :param max_jobs: Maximum number of jobs directly under one flow.
+    :type max_jobs: int
+    :param imbalance: Allowed deviation of partition sizes from the average. (ratio)
+    :type imbalance: float
+    :return: Number of dependencies replaced by subflow dependencies.
+    :rtype: int
+    """
+    if max_jobs < 2:
+        raise ValueError("max_jobs must be 2 or more.")
+    if imbalance < 0 or 1 + imbalance >= max_jobs:
+        raise ValueError("imbalance must be 0 or more and less than max_jobs - 1.")
+    cut = 0
+    for job in spec.jobs.values():
+        if isinstance(job, FlowSpec):
+            cut += partition_spec(job, max_jobs, imbalance)
+    names = None
+    level = 0
+    while len(spec.jobs) > max_jobs:
+        if names is None:
+            names = _all_names(spec, set())
+        level += 1
+        size = len(spec.jobs)
+        cut += _partition_once(spec, max_jobs, imbalance, names, level)
+        if len(spec.jobs) >= size:
+            raise RuntimeError("Partitioning {0} did not reduce its {1} jobs.".format(spec.name, size))
+    return cut
+
+
+def partition_flow(flow, max_jobs=1000, imbalance=0.1):
+    """ Copy of flow whose jobs are split into nested subflows of balanced sizes.
+
+    Jobs are cut along a topological order, at the positions crossed by the fewest
+    dependencies, so subflows depend on each other without cycles. A dependency between
+    two subflows makes the whole upstream subflow finish first: every original ordering is
+    kept, while some unrelated jobs may run later than before.
+
+    :type flow: Flow
+    :param max_jobs: Maximum number of jobs directly under one flow.
+    :type max_jobs: int
+    :param imbalance: Allowed deviation of partition sizes from the average. (ratio)
+    :type imbalance: float
+    :rtype: Flow
+    """
+    spec = FlowSpec.from_flow(flow)
+    partition_spec(spec, max_jobs, imbalance)
+    return spec.to_flow()
+
+
+def partition_project(project, max_jobs=1000, imbalance=0.1):
+    """ Copy of project whose flows are processed by partition_flow.
+
+    :type project: Project
+    :type max_jobs: int
+    :type imbalance: float
+    :rtype: Project
+    """
+    optimized = Project(project.name, project.description, properties=project.properties)
+    for flow in sorted(project.flows, key=lambda f: f.name):
+        optimized.add_flow(partition_flow(flow, max_jobs, imbalance), schedule=project.schedules.get(flow.name))
+    return optimized
+
+
+# Parameters which belong to each job file and are never moved to properties.
+_NOT_HOISTED = frozenset(['type', 'dependencies', 'flow.name'])
+
+
+class HoistReport(collections.namedtuple('HoistReport', ['files_before', 'files_after', 'lines_before',
+                                                         'lines_after', 'bytes_before', 'bytes_after'])):
+    """ Size of project files before and after hoist_project.
+    """
+
+    __slots__ = ()
+
+    def __str__(self):
+        saved = self.bytes_before - self.bytes_after
+        return "{0} -> {1} files, {2} -> {3} lines, {4} -> {5} bytes ({6:+.1f}%)".format(
+            self.files_before, self.files_after, self.lines_before, self.lines_after,
+            self.bytes_before, self.bytes_after, -100.0 * saved / self.bytes_before if self.bytes_before else 0.0)
+
+
+def _value_key(value):
+    """ Hashable identity of parameter value. (lists and dicts by repr)
+    """
+    try:
+        hash(value)
+        return type(value), value
+    except TypeError:
+        return type(value), repr(value)
+
+
+def _properties_params(spec):
+    return spec.properties[1] if spec.properties is not None else {}
+
+
+def _job_params(spec, context, out):
+    """ Effective parameters of all job files under spec. (commands, finish commands and subflow jobs)
+
+    :param context: Effective parameters given to spec by its parents.
+    :rtype: list
+    """
+    context = _merge_params(context, _properties_params(spec))
+    out.append(_merge_params(context, spec.finish_params))
+    for job in spec.jobs.values():
+        out.append(_merge_params(context, job.params))
+        if isinstance(job, FlowSpec):
+            _job_params(job, context, out)
+    return out
+
+
+def _common_params(jobs, context, current):
+    """ Parameters to put in properties of a scope.
+
+    A key is hoisted when every job in the scope has it. Its most common value is
+    hoisted if more than half of the jobs (at least two) share it, or it is already
+    the properties value, unless the parent scopes already give that value.
+
+    :param jobs: Effective parameters of jobs in the scope.
+    :param context: New effective parameters given by the parent scopes.
+    :param current: Current properties of the scope.
+    :rtype: dict
+    """
+    hoisted = {}
+    if not jobs:
+        return hoisted
+    keys = set(jobs[0]).difference(_NOT_HOISTED)
+    for params in jobs[1:]:
+        keys.intersection_update(params)
+    for key in sorted(keys):
+        counts = collections.Counter(_value_key(params[key]) for params in jobs)
+        current_key = _value_key(current[key]) if key in current else None
+        best = max(counts, key=lambda value_key: (counts[value_key], value_key == current_key, value_key))
+        if key in context and _value_key(context[key]) == best:
+            continue
+        if (counts[best] >= 2 and counts[best] * 2 > len(jobs)) or best == current_key:
+            hoisted[key] = next(params[key] for params in jobs if _value_key(params[key]) == best)
+    return hoisted
+
+
+def _rewrite_own(params, old_context, new_context):
+    """ Own parameters giving the same effective values under new_context.
+    """
+    effective = _merge_params(old_context, params)
+    return dict((key, value) for key, value in effective.items()
+                if key in _NOT_HOISTED or key not in new_context or _value_key(new_context[key]) != _value_key(value))
+
+
+def _hoist_flow(spec, old_context, new_context):
+    """ Rewrite properties and own parameters under spec in place.
+    """
+    current = _properties_params(spec)
+    hoisted = _common_params(_job_params(spec, old_context, []), new_context, current)
+    old_scope = _merge_params(old_context, current)
+    new_scope = _merge_params(new_context, hoisted)
+    spec.finish_params = _rewrite_own(spec.finish_params, old_scope, new_scope)
+    for job in spec.jobs.values():
+        job.params = _rewrite_own(job.params, old_scope, new_scope)
+        if isinstance(job, FlowSpec):
+            _hoist_flow(job, old_scope, new_scope)
+    spec.properties = (spec.properties[0] if spec.properties is not None else spec.name, hoisted) if hoisted else None
+
+
+def _file_sizes(project):
+    texts = render_all([azkaban_file for _, azkaban_file in project.zip_entries()])
+    return len(texts), sum(text.count('\n') + 1 for text in texts if text), sum(len(text) for text in texts)
+
+
+def hoist_project(project):
+    """ Copy of project whose parameters shared by all jobs are moved to properties.
+
+    Scopes are the project and each flow (subflows included). Properties are computed again
+    from the effective parameters of all jobs in the scope (finish commands and subflow jobs
+    included), so existing properties overridden by every job are replaced, and jobs whose
+    value differs from the hoisted one keep it. Effective parameters of every job stay the same.
+
+    :type project: Project
+    :return: (new project, HoistReport)
+    :rtype: tuple
+    """
+    flows = [FlowSpec.from_flow(flow) for flow in sorted(project.flows, key=lambda f: f.name)]
+    current = dict(project.properties.params.items()) if project.properties is not None else {}
+    jobs = []
+    for spec in flows:
+        _job_params(spec, current, jobs)
+    hoisted = _common_params(jobs, {}, current)
+    for spec in flows:
+        _hoist_flow(spec, current, hoisted)
+    properties = None
+    if hoisted:
+        properties = Properties(project.properties.name if project.properties is not None else project.name, hoisted)
+    optimized = Project(project.name, project.description, properties=properties)
+    for spec in flows:
+        optimized.add_flow(spec.to_flow(), schedule=project.schedules.get(spec.name))
+    before, after = _file_sizes(project), _file_sizes(optimized)
+    return optimized, HoistReport(before[0], after[0], before[1], after[1], before[2], after[2])
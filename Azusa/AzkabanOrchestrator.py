@@ -0,0 +1,267 @@
+#!/usr/local/bin/python2.7
+"""
+    Client-side orchestrator of flows across projects.
+
+    Azkaban dependencies exist only inside a flow. Orchestrator takes a DAG of
+    (project, flow) and executes each flow when all of its upstreams succeeded.
+
+        orchestrator = Orchestrator(api, max_running=4, project_limits={'etl': 2},
+                                    state_path='nightly.json')
+        extract = orchestrator.add_flow('etl', 'extract')
+        orchestrator.add_flow('report', 'daily', upstreams=[extract])
+        orchestrator.run()
+
+    All running executions are polled by one loop, concurrently, once per poll interval.
+    The state of every node is written to state_path after each change, so a restarted
+    orchestrator skips succeeded flows and keeps watching executions it had started.
+    Failed and skipped flows are run again.
+
+    :copyright: 2015, Tasuku OKUDA.
+"""
+
+import collections
+import json
+import os
+import time
+from multiprocessing.pool import ThreadPool
+
+import networkx as nx
+
+
+PENDING = 'PENDING'
+RUNNING = 'RUNNING'
+SUCCEEDED = 'SUCCEEDED'
+FAILED = 'FAILED'
+SKIPPED = 'SKIPPED'
+
+# Azkaban execution statuses finishing an orchestrated node.
+FAILURE_STATUSES = ('FAILED', 'KILLED', 'CANCELLED')
+
+
+class NodeState(collections.namedtuple('NodeState', ['status', 'exec_id', 'error'])):
+    """ State of one (project, flow) node.
+
+    :status: PENDING, RUNNING, SUCCEEDED, FAILED or SKIPPED.
+    :exec_id: Azkaban execution id. (None before execution)
+    :error: Failure reason. (None unless FAILED or SKIPPED)
+    """
+
+    __slots__ = ()
+
+    def __new__(cls, status=PENDING, exec_id=None, error=None):
+        return super(NodeState, cls).__new__(cls, status, exec_id, error)
+
+
+class Orchestrator(object):
+    """ Execute a DAG of flows across projects with concurrency limits.
+    """
+
+    def __init__(self, api, max_running=8, project_limits=None, poll_interval=5.0, state_path=None,
+                 max_workers=8):
+        """
+        :param api: Logged-in AjaxAPI.
+        :type api: AzkabanWeb.AjaxAPI
+        :param max_running: Maximum number of running executions in total.
+        :type max_running: int
+        :param project_limits: project name -> maximum number of running executions in the project.
+        :type project_limits: dict
+        :param poll_interval: Seconds between status polls.
+        :type poll_interval: float
+        :param state_path: JSON file to resume from. (not persisted if None)
+        :type state_path: str
+        :param max_workers: Maximum number of requests at the same time.
+        :type max_workers: int
+        """
+        self.api = api
+        self.max_running = max_running
+        self.project_limits = dict(project_limits or {})
+        self.poll_interval = poll_interval
+        self.state_path = state_path
+        self.max_workers = max_workers
+        self.graph = nx.DiGraph()
+        self.__states = {}
+
+    def add_flow(self, project_name, flow_name, upstreams=()):
+        """ Add (project, flow) node executed after upstreams succeed.
+
+        :type project_name: str
+        :type flow_name: str
+        :param upstreams: (project name, flow name) list. (added if unknown)
+        :type upstreams: list
+        :return: The node key (project name, flow name).
+        :rtype: tuple
+        """
+        key = (project_name, flow_name)
+        self.graph.add_node(key)
+        for upstream in upstreams:
+            self.graph.add_edge(tuple(upstream), key)
+        return key
+
+    @property
+    def states(self):
+        """ Node key -> NodeState.
+
+        :rtype: dict
+        """
+        return dict(self.__states)
+
+    def load_state(self):
+        """ Node key -> NodeState saved in state_path.
+
+        :rtype: dict
+        """
+        if self.state_path is None or not os.path.exists(self.state_path):
+            return {}
+        with open(self.state_path) as f:
+            nodes = json.load(f).get('nodes', [])
+        return dict(((node['project'], node['flow']), NodeState(node['status'], node.get('execid'), node.get('error')))
+                    for node in nodes)
+
+    def save_state(self):
+        """ Write node states to state_path. (replaced atomically)
+        """
+        if self.state_path is None:
+            return
+        nodes = [{'project': key[0], 'flow': key[1], 'status': state.status, 'execid': state.exec_id,
+                  'error': state.error} for key, state in sorted(self.__states.items())]
+        tmp_path = "{0}.tmp".format(self.state_path)
+        with open(tmp_path, 'w') as f:
+            json.dump({'nodes': nodes}, f, indent=2, sort_keys=True)
+        os.rename(tmp_path, self.state_path)
+
+    def run(self):
+        """ Execute the DAG until every node succeeded, failed or was skipped.
+
+        :return: Node key -> NodeState.
+        :rtype: dict
+        :raises Orchestrator.OrchestratorError: The graph has a cycle.
+        """
+        if not nx.is_directed_acyclic_graph(self.graph):
+            raise self.OrchestratorError("Flow dependencies have a cycle: {0}".format(
+                next(nx.simple_cycles(self.graph))))
+        order = list(nx.topological_sort(self.graph))
+        saved = self.load_state()
+        self.__states = {}
+        for key in order:
+            state = saved.get(key, NodeState())
+            if state.status not in (SUCCEEDED, RUNNING) or (state.status == RUNNING and state.exec_id is None):
+                state = NodeState()
+            self.__states[key] = state
+        self.save_state()
+        self.api.logger.info("Orchestrate %d flows (%d already succeeded, %d running)", len(order),
+                             self.__count(SUCCEEDED), self.__count(RUNNING))
+        pool = ThreadPool(self.max_workers)
+        try:
+            while True:
+                changed = self.__poll(pool)
+                while True:
+                    skipped = self.__skip_failed_downstreams(order)
+                    launched = self.__launch(pool, order)
+                    if not skipped and not launched:
+                        break
+                    changed = True
+                if changed:
+                    self.save_state()
+                if not self.__count(RUNNING):
+                    break
+                time.sleep(self.poll_interval)
+        finally:
+            pool.close()
+            pool.join()
+        self.api.logger.info("Orchestration finished: %d succeeded, %d failed, %d skipped",
+                             self.__count(SUCCEEDED), self.__count(FAILED), self.__count(SKIPPED))
+        return self.states
+
+    def __count(self, status):
+        return sum(1 for state in self.__states.values() if state.status == status)
+
+    def __poll(self, pool):
+        """ Fetch the status of all running executions at once.
+
+        :return: Whether some node finished.
+        :rtype: bool
+        """
+        running = [(key, state) for key, state in self.__states.items() if state.status == RUNNING]
+        if not running:
+            return False
+
+        def fetch(item):
+            key, state = item
+            try:
+                return key, state, self.api.fetch_execution(state.exec_id).get('status'), None
+            except Exception as e:
+                return key, state, None, e
+
+        changed = False
+        for key, state, status, error in pool.map(fetch, running):
+            if error is not None:
+                self.api.logger.warning("Cannot fetch %s.%s (execid=%s): %r", key[0], key[1], state.exec_id, error)
+            elif status == SUCCEEDED:
+                self.__states[key] = state._replace(status=SUCCEEDED)
+                self.api.logger.info("%s.%s succeeded (execid=%s)", key[0], key[1], state.exec_id)
+                changed = True
+            elif status in FAILURE_STATUSES:
+                self.__states[key] = state._replace(status=FAILED, error=status)
+                self.api.logger.error("%s.%s %s (execid=%s)", key[0], key[1], status, state.exec_id)
+                changed = True
+        return changed
+
+    def __skip_failed_downstreams(self, order):
+        """ Mark pending nodes whose upstream failed or was skipped.
+
+        :rtype: bool
+        """
+        changed = False
+        for key in order:
+            if self.__states[key].status != PENDING:
+                continue
+            for upstream in self.graph.predecessors(key):
+                if self.__states[upstream].status in (FAILED, SKIPPED):
+                    self.__states[key] = NodeState(SKIPPED, error="{0}.{1} {2}".format(
+                        upstream[0], upstream[1], self.__states[upstream].status.lower()))
+                    self.api.logger.warning("Skip %s.%s: %s", key[0], key[1], self.__states[key].error)
+                    changed = True
+                    break
+        return changed
+
+    def __launch(self, pool, order):
+        """ Execute ready nodes within the concurrency limits.
+
+        :rtype: bool
+        """
+        running = collections.Counter(key[0] for key, state in self.__states.items() if state.status == RUNNING)
+        total = sum(running.values())
+        ready = []
+        for key in order:
+            if total >= self.max_running:
+                break
+            if self.__states[key].status != PENDING:
+                continue
+            if any(self.__states[upstream].status != SUCCEEDED for upstream in self.graph.predecessors(key)):
+                continue
+            limit = self.project_limits.get(key[0])
+            if limit is not None and running[key[0]] >= limit:
+                continue
+            ready.append(key)
+            running[key[0]] += 1
+            total += 1
+        if not ready:
+            return False
+
+        def execute(key):
+            try:
+                return key, self.api.execute_flow(key[0], key[1])['execid'], None
+            except Exception as e:
+                return key, None, e
+
+        for key, exec_id, error in pool.map(execute, ready):
+            if error is not None:
+                self.__states[key] = NodeState(FAILED, error=repr(error))
+            else:
+                self.__states[key] = NodeState(RUNNING, exec_id)
+        return True
+
+    class OrchestratorError(Exception):
+        """ Exception when the flow graph cannot be orchestrated.
+        """
+        pass
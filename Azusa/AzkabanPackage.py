@@ -0,0 +1,223 @@
+#!/usr/local/bin/python2.7
+"""
+    Batch packaging of many projects into zipfiles.
+
+    Projects generated from the same definitions share most of their files (the same
+    properties, the same commands in every environment). BatchPackager renders the
+    projects on a process pool, keeps each distinct text once, deflates the distinct
+    texts on the same pool and writes every archive from the compressed entries.
+
+    Rendering is per project: a file shared by several projects is rendered once for
+    each of them. Only compression is deduplicated, as it costs far more than rendering.
+
+        packager = BatchPackager('dist', compression=zipfile.ZIP_DEFLATED)
+        for result in packager.package(projects):
+            print result.path, result.entries, result.unique, result.digest
+
+    Archives have the same entries, in the same order and with the same contents and
+    compression as Project.create_zipfile. (only the entry timestamps differ)
+
+    Workers are forked with the projects of one package() call, taken from the parent's
+    memory, so projects do not have to be picklable and packagers can run side by side.
+    Without os.fork everything runs in the calling process.
+
+    :copyright: 2015, Tasuku OKUDA.
+"""
+
+import collections
+import hashlib
+import multiprocessing
+import os
+import platform
+import sys
+import time
+import zipfile
+import zlib
+
+from AzkabanEncoder import PropertiesEncoder
+
+
+PackageResult = collections.namedtuple('PackageResult', ['name', 'path', 'entries', 'unique', 'digest', 'seconds'])
+
+# Writing entries compressed beforehand depends on ZipFile internals of CPython 2.7.
+# Elsewhere entries are written by ZipFile.writestr, which compresses them again.
+PRECOMPRESSED = (sys.version_info[:2] == (2, 7) and platform.python_implementation() == 'CPython'
+                 and hasattr(zipfile.ZipFile, '_writecheck'))
+
+# Projects of the pool a worker process belongs to. (set in worker processes only)
+_worker_projects = []
+
+
+def _init_worker(projects):
+    """ Pool initializer binding the projects to the worker process.
+    """
+    global _worker_projects
+    _worker_projects = projects
+
+
+def render_entries(project):
+    """ (path, text) list of the files in project zip, in zip order.
+
+    :type project: AzkabanJob.Project
+    :rtype: list
+    """
+    entries = project.zip_entries()
+    texts = PropertiesEncoder().render_all([azkaban_file for _, azkaban_file in entries])
+    return [(path, text) for (path, _), text in zip(entries, texts)]
+
+
+def _render_task(index):
+    """ (path, text) list of a project of the pool. (run in worker process)
+
+    :rtype: list
+    """
+    return render_entries(_worker_projects[index])
+
+
+def entries_digest(entries):
+    """ SHA-256 of rendered files. (independent of zip order and timestamps)
+
+    :param entries: (path, text) list.
+    :type entries: list
+    :rtype: str
+    """
+    digest = hashlib.sha256()
+    for path, text in sorted(entries, key=lambda entry: entry[0]):
+        digest.update("{0}\0{1}\0{2}\0".format(path, len(text), text))
+    return digest.hexdigest()
+
+
+def _compress_task(texts):
+    """ CRC and deflated bytes of texts. (run in worker process)
+
+    :rtype: list
+    """
+    results = []
+    for text in texts:
+        compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+        results.append((zlib.crc32(text) & 0xffffffff, compressor.compress(text) + compressor.flush()))
+    return results
+
+
+def _chunks(items, size):
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def _write_entry(project_zip, path, text, crc, data):
+    """ Same as ZipFile.writestr, with CRC and compressed bytes given. (only if PRECOMPRESSED)
+    """
+    zinfo = zipfile.ZipInfo(filename=path, date_time=time.localtime(time.time())[:6])
+    zinfo.compress_type = project_zip.compression
+    zinfo.external_attr = 0o600 << 16
+    zinfo.file_size = len(text)
+    zinfo.CRC = crc
+    zinfo.compress_size = len(data)
+    zinfo.header_offset = project_zip.fp.tell()
+    project_zip._writecheck(zinfo)
+    project_zip._didModify = True
+    zip64 = zinfo.file_size > zipfile.ZIP64_LIMIT or zinfo.compress_size > zipfile.ZIP64_LIMIT
+    if zip64 and not project_zip._allowZip64:
+        raise zipfile.LargeZipFile("Filesize would require ZIP64 extensions")
+    project_zip.fp.write(zinfo.FileHeader(zip64))
+    project_zip.fp.write(data)
+    project_zip.fp.flush()
+    project_zip.filelist.append(zinfo)
+    project_zip.NameToInfo[zinfo.filename] = zinfo
+
+
+class BatchPackager(object):
+    """ Build zipfiles of many projects, compressing each distinct file once.
+    """
+
+    def __init__(self, out_dir='./', compression=zipfile.ZIP_STORED, processes=None, overwrite=False,
+                 chunk_size=64):
+        """
+        :param out_dir: output dir. (default: current directory)
+        :type out_dir: str
+        :param compression: zipfile.ZIP_STORED or zipfile.ZIP_DEFLATED.
+        :type compression: int
+        :param processes: Render and compression processes. (default: CPU count)
+        :type processes: int
+        :param overwrite: Overwrite flag if already exists. (default: False)
+        :type overwrite: bool
+        :param chunk_size: Texts per compression task.
+        :type chunk_size: int
+        """
+        if compression not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+            raise self.PackageError("Unsupported compression: {0}".format(compression))
+        self.out_dir = out_dir
+        self.compression = compression
+        self.processes = processes or multiprocessing.cpu_count()
+        self.overwrite = overwrite
+        self.chunk_size = chunk_size
+        self.precompressed = PRECOMPRESSED
+
+    def package(self, projects):
+        """ Create zipfiles of all projects.
+
+        :type projects: list
+        :return: PackageResult list in the order of projects.
+        :rtype: list
+        """
+        projects = list(projects)
+        if not os.path.exists(self.out_dir):
+            os.makedirs(self.out_dir)
+        filepaths = [os.path.join(self.out_dir, project.filename) for project in projects]
+        if len(set(filepaths)) != len(filepaths):
+            raise self.PackageError("Projects have the same zipfile name.")
+        for filepath in filepaths:
+            if os.path.exists(filepath) and not self.overwrite:
+                raise IOError("Already exists. {0}".format(filepath))
+        start = time.time()
+        pool = None
+        try:
+            if self.processes > 1 and len(projects) > 1 and hasattr(os, 'fork'):
+                # initargs of forked workers are inherited, not pickled
+                pool = multiprocessing.Pool(min(self.processes, len(projects)), initializer=_init_worker,
+                                            initargs=(projects,))
+                contents = pool.map(_render_task, range(len(projects)), chunksize=1)
+            else:
+                contents = [render_entries(project) for project in projects]
+            compressed = None
+            if self.precompressed:
+                texts = sorted(set(text for entries in contents for _, text in entries))
+                compressed = dict(zip(texts, self.__compress(texts, pool)))
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+        seconds = time.time() - start
+        results = []
+        for project, filepath, entries in zip(projects, filepaths, contents):
+            start = time.time()
+            with zipfile.ZipFile(filepath, mode='w', compression=self.compression) as project_zip:
+                for path, text in entries:
+                    if compressed is None:
+                        project_zip.writestr(path, text)
+                    else:
+                        crc, data = compressed[text]
+                        _write_entry(project_zip, path, text, crc, data)
+            results.append(PackageResult(project.name, filepath, len(entries), len(set(text for _, text in entries)),
+                                         entries_digest(entries), time.time() - start))
+        if results:
+            # Rendering and compression are shared by all projects.
+            share = seconds / len(results)
+            results = [result._replace(seconds=result.seconds + share) for result in results]
+        return results
+
+    def __compress(self, texts, pool):
+        """ (CRC, compressed bytes) of each text.
+
+        :rtype: list
+        """
+        if self.compression == zipfile.ZIP_STORED:
+            return [(zlib.crc32(text) & 0xffffffff, text) for text in texts]
+        chunks = _chunks(texts, self.chunk_size)
+        if pool is None or len(chunks) <= 1:
+            return [result for chunk in chunks for result in _compress_task(chunk)]
+        return [result for results in pool.imap(_compress_task, chunks) for result in results]
+
+    class PackageError(Exception):
+        """ Exception when projects cannot be packaged together.
+        """
+        pass
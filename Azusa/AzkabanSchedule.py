@@ -0,0 +1,218 @@
+#!/usr/local/bin/python2.7
+"""
+    Declarative schedule reconciler.
+
+    Fetch all schedules once, compare them with Project.schedules and apply only
+    the needed creates and updates concurrently. Schedules of flows which are not
+    declared are removed only with prune=True.
+
+        reconciler = ScheduleReconciler(api)
+        reconciler.reconcile([project], dry_run=True)   # print the plan only
+        reconciler.reconcile([project])
+        reconciler.reconcile([project], prune=True)   # also remove undeclared schedules
+
+    :copyright: 2015, Tasuku OKUDA.
+"""
+
+import calendar
+import collections
+import re
+from datetime import timedelta
+from multiprocessing.pool import ThreadPool
+
+
+CREATE = 'create'
+UPDATE = 'update'
+REMOVE = 'remove'
+
+# AjaxAPI.schedule_flow sends naive datetime as JST.
+SCHEDULE_TZ_OFFSET = timedelta(hours=9)
+
+_PERIOD_UNITS = {
+    'w': timedelta(weeks=1), 'd': timedelta(days=1),
+    'h': timedelta(hours=1), 'm': timedelta(minutes=1), 's': timedelta(seconds=1),
+}
+
+
+class ScheduleChange(collections.namedtuple('ScheduleChange', ['action', 'project', 'flow', 'schedule', 'current'])):
+    """ One change of the plan.
+
+    :action: CREATE, UPDATE or REMOVE.
+    :project: Project name.
+    :flow: Flow name.
+    :schedule: Desired Schedule. (None for REMOVE)
+    :current: Current schedule dict from AjaxAPI.fetch_schedules. (None for CREATE)
+    """
+
+    __slots__ = ()
+
+    def __str__(self):
+        if self.action == REMOVE:
+            return "- {0}.{1} (scheduleid={2})".format(self.project, self.flow, self.current['scheduleid'])
+        sign = '+' if self.action == CREATE else '~'
+        return "{0} {1}.{2} at {3:%Y-%m-%d %H:%M} every {4}".format(
+            sign, self.project, self.flow, self.schedule.start_datetime, self.schedule.recurring_period or '-')
+
+
+def to_millis(start_datetime):
+    """ Epoch millis of the datetime as AjaxAPI.schedule_flow sends it. (minute precision, JST)
+
+    :type start_datetime: datetime
+    :rtype: int
+    """
+    local = start_datetime.replace(second=0, microsecond=0)
+    return calendar.timegm((local - SCHEDULE_TZ_OFFSET).timetuple()) * 1000
+
+
+def period_matches(recurring_period, period_millis):
+    """ Whether recurring period string such as '1d' is the same as Azkaban period millis.
+
+    Azkaban reports month periods relative to now, so 'M' accepts 28 to 31 days per month.
+
+    :type recurring_period: str
+    :type period_millis: int
+    :rtype: bool
+    """
+    period_millis = int(period_millis or 0)
+    if not recurring_period:
+        return period_millis == 0
+    match = re.match(r'^(\d+)([Mwdhms])$', recurring_period)
+    if match is None:
+        raise ValueError("Invalid period {0}".format(recurring_period))
+    count, unit = int(match.group(1)), match.group(2)
+    if unit == 'M':
+        return any(period_millis == count * days * 86400 * 1000 for days in (28, 29, 30, 31))
+    return period_millis == int((_PERIOD_UNITS[unit] * count).total_seconds() * 1000)
+
+
+class ScheduleReconciler(object):
+    """ Make Azkaban schedules match Project.schedules with minimum requests.
+    """
+
+    def __init__(self, api, max_workers=8):
+        """
+        :param api: Logged-in AjaxAPI.
+        :type api: AzkabanWeb.AjaxAPI
+        :param max_workers: Maximum number of changes applied at the same time.
+        :type max_workers: int
+        """
+        self.api = api
+        self.max_workers = max_workers
+
+    def plan(self, projects, current=None, prune=False):
+        """ Compute needed changes.
+
+        Only schedules of the given projects are touched. A schedule of a flow which is
+        not declared in Project.schedules is removed only if prune. (even if the project
+        declares no schedules at all)
+
+        :param projects: Projects holding desired schedules.
+        :type projects: list
+        :param current: Result of AjaxAPI.fetch_schedules. (fetched if None)
+        :type current: list
+        :param prune: Remove schedules which are not declared.
+        :type prune: bool
+        :return: ScheduleChange list.
+        :rtype: list
+        """
+        if current is None:
+            current = self.api.fetch_schedules()
+        current_by_flow = dict(((s['projectname'], s['flowname']), s) for s in current)
+        changes = []
+        for project in projects:
+            for flow_name in sorted(project.schedules):
+                schedule = project.schedules[flow_name]
+                existing = current_by_flow.get((project.name, flow_name))
+                if existing is None:
+                    changes.append(ScheduleChange(CREATE, project.name, flow_name, schedule, None))
+                elif not self.__same(schedule, existing):
+                    changes.append(ScheduleChange(UPDATE, project.name, flow_name, schedule, existing))
+            if not prune:
+                continue
+            for (project_name, flow_name), existing in sorted(current_by_flow.items()):
+                if project_name == project.name and flow_name not in project.schedules:
+                    changes.append(ScheduleChange(REMOVE, project_name, flow_name, None, existing))
+        return changes
+
+    def apply(self, changes, project_ids=None):
+        """ Apply changes concurrently.
+
+        :param changes: ScheduleChange list made by plan.
+        :type changes: list
+        :param project_ids: Known project name -> project id. Others are resolved once per project.
+        :type project_ids: dict
+        :return: (ScheduleChange, response or exception) list.
+        :rtype: list
+        """
+        project_ids = dict(project_ids or {})
+        for change in changes:
+            if change.current is not None and change.current.get('projectid') is not None:
+                project_ids.setdefault(change.project, change.current['projectid'])
+        for change in changes:
+            if change.action != REMOVE and change.project not in project_ids:
+                project_ids[change.project] = self.api.fetch_project_flows(change.project)['projectId']
+
+        for change in changes:
+            if change.action == REMOVE:
+                self.api.logger.warning("Remove schedule %s", change)
+
+        def run(change):
+            try:
+                if change.action == REMOVE:
+                    return change, self.api.remove_schedule(change.current['scheduleid'])
+                return change, self.api.schedule_flow(change.project, change.flow, change.schedule.start_datetime,
+                                                      recurring_period=change.schedule.recurring_period,
+                                                      project_id=project_ids[change.project])
+            except Exception as e:
+                return change, e
+
+        if not changes:
+            return []
+        pool = ThreadPool(min(self.max_workers, len(changes)))
+        try:
+            return pool.map(run, changes)
+        finally:
+            pool.close()
+            pool.join()
+
+    def reconcile(self, projects, dry_run=False, project_ids=None, prune=False):
+        """ Plan and apply. (print the plan only if dry_run)
+
+        :param projects: Projects holding desired schedules.
+        :type projects: list
+        :param dry_run: Do not change anything.
+        :type dry_run: bool
+        :param project_ids: Known project name -> project id.
+        :type project_ids: dict
+        :param prune: Remove schedules which are not declared.
+        :type prune: bool
+        :return: (ScheduleChange, response or exception) list. (response is None if dry_run)
+        :rtype: list
+        :raises ScheduleReconciler.ReconcileError: Some changes failed.
+        """
+        changes = self.plan(projects, prune=prune)
+        self.api.logger.info("Schedule plan: %d create, %d update, %d remove%s",
+                             sum(1 for c in changes if c.action == CREATE),
+                             sum(1 for c in changes if c.action == UPDATE),
+                             sum(1 for c in changes if c.action == REMOVE),
+                             " (dry run)" if dry_run else "")
+        for change in changes:
+            self.api.logger.info("%s", change)
+        if dry_run:
+            return [(change, None) for change in changes]
+        results = self.apply(changes, project_ids=project_ids)
+        failures = [(change, result) for change, result in results if isinstance(result, Exception)]
+        if failures:
+            raise self.ReconcileError("{0}/{1} schedule changes failed: {2}".format(
+                len(failures), len(changes), ', '.join("{0} ({1!r})".format(c, e) for c, e in failures)), results)
+        return results
+
+    @staticmethod
+    def __same(schedule, existing):
+        return (int(existing.get('time', -1)) == to_millis(schedule.start_datetime) and
+                period_matches(schedule.recurring_period, existing.get('period')))
+
+    class ReconcileError(Exception):
+        """ Exception when some changes failed. (args[1] is the whole result list)
+        """
+        pass
@@ -0,0 +1,417 @@
+#!/usr/local/bin/python2.7
+"""
+    Binary snapshot of built Project graphs.
+
+    A snapshot holds the project properties, schedules, and every flow with its jobs,
+    parameters, properties and dependency edges. Loading it restores the graphs directly,
+    without replaying set_dependencies, so a large project is reloaded much faster than
+    it is built from its definition module.
+
+        project.save_snapshot('etl.azsnap')
+        project = Project.load_snapshot('etl.azsnap')
+
+        snapshot = ProjectSnapshot('etl.azsnap')  # reads the header only
+        flow = snapshot.load_flow('daily')        # loads one flow
+
+    File layout (integers are big-endian, lengths and indices are varints):
+
+        'AZSNAP' | version (uint16) | header length (uint32) | header crc32 (uint32) | header | flow sections
+
+    The header holds the project name, description, properties, schedules and the
+    (name, offset, length, crc32) index of flow sections. Each section has its own
+    string table followed by the flow body, so flows are decoded one by one.
+    Values are tagged: str, unicode, int, float, bool, None, list, dict and datetime.
+
+    :copyright: 2015, Tasuku OKUDA.
+"""
+
+import collections
+import os
+import struct
+import zlib
+from datetime import datetime
+
+from AzkabanJob import Command, Flow, Project, Properties, Schedule
+
+
+MAGIC = 'AZSNAP'
+VERSION = 1
+
+_PREFIX = struct.Struct('>6sHII')
+_DOUBLE = struct.Struct('>d')
+
+_NONE, _TRUE, _FALSE, _INT, _FLOAT, _STR, _LIST, _DICT, _DATETIME = 'NTFIRSLDW'
+_BYTES, _UNICODE = 'bu'
+_COMMAND, _FLOW = 'CF'
+
+_VARINTS = [chr(i) for i in xrange(128)]
+
+FlowIndex = collections.namedtuple('FlowIndex', ['name', 'offset', 'length', 'crc32'])
+
+
+def _varint(number):
+    """ Unsigned LEB128. """
+    if number < 128:
+        return _VARINTS[number]
+    out = []
+    while number >= 128:
+        out.append(chr(number & 0x7f | 0x80))
+        number >>= 7
+    out.append(chr(number))
+    return ''.join(out)
+
+
+class _Writer(object):
+    """ Encoder of one section. (string table + body)
+    """
+
+    def __init__(self):
+        self.__ids = {}
+        self.__strings = []
+        self.__body = []
+
+    def string(self, text):
+        key = (type(text), text)
+        string_id = self.__ids.get(key)
+        if string_id is None:
+            string_id = self.__ids[key] = len(self.__strings)
+            self.__strings.append(text)
+        self.__body.append(_varint(string_id))
+
+    def raw(self, data):
+        self.__body.append(data)
+
+    def varint(self, number):
+        self.__body.append(_varint(number))
+
+    def value(self, value):
+        """
+        :raises TypeError: Unsupported type.
+        """
+        write = self.__body.append
+        if isinstance(value, basestring):
+            write(_STR)
+            self.string(value)
+        elif value is None:
+            write(_NONE)
+        elif isinstance(value, bool):
+            write(_TRUE if value else _FALSE)
+        elif isinstance(value, (int, long)):
+            write(_INT)
+            write(_varint(value << 1 if value >= 0 else (-value << 1) - 1))
+        elif isinstance(value, float):
+            write(_FLOAT)
+            write(_DOUBLE.pack(value))
+        elif isinstance(value, (list, tuple)):
+            write(_LIST)
+            write(_varint(len(value)))
+            for item in value:
+                self.value(item)
+        elif isinstance(value, collections.Mapping):
+            write(_DICT)
+            self.mapping(value)
+        elif isinstance(value, datetime):
+            write(_DATETIME)
+            for number in (value.year, value.month, value.day, value.hour, value.minute, value.second,
+                           value.microsecond):
+                write(_varint(number))
+        else:
+            raise TypeError("Not support {0} type yet".format(type(value)))
+
+    def mapping(self, params):
+        items = params.items()
+        self.__body.append(_varint(len(items)))
+        for key, value in items:
+            self.string(key)
+            self.value(value)
+
+    def getvalue(self):
+        table = [_varint(len(self.__strings))]
+        for text in self.__strings:
+            if isinstance(text, unicode):
+                data = text.encode('utf-8')
+                table.append(_UNICODE)
+            else:
+                data = text
+                table.append(_BYTES)
+            table.append(_varint(len(data)))
+            table.append(data)
+        return ''.join(table) + ''.join(self.__body)
+
+
+class _Reader(object):
+    """ Decoder of one section. (string table + body)
+    """
+
+    def __init__(self, data):
+        self.__data = data
+        self.__pos = 0
+        strings = []
+        for _ in xrange(self.varint()):
+            kind = self.raw(1)
+            text = self.raw(self.varint())
+            strings.append(text.decode('utf-8') if kind == _UNICODE else text)
+        self.__strings = strings
+
+    def raw(self, size):
+        start = self.__pos
+        self.__pos += size
+        if self.__pos > len(self.__data):
+            raise ProjectSnapshot.SnapshotError("Unexpected end of section.")
+        return self.__data[start:self.__pos]
+
+    def varint(self):
+        data = self.__data
+        pos = self.__pos
+        size = len(data)
+        number = 0
+        shift = 0
+        while True:
+            if pos >= size:
+                raise ProjectSnapshot.SnapshotError("Unexpected end of section.")
+            byte = ord(data[pos])
+            pos += 1
+            number |= (byte & 0x7f) << shift
+            if byte < 128:
+                break
+            shift += 7
+        self.__pos = pos
+        return number
+
+    def string(self):
+        index = self.varint()
+        if index >= len(self.__strings):
+            raise ProjectSnapshot.SnapshotError("String index {0} out of table.".format(index))
+        return self.__strings[index]
+
+    def value(self):
+        tag = self.raw(1)
+        if tag == _STR:
+            return self.string()
+        if tag == _NONE:
+            return None
+        if tag == _TRUE:
+            return True
+        if tag == _FALSE:
+            return False
+        if tag == _INT:
+            number = self.varint()
+            return number >> 1 if not number & 1 else -((number + 1) >> 1)
+        if tag == _FLOAT:
+            return _DOUBLE.unpack(self.raw(_DOUBLE.size))[0]
+        if tag == _LIST:
+            return [self.value() for _ in xrange(self.varint())]
+        if tag == _DICT:
+            return self.mapping()
+        if tag == _DATETIME:
+            return datetime(*[self.varint() for _ in xrange(7)])
+        raise ProjectSnapshot.SnapshotError("Unknown value tag {0!r}.".format(tag))
+
+    def mapping(self):
+        params = {}
+        for _ in xrange(self.varint()):
+            key = self.string()
+            params[key] = self.value()
+        return params
+
+
+def _write_properties(writer, properties):
+    if properties is None:
+        writer.raw(_NONE)
+    else:
+        writer.raw(_DICT)
+        writer.string(properties.name)
+        writer.mapping(properties.params)
+
+
+def _read_properties(reader):
+    if reader.raw(1) == _NONE:
+        return None
+    name = reader.string()
+    return Properties(name, reader.mapping())
+
+
+def _write_flow(writer, flow):
+    """ name, params, properties, finish command, jobs and edges. (subflows recursively)
+    """
+    writer.string(flow.name)
+    writer.mapping(flow.params)
+    _write_properties(writer, flow.properties)
+    finish_command = flow.finish_command
+    writer.string(finish_command.name)
+    writer.mapping(finish_command.params)
+    indices = {finish_command: 0}
+    jobs = [job for job in flow.jobs if job is not finish_command]
+    writer.varint(len(jobs))
+    for job in jobs:
+        indices[job] = len(indices)
+        if isinstance(job, Flow):
+            writer.raw(_FLOW)
+            _write_flow(writer, job)
+        elif isinstance(job, Command):
+            writer.raw(_COMMAND)
+            writer.string(job.name)
+            writer.mapping(job.params)
+        else:
+            raise TypeError("{0} is not Command and Flow.".format(job))
+    edges = flow.jobs.edges()
+    writer.varint(len(edges))
+    for previous_job, next_job in edges:
+        writer.varint(indices[previous_job])
+        writer.varint(indices[next_job])
+
+
+def _read_flow(reader):
+    name = reader.string()
+    params = reader.mapping()
+    flow = Flow(name, params, properties=_read_properties(reader))
+    finish_name = reader.string()
+    finish_command = Command(finish_name, reader.mapping())
+    jobs = []
+    for _ in xrange(reader.varint()):
+        if reader.raw(1) == _FLOW:
+            jobs.append(_read_flow(reader))
+        else:
+            job_name = reader.string()
+            jobs.append(Command(job_name, reader.mapping()))
+    nodes = [finish_command] + jobs
+    edges = [(nodes[reader.varint()], nodes[reader.varint()]) for _ in xrange(reader.varint())]
+    flow._restore(finish_command, jobs, edges)
+    return flow
+
+
+def save(project, path):
+    """ Write project snapshot. (replaced atomically)
+
+    :type project: Project
+    :param path: Snapshot file path.
+    :type path: str
+    :return: path
+    :raises TypeError: Unsupported parameter value type.
+    """
+    sections = []
+    index = []
+    offset = 0
+    for flow in sorted(project.flows, key=lambda f: f.name):
+        writer = _Writer()
+        _write_flow(writer, flow)
+        section = writer.getvalue()
+        sections.append(section)
+        index.append(FlowIndex(flow.name, offset, len(section), zlib.crc32(section) & 0xffffffff))
+        offset += len(section)
+    writer = _Writer()
+    writer.string(project.name)
+    writer.value(project.description)
+    _write_properties(writer, project.properties)
+    writer.varint(len(project.schedules))
+    for flow_name, schedule in sorted(project.schedules.items()):
+        writer.string(flow_name)
+        writer.value(schedule.start_datetime)
+        writer.value(schedule.recurring_period)
+    writer.varint(len(index))
+    for entry in index:
+        writer.string(entry.name)
+        for number in entry[1:]:
+            writer.varint(number)
+    header = writer.getvalue()
+    tmp_path = "{0}.tmp".format(path)
+    with open(tmp_path, 'wb') as f:
+        f.write(_PREFIX.pack(MAGIC, VERSION, len(header), zlib.crc32(header) & 0xffffffff))
+        f.write(header)
+        for section in sections:
+            f.write(section)
+    os.rename(tmp_path, path)
+    return path
+
+
+def load(path, flows=None):
+    """ Read project snapshot.
+
+    :param path: Snapshot file path.
+    :type path: str
+    :param flows: Names of flows to load. (default: all)
+    :type flows: list
+    :rtype: Project
+    :raises ProjectSnapshot.SnapshotError: Broken or unsupported snapshot.
+    """
+    return ProjectSnapshot(path).load_project(flows)
+
+
+class ProjectSnapshot(object):
+    """ Snapshot file whose flows are loaded on demand.
+    """
+
+    def __init__(self, path):
+        """ Read and verify the header.
+
+        :param path: Snapshot file path.
+        :type path: str
+        :raises ProjectSnapshot.SnapshotError: Broken or unsupported snapshot.
+        """
+        self.path = path
+        with open(path, 'rb') as f:
+            prefix = f.read(_PREFIX.size)
+            if len(prefix) != _PREFIX.size or prefix[:len(MAGIC)] != MAGIC:
+                raise self.SnapshotError("{0} is not Azusa snapshot.".format(path))
+            magic, version, header_length, header_crc32 = _PREFIX.unpack(prefix)
+            if version != VERSION:
+                raise self.SnapshotError("Unsupported snapshot version {0}. (supported: {1})".format(version, VERSION))
+            header = f.read(header_length)
+        if len(header) != header_length or zlib.crc32(header) & 0xffffffff != header_crc32:
+            raise self.SnapshotError("Header of {0} is broken.".format(path))
+        self.__base_offset = _PREFIX.size + header_length
+        reader = _Reader(header)
+        self.name = reader.string()
+        self.description = reader.value()
+        self.properties = _read_properties(reader)
+        self.schedules = {}
+        for _ in xrange(reader.varint()):
+            flow_name = reader.string()
+            start_datetime = reader.value()
+            self.schedules[flow_name] = Schedule(start_datetime, reader.value())
+        self.__index = collections.OrderedDict()
+        for _ in xrange(reader.varint()):
+            entry = FlowIndex(reader.string(), reader.varint(), reader.varint(), reader.varint())
+            self.__index[entry.name] = entry
+
+    @property
+    def flow_names(self):
+        """ Names of flows in the snapshot.
+
+        :rtype: list
+        """
+        return list(self.__index)
+
+    def load_flow(self, name):
+        """ Read and verify one flow section.
+
+        :param name: Flow name.
+        :type name: str
+        :rtype: Flow
+        :raises KeyError: Unknown flow.
+        :raises ProjectSnapshot.SnapshotError: Broken section.
+        """
+        entry = self.__index[name]
+        with open(self.path, 'rb') as f:
+            f.seek(self.__base_offset + entry.offset)
+            section = f.read(entry.length)
+        if len(section) != entry.length or zlib.crc32(section) & 0xffffffff != entry.crc32:
+            raise self.SnapshotError("Flow {0} in {1} is broken.".format(name, self.path))
+        return _read_flow(_Reader(section))
+
+    def load_project(self, flows=None):
+        """ Project with the given flows.
+
+        :param flows: Names of flows to load. (default: all)
+        :type flows: list
+        :rtype: Project
+        """
+        project = Project(self.name, self.description, properties=self.properties)
+        for name in (self.flow_names if flows is None else flows):
+            project.add_flow(self.load_flow(name), schedule=self.schedules.get(name))
+        return project
+
+    class SnapshotError(Exception):
+        """ Broken or unsupported snapshot file.
+        """
+        pass
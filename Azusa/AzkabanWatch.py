@@ -0,0 +1,180 @@
+#!/usr/local/bin/python2.7
+"""
+    Watch mode: rebuild and re-upload only what changed in project definition modules.
+
+    Modules are polled by mtime. When one changes it is re-executed, and every flow gets
+    a graph signature (job paths and parameters). Only flows whose signature changed are
+    rendered again, the rest of the zip comes from the cache, and only projects with
+    changed files are uploaded.
+
+    Only the watched files themselves are reloaded; modules imported by them are not.
+
+    :copyright: 2015, Tasuku OKUDA.
+"""
+
+import hashlib
+import os
+import time
+import zipfile
+
+from AzkabanDeploy import load_module, load_projects
+from AzkabanSchedule import ScheduleReconciler
+
+
+def flow_signature(entries):
+    """ Signature of flow files without rendering them. (independent of graph iteration order)
+
+    :param entries: Project.flow_entries result.
+    :type entries: list
+    :rtype: str
+    """
+    digest = hashlib.sha1()
+    for path, azkaban_file in sorted(entries, key=lambda entry: entry[0]):
+        digest.update(path)
+        digest.update('\0')
+        for key, value in sorted(azkaban_file.params.items()):
+            digest.update("{0!r}={1!r}\0".format(key, value))
+    return digest.hexdigest()
+
+
+class Watcher(object):
+    """ Incremental builder and uploader for project definition modules.
+    """
+
+    def __init__(self, api, module_refs, out_dir='.azusa', interval=1.0, schedule=False):
+        """
+        :param api: Logged-in AjaxAPI.
+        :type api: AzkabanWeb.AjaxAPI
+        :param module_refs: Definition module paths.
+        :type module_refs: list
+        :param out_dir: Directory for built zips.
+        :type out_dir: str
+        :param interval: Polling interval seconds.
+        :type interval: float
+        :param schedule: Create and update Project.schedules after upload. (never removes schedules)
+        :type schedule: bool
+        """
+        self.api = api
+        self.module_refs = list(module_refs)
+        self.out_dir = out_dir
+        self.interval = interval
+        self.schedule = schedule
+        self.__paths = {}
+        self.__mtimes = {}
+        self.__cache = {}
+
+    def poll(self):
+        """ Modules modified since the last poll. (all modules at first)
+
+        :rtype: list
+        """
+        changed = []
+        for module_ref in self.module_refs:
+            path = self.__path(module_ref)
+            mtime = os.stat(path).st_mtime
+            if self.__mtimes.get(module_ref) != mtime:
+                self.__mtimes[module_ref] = mtime
+                changed.append(module_ref)
+        return changed
+
+    def __path(self, module_ref):
+        if module_ref not in self.__paths:
+            path = module_ref
+            if not os.path.exists(path):
+                path = load_module(module_ref).__file__
+                if path.endswith('.pyc'):
+                    path = path[:-1]
+            self.__paths[module_ref] = path
+        return self.__paths[module_ref]
+
+    def rebuild(self, module_ref):
+        """ Reload module and update zips of its projects incrementally.
+
+        :return: (project, changed flow names, zip path or None if nothing changed) list.
+        :rtype: list
+        """
+        rebuilt = []
+        for project in load_projects(load_module(module_ref, force_reload=True)):
+            cache = self.__cache.setdefault(project.name, {'flows': {}, 'properties': None})
+            changed_flows = []
+            flows = {}
+            for flow in sorted(project.flows, key=lambda f: f.name):
+                entries = project.flow_entries(flow)
+                signature = flow_signature(entries)
+                cached = cache['flows'].get(flow.name)
+                if cached is not None and cached[0] == signature:
+                    flows[flow.name] = cached
+                else:
+                    flows[flow.name] = (signature, [(path, f.text) for path, f in entries])
+                    changed_flows.append(flow.name)
+            removed = set(cache['flows']) - set(flows)
+            properties = None
+            if project.properties is not None:
+                properties = (os.path.join(project.name, project.properties.filename), project.properties.text)
+            if not changed_flows and not removed and properties == cache['properties']:
+                rebuilt.append((project, [], None))
+                continue
+            cache['flows'] = flows
+            cache['properties'] = properties
+            rebuilt.append((project, sorted(changed_flows + list(removed)), self.__write_zip(project.filename, cache)))
+        return rebuilt
+
+    def __write_zip(self, filename, cache):
+        if not os.path.exists(self.out_dir):
+            os.makedirs(self.out_dir)
+        filepath = os.path.join(self.out_dir, filename)
+        with zipfile.ZipFile(filepath, mode='w') as project_zip:
+            for flow_name in sorted(cache['flows']):
+                for path, text in cache['flows'][flow_name][1]:
+                    project_zip.writestr(path, text)
+            if cache['properties'] is not None:
+                project_zip.writestr(*cache['properties'])
+        return filepath
+
+    def run_once(self):
+        """ Poll, rebuild and upload changed projects.
+
+        :return: (project name, changed flow names) list of uploaded projects.
+        :rtype: list
+        """
+        uploaded = []
+        for module_ref in self.poll():
+            try:
+                rebuilt = self.rebuild(module_ref)
+            except Exception as e:
+                self.api.logger.error("Cannot build %s: %r", module_ref, e)
+                continue
+            for project, changed_flows, zip_path in rebuilt:
+                if zip_path is None:
+                    self.api.logger.info("%s: no changes", project.name)
+                    continue
+                start = time.time()
+                try:
+                    self.api.create_project(project.name, project.description, if_not_exists=True)
+                    project_id = self.api.upload_project(project.name, zip_path)['projectId']
+                    if self.schedule:
+                        reconciler = ScheduleReconciler(self.api)
+                        changes = reconciler.plan([project], prune=False)
+                        for change, result in reconciler.apply(changes, project_ids={project.name: project_id}):
+                            if isinstance(result, Exception):
+                                raise result
+                except Exception as e:
+                    self.api.logger.error("Cannot deploy %s: %r", project.name, e)
+                    self.__cache.pop(project.name, None)
+                    self.__mtimes.pop(module_ref, None)
+                    continue
+                self.api.logger.info("%s: deployed %s in %.3fs", project.name, ', '.join(changed_flows),
+                                     time.time() - start)
+                uploaded.append((project.name, changed_flows))
+        return uploaded
+
+    def run(self):
+        """ Watch until KeyboardInterrupt.
+        """
+        self.api.logger.info("Watching %s", ', '.join(self.module_refs))
+        try:
+            while True:
+                self.run_once()
+                time.sleep(self.interval)
+        except KeyboardInterrupt:
+            pass
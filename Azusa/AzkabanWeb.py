@@ -19,6 +19,9 @@ from urlparse import urljoin
 import os
 from getpass import getpass
 import argparse
+import threading
+import time
+from AzkabanMetrics import Instrument
 
 
 def parse_arguments():
@@ -42,13 +45,15 @@ def parse_arguments():
     return args
 
 
+_LOGGER_LOCK = threading.Lock()
+
 
 class AjaxAPI(object):
     """ Azkaban Ajax API Wrapper.
     http://azkaban.github.io/azkaban/docs/2.5/#ajax-api
     """
 
-    def __init__(self, base_url, username, password, log_level="INFO"):
+    def __init__(self, base_url, username, password, log_level="INFO", instrument=None):
         """
         :param base_url: Azkaban API base URL, such as https://hostname:port/
         :type base_url: str
@@ -58,8 +63,11 @@ class AjaxAPI(object):
         :type password: str
         :param log_level: Log level to output stdout
         :type log_level: str
+        :param instrument: Hooks called around every request. (such as AzkabanMetrics.MetricsCollector)
+        :type instrument: AzkabanMetrics.Instrument
 
         """
+        self.instrument = instrument or Instrument()
         self.logger = self.__get_stdout_logger(__name__, log_level)
         self.logger.info("URL: {0}".format(base_url))
         self.__base_url = base_url
@@ -98,16 +106,16 @@ class AjaxAPI(object):
         }
         self.logger.debug(api_url)
 
-        res = requests.post(api_url, data=payload)
-        res.raise_for_status()
-        if 'error' in res.json():
+        res = self.__request('login', 'post', api_url, data=payload)
+        body = res.json()
+        if 'error' in body:
             self.logger.error("Login Error")
-            self.logger.error(res.json()['error'])
-            raise self.AzkabanLoginError(res.json()['error'])
+            self.logger.error(body['error'])
+            raise self.__failed('login', self.AzkabanLoginError(body['error']))
         else:
             self.logger.info("Success: Login %s with user %s", self.base_url, username)
-            self.logger.debug(res.json())
-            return res.json()
+            self.logger.debug(body)
+            return body
 
     def create_project(self, project_name, description, if_not_exists=False):
         """ Create New Azkaban Project.
@@ -135,19 +143,19 @@ class AjaxAPI(object):
         }
         self.logger.debug("%s data:%s", api_url, payload)
 
-        res = requests.post(api_url, data=payload)
-        res.raise_for_status()
-        if res.json()['status'] == 'error':
-            if if_not_exists and re.match(r"Active project with name .+ already exists in db\.", res.json()['message']):
+        res = self.__request('create', 'post', api_url, data=payload)
+        body = res.json()
+        if body['status'] == 'error':
+            if if_not_exists and re.match(r"Active project with name .+ already exists in db\.", body['message']):
                 self.logger.warning("Skip creating project %s because it already exists.", project_name)
-                return res.json()
+                return body
             self.logger.error("Cannot create project")
-            self.logger.error(res.json())
-            raise self.AjaxAPIError(res.json()['message'])
+            self.logger.error(body)
+            raise self.__failed('create', self.AjaxAPIError(body['message']))
         else:
             self.logger.info("Success: Create project - %s", project_name)
-            self.logger.debug(res.json())
-            return res.json()
+            self.logger.debug(body)
+            return body
 
     def upload_project(self, project_name, zip_file_path):
         """ Upload a project zip file to existing Azkaban project.
@@ -174,19 +182,20 @@ class AjaxAPI(object):
             'ajax': 'upload',
             'project': project_name
         }
-        files = {'file': ('jobs.zip', open(zip_file_path, 'rb'), 'application/x-zip-compressed')}
         self.logger.debug("%s data:%s", api_url, payload)
 
-        res = requests.post(api_url, data=payload, files=files)
-        res.raise_for_status()
-        if 'error' in res.json():
+        with open(zip_file_path, 'rb') as zip_file:
+            files = {'file': ('jobs.zip', zip_file, 'application/x-zip-compressed')}
+            res = self.__request('upload', 'post', api_url, data=payload, files=files)
+        body = res.json()
+        if 'error' in body:
             self.logger.error("Cannot upload project")
-            self.logger.error(res.json())
-            raise self.AjaxAPIError(res.json()['error'])
+            self.logger.error(body)
+            raise self.__failed('upload', self.AjaxAPIError(body['error']))
         else:
             self.logger.info("Success: Upload project - %s", project_name)
-            self.logger.debug(res.json())
-            return res.json()
+            self.logger.debug(body)
+            return body
 
     def fetch_project_flows(self, project_name):
         """
@@ -210,16 +219,16 @@ class AjaxAPI(object):
         }
         self.logger.debug("%s data:%s", api_url, payload)
 
-        res = requests.get(api_url, params=payload)
-        res.raise_for_status()
-        if 'error' in res.json():
+        res = self.__request('fetchprojectflows', 'get', api_url, params=payload)
+        body = res.json()
+        if 'error' in body:
             self.logger.error("Cannot fetch project flows")
-            self.logger.error(res.json()['error'])
-            raise self.AjaxAPIError(res.json()['error'])
+            self.logger.error(body['error'])
+            raise self.__failed('fetchprojectflows', self.AjaxAPIError(body['error']))
         else:
             self.logger.info("Sucecss: Fetch project flow - %s", project_name)
-            self.logger.debug(res.json())
-            return res.json()
+            self.logger.debug(body)
+            return body
 
     def fetch_flow_jobs(self, project_name, flow_name):
         """
@@ -252,18 +261,18 @@ class AjaxAPI(object):
         }
         self.logger.debug("%s data:%s", api_url, payload)
 
-        res = requests.get(api_url, params=payload)
-        res.raise_for_status()
-        if 'error' in res.json():
+        res = self.__request('fetchflowgraph', 'get', api_url, params=payload)
+        body = res.json()
+        if 'error' in body:
             self.logger.error("Cannot fetch flow jobs")
-            self.logger.error(res.json()['error'])
-            raise self.AjaxAPIError(res.json()['error'])
+            self.logger.error(body['error'])
+            raise self.__failed('fetchflowgraph', self.AjaxAPIError(body['error']))
         else:
             self.logger.info("Sucecss: Fetch flow jobs - %s", project_name)
-            self.logger.debug(res.json())
-            return res.json()
+            self.logger.debug(body)
+            return body
 
-    def schedule_flow(self, project_name, flow_name, start_datetime, recurring_period=None):
+    def schedule_flow(self, project_name, flow_name, start_datetime, recurring_period=None, project_id=None):
         """ Set existing flow to new schedule.
 
         If any schedule already set a flow, overwrite new one.
@@ -277,6 +286,8 @@ class AjaxAPI(object):
         :param recurring_period: Specifies the recursion period.
             Possible Values: M/Month, w/Weeks, d/Days, h/Hours, m/Minutes, s/Seconds
         :type recurring_period: str
+        :param project_id: The numerical id of the project. (fetched by fetch_flow_jobs if None)
+        :type project_id: int
         :return: Response json.
 
             :status: The status of attempt.
@@ -287,10 +298,11 @@ class AjaxAPI(object):
         """
         schedule_time = start_datetime.strftime('%I,%M,%p,JST')
         schedule_date = start_datetime.strftime('%m/%d/%Y')
-        flow_jobs = self.fetch_flow_jobs(project_name, flow_name)
-        project_id = flow_jobs['projectId']
-        for job in flow_jobs['nodes']:
-            self.logger.info("Jobs: %s", job)
+        if project_id is None:
+            flow_jobs = self.fetch_flow_jobs(project_name, flow_name)
+            project_id = flow_jobs['projectId']
+            for job in flow_jobs['nodes']:
+                self.logger.info("Jobs: %s", job)
 
         api_url = urljoin(self.base_url, 'schedule')
         payload = {
@@ -307,21 +319,219 @@ class AjaxAPI(object):
             payload['period'] = recurring_period
         self.logger.debug("%s data:%s", api_url, payload)
 
-        res = requests.get(api_url, params=payload)
-        res.raise_for_status()
-        if 'error' in res.json():
+        res = self.__request('scheduleFlow', 'get', api_url, params=payload)
+        body = res.json()
+        if 'error' in body:
             self.logger.error("Cannot schedule flow")
-            self.logger.error(res.json()['error'])
-            raise self.AjaxAPIError(res.json()['error'])
+            self.logger.error(body['error'])
+            raise self.__failed('scheduleFlow', self.AjaxAPIError(body['error']))
         else:
             self.logger.info("Success: Schedule flow - %s.%s", project_name, flow_name)
-            self.logger.debug(res.json())
-            return res.json()
+            self.logger.debug(body)
+            return body
+
+    def fetch_schedules(self):
+        """ Fetch all schedules in Azkaban Web Server.
+
+        :return: Schedule list. Each schedule has following keys.
+
+            :scheduleid: The numerical id of the schedule.
+            :projectid: The numerical id of the project. (not returned by Azkaban 2.5)
+            :projectname: The project name.
+            :flowname: The flow name.
+            :time: The first scheduled time. (epoch millis)
+            :period: The recursion period in millis. (0 if not recurring)
+
+        :rtype: list
+        :raises AjaxAPIError: Request is accepted successfully, but some error is occured in Azkaban Web Server.
+        """
+        api_url = urljoin(self.base_url, 'schedule')
+        payload = {
+            'session.id': self.__session_id,
+            'ajax': 'loadFlow'
+        }
+        self.logger.debug("%s data:%s", api_url, payload)
+
+        res = self.__request('loadFlow', 'get', api_url, params=payload)
+        body = res.json()
+        if 'error' in body:
+            self.logger.error("Cannot fetch schedules")
+            self.logger.error(body['error'])
+            raise self.__failed('loadFlow', self.AjaxAPIError(body['error']))
+        else:
+            self.logger.info("Success: Fetch schedules")
+            self.logger.debug(body)
+            return body.get('items', [])
+
+    def remove_schedule(self, schedule_id):
+        """ Remove existing schedule.
+
+        :param schedule_id: The numerical id of the schedule.
+        :type schedule_id: int
+        :return: Response json.
+
+            :status: The status of attempt.
+            :message: Success message.
+
+        :rtype: dict
+        :raises AjaxAPIError: Request is accepted successfully, but some error is occured in Azkaban Web Server.
+        """
+        api_url = urljoin(self.base_url, 'schedule')
+        payload = {
+            'session.id': self.__session_id,
+            'action': 'removeSched',
+            'scheduleId': schedule_id
+        }
+        self.logger.debug("%s data:%s", api_url, payload)
+
+        res = self.__request('removeSched', 'post', api_url, data=payload)
+        body = res.json()
+        if 'error' in body:
+            self.logger.error("Cannot remove schedule")
+            self.logger.error(body['error'])
+            raise self.__failed('removeSched', self.AjaxAPIError(body['error']))
+        else:
+            self.logger.info("Success: Remove schedule - %s", schedule_id)
+            self.logger.debug(body)
+            return body
+
+    def fetch_flow_executions(self, project_name, flow_name, start=0, length=25):
+        """ Fetch one page of flow execution history. (newest first)
+
+        :param project_name: The project name.
+        :type project_name: str
+        :param flow_name: The flow name.
+        :type flow_name: str
+        :param start: The start index (inclusive) of the returned list.
+        :type start: int
+        :param length: The max length of the returned list.
+        :type length: int
+        :return: Response json.
+
+            :project: The project name.
+            :projectId: The numerical id of the project.
+            :flow: The flow id.
+            :total: The total number of executions of this flow.
+            :executions: A list of execution info.
+
+                :execId: The numerical id of the execution.
+                :startTime: The start time. (epoch millis)
+                :endTime: The end time. (epoch millis, -1 if not finished)
+                :status: The status of the execution, such as SUCCEEDED.
+
+        :rtype: dict
+        :raises AjaxAPIError: Request is accepted successfully, but some error is occured in Azkaban Web Server.
+        """
+        api_url = urljoin(self.base_url, 'manager')
+        payload = {
+            'session.id': self.__session_id,
+            'ajax': 'fetchFlowExecutions',
+            'project': project_name,
+            'flow': flow_name,
+            'start': start,
+            'length': length
+        }
+        self.logger.debug("%s data:%s", api_url, payload)
+
+        res = self.__request('fetchFlowExecutions', 'get', api_url, params=payload)
+        body = res.json()
+        if 'error' in body:
+            self.logger.error("Cannot fetch flow executions")
+            self.logger.error(body['error'])
+            raise self.__failed('fetchFlowExecutions', self.AjaxAPIError(body['error']))
+        else:
+            self.logger.debug("Success: Fetch flow executions - %s.%s [%d:%d]",
+                              project_name, flow_name, start, start + length)
+            return body
+
+    def execute_flow(self, project_name, flow_name):
+        """ Execute flow now.
+
+        :param project_name: The project name.
+        :type project_name: str
+        :param flow_name: The flow name.
+        :type flow_name: str
+        :return: Response json.
+
+            :project: The project name.
+            :flow: The flow id.
+            :execid: The numerical id of the new execution.
+
+        :rtype: dict
+        :raises AjaxAPIError: Request is accepted successfully, but some error is occured in Azkaban Web Server.
+        """
+        api_url = urljoin(self.base_url, 'executor')
+        payload = {
+            'session.id': self.__session_id,
+            'ajax': 'executeFlow',
+            'project': project_name,
+            'flow': flow_name
+        }
+        self.logger.debug("%s data:%s", api_url, payload)
+
+        res = self.__request('executeFlow', 'get', api_url, params=payload)
+        body = res.json()
+        if 'error' in body:
+            self.logger.error("Cannot execute flow")
+            self.logger.error(body['error'])
+            raise self.__failed('executeFlow', self.AjaxAPIError(body['error']))
+        else:
+            self.logger.info("Success: Execute flow - %s.%s (execid=%s)", project_name, flow_name, body.get('execid'))
+            return body
+
+    def fetch_execution(self, exec_id):
+        """ Fetch a running or finished execution with its job statuses.
+
+        :param exec_id: The numerical id of the execution.
+        :type exec_id: int
+        :return: Response json.
+
+            :execid: The numerical id of the execution.
+            :project: The project name.
+            :flow: The flow id.
+            :status: The status of the execution.
+            :startTime: The start time. (epoch millis)
+            :endTime: The end time. (epoch millis, -1 if not finished)
+            :nodes: A list of job info. (id, status, startTime, endTime)
+
+        :rtype: dict
+        :raises AjaxAPIError: Request is accepted successfully, but some error is occured in Azkaban Web Server.
+        """
+        api_url = urljoin(self.base_url, 'executor')
+        payload = {
+            'session.id': self.__session_id,
+            'ajax': 'fetchexecflow',
+            'execid': exec_id
+        }
+        self.logger.debug("%s data:%s", api_url, payload)
+
+        res = self.__request('fetchexecflow', 'get', api_url, params=payload)
+        body = res.json()
+        if 'error' in body:
+            self.logger.error("Cannot fetch execution")
+            self.logger.error(body['error'])
+            raise self.__failed('fetchexecflow', self.AjaxAPIError(body['error']))
+        else:
+            self.logger.debug("Success: Fetch execution - %s (%s)", exec_id, body.get('status'))
+            return body
 
     def fetch_all_project_list(self):
         """ Fetch the list of projects in specified Azkaban Web Server.
 
         :return: Project list.
+        :rtype: list
+        """
+        return [project['name'] for project in self.fetch_project_index()]
+
+    def fetch_project_index(self):
+        """ Fetch all projects with their last modification from the project list page.
+
+        :return: Project list. Each project has following keys.
+
+            :name: The project name.
+            :description: The project description.
+            :last_modified: Text such as '2015-06-01 10:00:00 by azkaban'. (in seconds, so uploads within one second look the same)
+
         :rtype: list
         """
         api_url = urljoin(self.base_url, 'index?all')
@@ -330,18 +540,73 @@ class AjaxAPI(object):
         }
         self.logger.debug("%s data:%s", api_url, payload)
 
-        res = requests.get(api_url, cookies=payload)
-        res.raise_for_status()
+        res = self.__request('index', 'get', api_url, cookies=payload)
         html = res.text
         soup = BeautifulSoup(html)
-        li_list = soup.find('ul', id='project-list').find_all('li')
-        project_list = [li.find('div', {'class': 'project-info'}).find('h4').string for li in li_list]
-        return project_list
+        projects = []
+        for li in soup.find('ul', id='project-list').find_all('li'):
+            info = li.find('div', {'class': 'project-info'})
+            description = info.find('p', {'class': 'project-description'})
+            last_modified = info.find('p', {'class': 'project-last-modified'})
+            projects.append({
+                'name': info.find('h4').string,
+                'description': description.get_text() if description is not None else None,
+                'last_modified': ' '.join(strong.get_text() for strong in last_modified.find_all('strong'))
+                if last_modified is not None else None
+            })
+        return projects
+
+    def __request(self, endpoint, method, api_url, **kwargs):
+        """ Send HTTP request and report it to the instrument.
+
+        :param endpoint: API action name for metrics.
+        :type endpoint: str
+        :param method: HTTP method. ('get' or 'post')
+        :type method: str
+        :param api_url: Request URL.
+        :type api_url: str
+        :param kwargs: Keyword arguments for requests.
+        :return: Response. (HTTP status is already checked)
+        :rtype: requests.Response
+        :raises requests.RequestException: Transport error or HTTP error status.
+        """
+        start = time.time()
+        res = None
+        error = None
+        try:
+            res = requests.request(method, api_url, **kwargs)
+            res.raise_for_status()
+            return res
+        except requests.RequestException as e:
+            error = type(e).__name__
+            raise
+        finally:
+            body = res.request.body if res is not None else None
+            self.instrument.on_request(endpoint, time.time() - start,
+                                       len(body) if body is not None else 0,
+                                       len(res.content) if res is not None else 0,
+                                       error)
+
+    def __failed(self, endpoint, error):
+        """ Report Azkaban error response to the instrument.
+
+        :param endpoint: API action name for metrics.
+        :type endpoint: str
+        :param error: The exception to be raised.
+        :type error: Exception
+        :return: error
+        :rtype: Exception
+        """
+        self.instrument.on_error(endpoint, error)
+        return error
 
     @staticmethod
     def __get_stdout_logger(logger_name, log_level_str):
         """ Get logger with stdout stream handler.
 
+        The handler is attached once per logger and shared by all AjaxAPI objects,
+        the latest log_level is applied to it.
+
         :param logger_name: Logger identified name
         :type logger_name: str
         :param log_level_str: logger output level. (DEBUG, INFO, WARNING, ERROR)
@@ -352,10 +617,14 @@ class AjaxAPI(object):
         log_level = getattr(logging, log_level_str.upper())
         root_logger = logging.getLogger(logger_name)
         root_logger.setLevel(logging.DEBUG)
-        stdout_handler = logging.StreamHandler(sys.stdout)
-        stdout_handler.setLevel(log_level)
-        stdout_handler.setFormatter(logging.Formatter("[%(asctime)s] %(name)s [%(levelname)s] %(message)s"))
-        root_logger.addHandler(stdout_handler)
+        with _LOGGER_LOCK:
+            stdout_handler = next((h for h in root_logger.handlers if getattr(h, '_azusa_stdout', False)), None)
+            if stdout_handler is None:
+                stdout_handler = logging.StreamHandler(sys.stdout)
+                stdout_handler._azusa_stdout = True
+                stdout_handler.setFormatter(logging.Formatter("[%(asctime)s] %(name)s [%(levelname)s] %(message)s"))
+                root_logger.addHandler(stdout_handler)
+            stdout_handler.setLevel(log_level)
         return root_logger
 
     class AzkabanLoginError(Exception):
@@ -16,7 +16,11 @@ setup(
         "networkx",
         "requests",
     ],
-    extra_requires={
-        'doc': ['sphinx', 'sphinx_rtd_theme']
+    entry_points={
+        'console_scripts': ['azusa = Azusa.AzkabanCLI:main']
+    },
+    extras_require={
+        'doc': ['sphinx', 'sphinx_rtd_theme'],
+        'history': ['numpy']
     }
 )
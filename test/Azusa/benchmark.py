@@ -0,0 +1,227 @@
+#!/usr/local/bin/python2.7
+
+# Azusa benchmark suite.
+#
+# Measures Flow construction, job text rendering, Project.create_zipfile and
+# AjaxAPI round trips (against FakeAzkabanServer) on synthetic projects, and writes the results as JSON.
+#
+#   python benchmark.py                                 # all cases, shapes and scales
+#   python benchmark.py --scales 100,10000 --cases build,render
+#   python benchmark.py --output new.json --compare old.json
+#
+# Each case runs in its own process, so 'peak_rss_kb' is the peak memory of that
+# case only (ru_maxrss of the child) and a slow case can be cut by --timeout.
+
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '../../'))
+
+import argparse
+import json
+import multiprocessing
+import platform
+import resource
+import shutil
+import tempfile
+import time
+from datetime import datetime
+
+from Azusa import AzkabanWeb, AzkabanJob
+from Azusa.AzkabanFakeWeb import FakeAzkabanServer
+
+SCALES = [100, 10000, 100000]
+SHAPES = ['chain', 'fanout', 'diamond', 'nested']
+CASES = ['build', 'render', 'zip', 'api']
+NESTED_GROUP = 10
+
+
+def create_chain(n):
+    """ start -> 1 -> 2 -> ... -> n """
+    flow = AzkabanJob.Flow('chain')
+    previous = None
+    for i in xrange(n):
+        command = flow.register_command(AzkabanJob.Command('chain_{0}'.format(i), {'command': 'echo {0}'.format(i)}))
+        if previous is not None:
+            flow.set_dependencies(previous, command)
+        previous = command
+    return flow
+
+
+def create_fanout(n):
+    """ one root job followed by n - 1 independent jobs """
+    flow = AzkabanJob.Flow('fanout')
+    root = flow.register_command(AzkabanJob.Command('fanout_root', {'command': 'echo root'}))
+    for i in xrange(n - 1):
+        command = flow.register_command(AzkabanJob.Command('fanout_{0}'.format(i), {'command': 'echo {0}'.format(i)}))
+        flow.set_dependencies(root, command)
+    return flow
+
+
+def create_diamond(n):
+    """ chained diamonds: top -> (left, right) -> bottom -> (left, right) -> ... """
+    flow = AzkabanJob.Flow('diamond')
+    top = flow.register_command(AzkabanJob.Command('diamond_0', {'command': 'echo 0'}))
+    i = 1
+    while i + 3 <= n:
+        left, right, bottom = [
+            flow.register_command(AzkabanJob.Command('diamond_{0}'.format(i + k), {'command': 'echo {0}'.format(i + k)}))
+            for k in xrange(3)]
+        flow.set_dependencies(top, left)
+        flow.set_dependencies(top, right)
+        flow.set_dependencies(left, bottom)
+        flow.set_dependencies(right, bottom)
+        top = bottom
+        i += 3
+    return flow
+
+
+def create_nested(n):
+    """ chain of subflows, each holding a chain of sub-subflows of NESTED_GROUP commands """
+    flow = AzkabanJob.Flow('nested')
+    leaves = []
+    for i in xrange(0, n, NESTED_GROUP):
+        leaf = AzkabanJob.Flow('leaf_{0}'.format(i))
+        previous = None
+        for j in xrange(i, min(i + NESTED_GROUP, n)):
+            command = leaf.register_command(AzkabanJob.Command('nested_{0}'.format(j), {'command': 'echo {0}'.format(j)}))
+            if previous is not None:
+                leaf.set_dependencies(previous, command)
+            previous = command
+        leaves.append(leaf)
+    previous = None
+    for i in xrange(0, len(leaves), NESTED_GROUP):
+        middle = AzkabanJob.Flow('middle_{0}'.format(i))
+        previous_leaf = None
+        for leaf in leaves[i:i + NESTED_GROUP]:
+            middle.register_subflow(leaf)
+            if previous_leaf is not None:
+                middle.set_dependencies(previous_leaf, leaf)
+            previous_leaf = leaf
+        flow.register_subflow(middle)
+        if previous is not None:
+            flow.set_dependencies(previous, middle)
+        previous = middle
+    return flow
+
+
+def create_project(shape, n):
+    project = AzkabanJob.Project('bench_{0}_{1}'.format(shape, n), "Azusa benchmark project",
+                                 properties={'PROJECT_NAME': 'bench'})
+    project.add_flow(globals()['create_{0}'.format(shape)](n))
+    return project
+
+
+def iter_jobs(flow):
+    for job in flow.jobs:
+        yield job
+        if isinstance(job, AzkabanJob.Flow):
+            for sub_job in iter_jobs(job):
+                yield sub_job
+
+
+def run_case(case, shape, n):
+    """ Run one case and return elapsed seconds of the measured part. """
+    if case == 'build':
+        start = time.time()
+        create_project(shape, n)
+        return time.time() - start
+    project = create_project(shape, n)
+    if case == 'render':
+        start = time.time()
+        for flow in project:
+            for job in iter_jobs(flow):
+                job.text
+        return time.time() - start
+    out_dir = tempfile.mkdtemp(prefix='azusa_bench_')
+    try:
+        start = time.time()
+        zip_path = project.create_zipfile(out_dir)
+        elapsed = time.time() - start
+        if case == 'zip':
+            return elapsed
+        with FakeAzkabanServer() as server:
+            start = time.time()
+            api = AzkabanWeb.AjaxAPI(server.url, 'bench', 'bench', log_level='WARNING')
+            api.create_project(project.name, project.description, if_not_exists=True)
+            api.upload_project(project.name, zip_path)
+            for flow in project:
+                api.fetch_project_flows(project.name)
+                api.schedule_flow(project.name, flow.name, datetime(2015, 5, 30, 10, 0, 0), recurring_period='1d')
+            return time.time() - start
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+
+
+def _child(queue, case, shape, n):
+    setup_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    try:
+        seconds = run_case(case, shape, n)
+        queue.put({'status': 'ok', 'seconds': seconds,
+                   'base_rss_kb': setup_rss,
+                   'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss})
+    except Exception as e:
+        queue.put({'status': 'error', 'error': repr(e)})
+
+
+def measure(case, shape, n, timeout):
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_child, args=(queue, case, shape, n))
+    process.start()
+    process.join(timeout)
+    if process.is_alive():
+        process.terminate()
+        process.join()
+        result = {'status': 'timeout', 'timeout': timeout}
+    elif queue.empty():
+        result = {'status': 'error', 'error': 'exit code {0}'.format(process.exitcode)}
+    else:
+        result = queue.get()
+    result.update({'case': case, 'shape': shape, 'scale': n})
+    return result
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = dict(((r['case'], r['shape'], r['scale']), r) for r in json.load(f)['results'])
+    print "{0:<8} {1:<8} {2:>7} {3:>10} {4:>10} {5:>7}".format('case', 'shape', 'scale', 'base[s]', 'new[s]', 'ratio')
+    for r in results:
+        old = baseline.get((r['case'], r['shape'], r['scale']))
+        if old is None or old['status'] != 'ok' or r['status'] != 'ok':
+            continue
+        print "{0:<8} {1:<8} {2:>7} {3:>10.3f} {4:>10.3f} {5:>7.2f}".format(
+            r['case'], r['shape'], r['scale'], old['seconds'], r['seconds'], r['seconds'] / max(old['seconds'], 1e-9))
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Azusa benchmark suite")
+    parser.add_argument('--scales', default=','.join(map(str, SCALES)), help="comma separated job counts")
+    parser.add_argument('--shapes', default=','.join(SHAPES), help="comma separated DAG shapes")
+    parser.add_argument('--cases', default=','.join(CASES), help="comma separated cases")
+    parser.add_argument('--timeout', type=float, default=600, help="seconds per case")
+    parser.add_argument('--output', default='bench_output.json', help="result JSON path")
+    parser.add_argument('--compare', default=None, help="previous result JSON to compare with")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    results = []
+    for n in [int(x) for x in args.scales.split(',')]:
+        for shape in args.shapes.split(','):
+            for case in args.cases.split(','):
+                result = measure(case, shape, n, args.timeout)
+                results.append(result)
+                print "{0:<8} {1:<8} {2:>7} {3:<8} {4}".format(
+                    case, shape, n, result['status'],
+                    "{0:.3f}s {1}KB".format(result['seconds'], result['peak_rss_kb']) if result['status'] == 'ok' else '')
+    with open(args.output, 'w') as f:
+        json.dump({'meta': {'python': platform.python_version(),
+                            'platform': platform.platform(),
+                            'cpus': multiprocessing.cpu_count(),
+                            'created': datetime.now().isoformat()},
+                   'results': results}, f, indent=2)
+    if args.compare:
+        compare(results, args.compare)
+
+if __name__ == "__main__":
+    main()
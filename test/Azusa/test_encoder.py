@@ -0,0 +1,60 @@
+#!/usr/local/bin/python2.7
+# -*- coding: utf-8 -*-
+
+# Round trip of AzkabanEncoder: decode(encode(params)) gives back the strings Azkaban sees.
+#
+#   python test_encoder.py
+
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '../../'))
+
+import unittest
+
+from Azusa.AzkabanEncoder import decode, encode, format_value
+
+
+class RoundTripTest(unittest.TestCase):
+
+    def assertRoundTrip(self, params):
+        text = encode(params)
+        self.assertIsInstance(text, str)
+        decoded = decode(text)
+        self.assertEqual(sorted(decoded), sorted(key if isinstance(key, unicode) else key.decode('utf-8')
+                                                 for key in params))
+        for key, value in params.items():
+            expected = format_value(value)
+            if isinstance(expected, str):
+                expected = expected.decode('utf-8')
+            self.assertEqual(decoded[key if isinstance(key, unicode) else key.decode('utf-8')], expected)
+
+    def test_newlines(self):
+        self.assertRoundTrip({'command': 'echo a\nb\r\nc\rd', 'tail': 'x\n', 'crlf': '\r\n'})
+
+    def test_special_characters(self):
+        self.assertRoundTrip({'value': '=:#!\\', 'end': 'ends with \\', 'tab': 'a\tb\fc'})
+        self.assertRoundTrip({'=:#!\\ key': 'v', '#comment': '!bang'})
+
+    def test_leading_space(self):
+        self.assertRoundTrip({'one': ' a', 'many': '   a  ', 'only': ' ', 'empty': ''})
+
+    def test_non_ascii(self):
+        self.assertRoundTrip({'ja': 'ジョブ', u'キー': u'値 é'})
+
+    def test_astral(self):
+        self.assertRoundTrip({'emoji': u'\U0001f600 done', 'utf8': '\xf0\x9f\x98\x80'})
+
+    def test_bool_float_long(self):
+        self.assertRoundTrip({'flag': True, 'off': False, 'ratio': 0.1, 'big': 1e300, 'count': 10 ** 30,
+                              'negative': -(10 ** 20), 'int': 3})
+        decoded = decode(encode({'flag': True, 'ratio': 0.1, 'count': 10 ** 30}))
+        self.assertEqual(decoded['flag'], u'true')
+        self.assertEqual(float(decoded['ratio']), 0.1)
+        self.assertEqual(long(decoded['count']), 10 ** 30)
+
+    def test_list(self):
+        self.assertRoundTrip({'dependencies': ['a', 'b=c', ' d'], 'mixed': [1, True, 'x']})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,154 @@
+#!/usr/local/bin/python2.7
+
+# ExecutionTable helpers against hand-computed values, and HistoryFetcher paging against FakeAzkabanServer.
+#
+#   python test_history.py
+
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '../../'))
+
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from Azusa.AzkabanFakeWeb import FakeAzkabanServer
+from Azusa.AzkabanHistory import STATUS_CODES, ExecutionTable, HistoryFetcher
+from Azusa.AzkabanJob import Command, Flow, Project
+from Azusa.AzkabanWeb import AjaxAPI
+
+
+def create_table():
+    """ 'a' ran 1, 2, 3 and 4 seconds (succeeded, failed, failed, succeeded) starting every 10 seconds,
+    'b' ran 10 seconds once and is running again, 'c' is running only. Rows are not in start order.
+    """
+    rows = [(4, 'a', 30000, 34000, 'SUCCEEDED'),
+            (6, 'b', 40000, -1, 'RUNNING'),
+            (2, 'a', 10000, 12000, 'FAILED'),
+            (5, 'b', 5000, 15000, 'SUCCEEDED'),
+            (1, 'a', 0, 1000, 'SUCCEEDED'),
+            (7, 'c', 50000, -1, 'RUNNING'),
+            (3, 'a', 20000, 23000, 'KILLED')]
+    keys = ['a', 'b', 'c']
+    return ExecutionTable(keys, [row[0] for row in rows], [keys.index(row[1]) for row in rows],
+                          [row[2] for row in rows], [row[3] for row in rows], [STATUS_CODES[row[4]] for row in rows])
+
+
+def assertArrayEqual(actual, expected):
+    np.testing.assert_allclose(np.asarray(actual, dtype=np.float64), np.asarray(expected, dtype=np.float64))
+
+
+class ExecutionTableTest(unittest.TestCase):
+
+    def setUp(self):
+        self.table = create_table()
+
+    def test_durations(self):
+        assertArrayEqual(self.table.durations(), [4, np.nan, 2, 10, 1, np.nan, 3])
+        assertArrayEqual(self.table.counts(), [4, 1, 0])
+        self.assertEqual(list(self.table.statuses()[:2]), ['SUCCEEDED', 'RUNNING'])
+
+    def test_percentiles(self):
+        # a: sorted [1, 2, 3, 4], p50 at position 1.5 and p90 at position 2.7
+        assertArrayEqual(self.table.percentiles((0, 50, 90, 100)), [[1, 2.5, 3.7, 4],
+                                                                   [10, 10, 10, 10],
+                                                                   [np.nan] * 4])
+
+    def test_failure_rates(self):
+        assertArrayEqual(self.table.failure_rates(), [0.5, 0, np.nan])
+
+    def test_rolling_failure_rate(self):
+        # a in start order: succeeded, failed, killed, succeeded
+        assertArrayEqual(self.table.rolling_failure_rate(window=2), [0.5, np.nan, 0.5, 0, 0, np.nan, 1])
+        assertArrayEqual(self.table.rolling_failure_rate(window=3), [2 / 3.0, np.nan, 0.5, 0, 0, np.nan, 2 / 3.0])
+        # 25 seconds: from 5s at 30s, from -5s at 20s
+        assertArrayEqual(self.table.rolling_failure_rate(period=25), [2 / 3.0, np.nan, 0.5, 0, 0, np.nan, 2 / 3.0])
+        assertArrayEqual(self.table.rolling_failure_rate(period=10), [0.5, np.nan, 0.5, 0, 0, np.nan, 1])
+
+    def test_slowest(self):
+        self.assertEqual(self.table.slowest(n=5, q=50), [('b', 10.0, 1), ('a', 2.5, 4)])
+        self.assertEqual(self.table.slowest(n=1, q=0), [('b', 10.0, 1)])
+
+    def test_empty(self):
+        table = ExecutionTable.from_chunks(['a'], [])
+        self.assertEqual(len(table), 0)
+        assertArrayEqual(table.percentiles((50,)), [[np.nan]])
+        self.assertEqual(table.slowest(), [])
+        self.assertEqual(len(table.rolling_failure_rate(period=10)), 0)
+
+
+class HistoryFetcherTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.server = FakeAzkabanServer().start()
+        self.api = AjaxAPI(self.server.url, 'azkaban', 'azkaban', log_level='CRITICAL')
+        project = Project('proj', 'desc')
+        for name in ('daily', 'hourly'):
+            flow = Flow(name)
+            first = flow.register_command(Command('{0}_first'.format(name), {'command': 'echo'}))
+            second = flow.register_command(Command('{0}_second'.format(name), {'command': 'echo'}))
+            flow.set_dependencies(first, second)
+            project.add_flow(flow)
+        self.api.create_project(project.name, project.description)
+        self.api.upload_project(project.name, project.create_zipfile(self.tmp_dir))
+        self.exec_ids = {}
+        for flow_name, count in (('daily', 25), ('hourly', 3)):
+            self.exec_ids[flow_name] = [self.api.execute_flow('proj', flow_name)['execid'] for _ in range(count)]
+        self.fetcher = HistoryFetcher(self.api, max_workers=4, page_size=10)
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.tmp_dir)
+
+    def requests(self):
+        return self.server.request_count[('manager', 'fetchFlowExecutions')]
+
+    def exec_ids_of(self, table, flow_name):
+        return sorted(table.exec_id[table.key == table.keys.index(('proj', flow_name))].tolist())
+
+    def test_pages(self):
+        table = self.fetcher.fetch_flows([('proj', 'daily'), ('proj', 'hourly')])
+        self.assertEqual(len(table), 28)
+        self.assertEqual(self.exec_ids_of(table, 'daily'), self.exec_ids['daily'])
+        self.assertEqual(self.exec_ids_of(table, 'hourly'), self.exec_ids['hourly'])
+        self.assertEqual(set(table.statuses()), set(['SUCCEEDED']))
+        # first pages of both flows, then daily from 10 and 20
+        self.assertEqual(self.requests(), 4)
+
+    def test_max_executions(self):
+        table = self.fetcher.fetch_flows([('proj', 'daily'), ('proj', 'hourly')], max_executions=15)
+        self.assertEqual(self.exec_ids_of(table, 'daily'), self.exec_ids['daily'][-15:])
+        self.assertEqual(self.exec_ids_of(table, 'hourly'), self.exec_ids['hourly'])
+        self.assertEqual(self.requests(), 3)
+
+    def test_shifted_pages(self):
+        # an execution started after the first page shifts the next pages by one
+        fetch_flow_executions = self.api.fetch_flow_executions
+
+        def fetch_and_execute(project_name, flow_name, start=0, length=25):
+            body = fetch_flow_executions(project_name, flow_name, start=start, length=length)
+            if start == 0:
+                self.api.execute_flow(project_name, flow_name)
+            return body
+        self.api.fetch_flow_executions = fetch_and_execute
+        table = self.fetcher.fetch_flows([('proj', 'daily')])
+        exec_ids = self.exec_ids_of(table, 'daily')
+        self.assertEqual(len(exec_ids), len(set(exec_ids)))
+        self.assertEqual(exec_ids, self.exec_ids['daily'][1:])
+
+    def test_jobs(self):
+        flows = self.fetcher.fetch_flows([('proj', 'hourly')])
+        jobs = self.fetcher.fetch_jobs(flows)
+        self.assertEqual(self.server.request_count[('executor', 'fetchexecflow')], 3)
+        job_ids = [node['id'] for node in self.server.projects['proj']['flows']['hourly']]
+        self.assertEqual(sorted(jobs.keys), sorted(('proj', 'hourly', job_id) for job_id in job_ids))
+        self.assertEqual(len(jobs), 3 * len(job_ids))
+        assertArrayEqual(jobs.counts(), [3] * len(job_ids))
+        self.assertEqual(len(self.fetcher.fetch_jobs(self.fetcher.fetch_flows([]))), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+#!/usr/local/bin/python2.7
+
+# ServerMirror.refresh against FakeAzkabanServer: only projects modified since the last refresh are fetched.
+#
+#   python test_mirror.py
+
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '../../'))
+
+import shutil
+import tempfile
+import unittest
+
+from Azusa.AzkabanFakeWeb import FakeAzkabanServer
+from Azusa.AzkabanJob import Command, Flow, Project
+from Azusa.AzkabanMirror import ServerMirror
+from Azusa.AzkabanWeb import AjaxAPI
+
+
+def create_project(name, flow_names):
+    project = Project(name, "{0} desc".format(name))
+    for flow_name in flow_names:
+        flow = Flow(flow_name)
+        first = flow.register_command(Command('{0}_first'.format(flow_name), {'command': 'echo'}))
+        second = flow.register_command(Command('{0}_second'.format(flow_name), {'command': 'echo'}))
+        flow.set_dependencies(first, second)
+        project.add_flow(flow)
+    return project
+
+
+class ServerMirrorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'inventory.json')
+        self.server = FakeAzkabanServer().start()
+        self.api = AjaxAPI(self.server.url, 'azkaban', 'azkaban', log_level='CRITICAL')
+        for name, flow_names in (('p1', ['daily', 'hourly']), ('p2', ['daily']), ('p3', ['daily'])):
+            self.upload(create_project(name, flow_names), create=True)
+        self.mirror = ServerMirror(self.api, self.path, max_workers=4)
+        self.first = self.mirror.refresh()
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.tmp_dir)
+
+    def upload(self, project, create=False, seconds=0):
+        """ Upload project, then move its last modification by seconds.
+        """
+        if create:
+            self.api.create_project(project.name, project.description)
+        self.api.upload_project(project.name, project.create_zipfile(self.tmp_dir, overwrite=True))
+        self.server.projects[project.name]['lastModified'] += seconds
+
+    def requests(self):
+        return sum(count for (endpoint, action), count in self.server.request_count.items()
+                   if (endpoint, action) in (('index', None), ('manager', 'fetchprojectflows'),
+                                             ('manager', 'fetchflowgraph')))
+
+    def test_first_refresh(self):
+        self.assertEqual(self.first, (['p1', 'p2', 'p3'], [], [], [], 1 + 3 + 4))
+        self.assertEqual(self.requests(), self.first.requests)
+        self.assertEqual([project.name for project in self.mirror.projects()], ['p1', 'p2', 'p3'])
+        self.assertEqual(sorted(flow.name for flow in self.mirror.project('p1').flows), ['daily', 'hourly'])
+
+    def test_unchanged(self):
+        before = self.requests()
+        result = self.mirror.refresh()
+        self.assertEqual(result, ([], [], ['p1', 'p2', 'p3'], [], 1))
+        self.assertEqual(self.requests(), before + 1)
+        # the inventory is kept in the file
+        result = ServerMirror(self.api, self.path).refresh()
+        self.assertEqual(result.unchanged, ['p1', 'p2', 'p3'])
+
+    def test_fetched_and_removed(self):
+        self.upload(create_project('p1', ['daily', 'hourly', 'weekly']), seconds=2)
+        del self.server.projects['p3']
+        before = self.requests()
+        result = self.mirror.refresh()
+        # index, then fetchprojectflows and three fetchflowgraph of p1
+        self.assertEqual(result, (['p1'], ['p3'], ['p2'], [], 1 + 1 + 3))
+        self.assertEqual(self.requests(), before + result.requests)
+        self.assertEqual(sorted(self.mirror.inventory), ['p1', 'p2'])
+        self.assertEqual(sorted(self.mirror.inventory['p1']['flows']), ['daily', 'hourly', 'weekly'])
+        self.assertRaises(KeyError, self.mirror.project, 'p3')
+
+    def test_failed(self):
+        self.upload(create_project('p1', ['weekly']), seconds=2)
+        self.upload(create_project('p2', ['weekly']), seconds=2)
+        fetch_flow_jobs = self.api.fetch_flow_jobs
+
+        def fail_p2(project_name, flow_name):
+            if project_name == 'p2':
+                raise IOError('broken')
+            return fetch_flow_jobs(project_name, flow_name)
+        self.api.fetch_flow_jobs = fail_p2
+        result = self.mirror.refresh()
+        self.assertEqual(result, (['p1'], [], ['p3'], ['p2'], 1 + 2 + 2))
+        # the previous record of a failed project is kept, and fetched again by the next refresh
+        self.assertEqual(sorted(self.mirror.inventory['p2']['flows']), ['daily'])
+        self.api.fetch_flow_jobs = fetch_flow_jobs
+        result = self.mirror.refresh()
+        self.assertEqual(result, (['p2'], [], ['p1', 'p3'], [], 1 + 1 + 1))
+        self.assertEqual(sorted(self.mirror.inventory['p2']['flows']), ['weekly'])
+
+    def test_same_second(self):
+        # the project list page shows the last modification in seconds, so an upload
+        # within the same second as the mirrored one is not noticed
+        last_modified = self.server.projects['p2']['lastModified']
+        self.upload(create_project('p2', ['weekly']))
+        self.server.projects['p2']['lastModified'] = last_modified
+        result = self.mirror.refresh()
+        self.assertEqual(result.unchanged, ['p1', 'p2', 'p3'])
+        self.assertEqual(sorted(self.mirror.inventory['p2']['flows']), ['daily'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,275 @@
+#!/usr/local/bin/python2.7
+
+# Tests of AzkabanOptimize passes: job counts, parameter precedence and execution equivalence.
+#
+#   python test_optimize.py
+
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '../../'))
+
+import random
+import unittest
+
+import networkx as nx
+
+from Azusa.AzkabanJob import Command, Flow, Project
+from Azusa.AzkabanOptimize import (FlowSpec, JobSpec, hoist_project, inline_project, inline_subflows, partition_flow,
+                                   partition_spec)
+
+
+def chain(flow, *jobs):
+    for job in jobs:
+        if isinstance(job, Flow):
+            flow.register_subflow(job)
+        else:
+            flow.register_command(job)
+    for previous_job, next_job in zip(jobs, jobs[1:]):
+        flow.set_dependencies(previous_job, next_job)
+    return flow
+
+
+def commands(flow):
+    """ Command name -> effective parameters without 'dependencies'. (finish commands excluded)
+    """
+    out = {}
+    for job in flow.jobs:
+        if isinstance(job, Flow):
+            out.update(commands(job))
+        elif job is not flow.finish_command:
+            params = job.params.effective()
+            params.pop('dependencies', None)
+            out[job.name] = params
+    return out
+
+
+def job_files(flow):
+    """ Number of .job files of flow. (as Project.zip_entries)
+    """
+    return sum(job_files(job) + 1 if isinstance(job, Flow) else 1 for job in flow.jobs)
+
+
+def _run_graph(flow, graph):
+    ends = {}
+    for job in flow.jobs:
+        if isinstance(job, Flow):
+            ends[job] = _run_graph(job, graph)
+        else:
+            node = ('finish', flow.name) if job is flow.finish_command else job.name
+            graph.add_node(node)
+            ends[job] = ([node], node)
+    for previous_job, next_job in flow.jobs.edges():
+        for first in ends[next_job][0]:
+            graph.add_edge(ends[previous_job][1], first)
+    firsts = [first for job in flow.first_jobs for first in ends[job][0]]
+    return firsts, ends[flow.finish_command][1]
+
+
+def orderings(flow):
+    """ (command, command) pairs where the second runs only after the first. (finish commands excluded)
+    """
+    graph = nx.DiGraph()
+    _run_graph(flow, graph)
+    names = set(commands(flow))
+    return set((name, after) for name in names for after in nx.descendants(graph, name) if after in names)
+
+
+class InlineTest(unittest.TestCase):
+
+    def create_flow(self):
+        small = chain(Flow('small', properties={'queue': 'small', 'retries': '2'}),
+                      Command('s1', {'command': 'echo s1'}), Command('s2', {'command': 'echo s2', 'queue': 'own'}))
+        large = chain(Flow('large'), *[Command('l{0}'.format(i), {'command': 'echo'}) for i in range(6)])
+        flow = chain(Flow('main', properties={'queue': 'main', 'user': 'etl'}),
+                     Command('a', {'command': 'echo a'}), small, large, Command('b', {'command': 'echo b'}))
+        return flow
+
+    def test_job_count(self):
+        flow = self.create_flow()
+        inlined = inline_subflows(flow, max_jobs=5)
+        # small loses its flow job and finish command, large is kept
+        self.assertEqual(job_files(inlined), job_files(flow) - 2)
+        self.assertEqual(sorted(job.name for job in inlined.jobs if isinstance(job, Flow)), ['large'])
+        self.assertEqual(job_files(inline_subflows(flow, max_jobs=6)), job_files(flow) - 4)
+
+    def test_precedence(self):
+        effective = commands(inline_subflows(self.create_flow()))
+        # own parameters > subflow properties > parent properties
+        self.assertEqual(effective['s1']['queue'], 'small')
+        self.assertEqual(effective['s2']['queue'], 'own')
+        self.assertEqual(effective['s1']['retries'], '2')
+        self.assertEqual(effective['s1']['user'], 'etl')
+        self.assertEqual(effective['a']['queue'], 'main')
+        self.assertNotIn('retries', effective['a'])
+
+    def test_equivalence(self):
+        flow = self.create_flow()
+        for max_jobs in (0, 2, 5, 6):
+            inlined = inline_subflows(flow, max_jobs)
+            self.assertEqual(commands(inlined), commands(flow))
+            self.assertEqual(orderings(inlined), orderings(flow))
+
+    def test_nested(self):
+        inner = chain(Flow('inner', properties={'x': 'inner'}), Command('i1', {'command': 'echo'}))
+        middle = chain(Flow('middle', properties={'x': 'middle', 'y': 'middle'}),
+                       Command('m1', {'command': 'echo'}), inner, Command('m2', {'command': 'echo'}))
+        flow = chain(Flow('top', properties={'y': 'top'}), Command('t1', {'command': 'echo'}), middle)
+        inlined = inline_subflows(flow, max_jobs=5)
+        self.assertEqual(job_files(inlined), job_files(flow) - 4)
+        self.assertEqual(commands(inlined), commands(flow))
+        self.assertEqual(commands(inlined)['i1']['x'], 'inner')
+        self.assertEqual(orderings(inlined), orderings(flow))
+
+    def test_not_inlined(self):
+        parametrized = chain(Flow('parametrized', {'retries': '3'}), Command('p1', {'command': 'echo'}))
+        clashing = chain(Flow('clashing'), Command('a', {'command': 'echo'}))
+        flow = chain(Flow('main'), Command('a', {'command': 'echo'}), parametrized, clashing)
+        inlined = inline_subflows(flow)
+        self.assertEqual(job_files(inlined), job_files(flow))
+        self.assertEqual(orderings(inlined), orderings(flow))
+
+    def test_source_unchanged(self):
+        flow = self.create_flow()
+        before = commands(flow), orderings(flow), job_files(flow)
+        inline_subflows(flow)
+        self.assertEqual((commands(flow), orderings(flow), job_files(flow)), before)
+
+    def test_project(self):
+        project = Project('proj', 'desc', properties={'user': 'etl'})
+        project.add_flow(self.create_flow())
+        inlined = inline_project(project)
+        self.assertEqual(len(inlined.zip_entries()), len(project.zip_entries()) - 3)
+        self.assertEqual(commands(list(inlined.flows)[0]), commands(list(project.flows)[0]))
+
+
+def random_flow(size, seed=0):
+    rand = random.Random(seed)
+    flow = Flow('random', properties={'queue': 'q'})
+    jobs = []
+    for i in range(size):
+        job = flow.register_command(Command('j{0}'.format(i), {'command': 'echo {0}'.format(i)}))
+        for previous_job in set(rand.sample(jobs, min(len(jobs), rand.randrange(3)))):
+            flow.set_dependencies(previous_job, job)
+        jobs.append(job)
+    return flow
+
+
+def max_direct_jobs(flow):
+    return max([len(flow.jobs) - 1] + [max_direct_jobs(job) for job in flow.jobs if isinstance(job, Flow)])
+
+
+def spec_of(size, shape):
+    spec = FlowSpec('f', {})
+    for i in range(size):
+        basename = 'j{0}'.format(i)
+        spec.jobs[basename] = JobSpec(basename, {'command': 'echo'})
+        spec.dependencies[basename] = ['j{0}'.format(i - 1)] if shape == 'chain' and i else []
+    return spec
+
+
+class PartitionTest(unittest.TestCase):
+
+    def test_sizes(self):
+        flow = random_flow(300)
+        for max_jobs in (2, 10, 50, 299):
+            partitioned = partition_flow(flow, max_jobs)
+            self.assertLessEqual(max_direct_jobs(partitioned), max_jobs)
+            self.assertEqual(sorted(commands(partitioned)), sorted(commands(flow)))
+
+    def test_orderings_kept(self):
+        flow = random_flow(300)
+        partitioned = partition_flow(flow, max_jobs=20)
+        self.assertEqual(commands(partitioned), commands(flow))
+        self.assertTrue(orderings(flow).issubset(orderings(partitioned)))
+        self.assertTrue(nx.is_directed_acyclic_graph(partitioned.jobs))
+
+    def test_small_flow_unchanged(self):
+        flow = random_flow(30)
+        partitioned = partition_flow(flow, max_jobs=30)
+        self.assertEqual(job_files(partitioned), job_files(flow))
+        self.assertEqual(orderings(partitioned), orderings(flow))
+
+    def test_terminates(self):
+        for shape in ('chain', 'independent'):
+            for size in (3, 4, 7, 50, 1001):
+                for max_jobs, imbalance in ((2, 0.5), (2, 0.0), (3, 1.5), (10, 0.1)):
+                    spec = spec_of(size, shape)
+                    partition_spec(spec, max_jobs, imbalance)
+                    self.assertLessEqual(len(spec.jobs), max_jobs)
+
+    def test_invalid_arguments(self):
+        self.assertRaises(ValueError, partition_spec, spec_of(5, 'chain'), 1)
+        self.assertRaises(ValueError, partition_spec, spec_of(5, 'chain'), 2, 1.0)
+        self.assertRaises(ValueError, partition_spec, spec_of(5, 'chain'), 10, -0.1)
+
+
+def job_params(project):
+    """ Path -> effective parameters without 'dependencies' of every .job file.
+    """
+    out = {}
+    for path, azkaban_file in project.zip_entries():
+        if isinstance(azkaban_file, (Command, Flow)):
+            params = azkaban_file.params.effective()
+            params.pop('dependencies', None)
+            out[path] = params
+    return out
+
+
+class HoistTest(unittest.TestCase):
+
+    def create_project(self):
+        project = Project('proj', 'desc', properties={'user': 'etl'})
+        shared = {'retries': '3', 'retry.backoff': '100'}
+        flow = Flow('main', properties={'queue': 'q'})
+        jobs = []
+        for i in range(5):
+            params = dict(shared, command='echo {0}'.format(i))
+            if i == 4:
+                params['retries'] = '5'
+            jobs.append(Command('c{0}'.format(i), params))
+        chain(flow, *jobs)
+        flow.finish_command.params._set('retries', '3')
+        project.add_flow(flow)
+        other = chain(Flow('other'), Command('o1', {'command': 'echo', 'retries': '3'}))
+        project.add_flow(other)
+        return project
+
+    def test_equivalence(self):
+        project = self.create_project()
+        hoisted, report = hoist_project(project)
+        self.assertEqual(job_params(hoisted), job_params(project))
+        self.assertEqual(report.files_before, len(project.zip_entries()))
+        self.assertEqual(report.files_after, len(hoisted.zip_entries()))
+        self.assertLess(report.bytes_after, report.bytes_before)
+
+    def test_shared_by_all_jobs(self):
+        hoisted, _ = hoist_project(self.create_project())
+        flows = dict((flow.name, flow) for flow in hoisted.flows)
+        main = flows['main']
+        # every job in main has retries (the finish command too), but not retry.backoff
+        self.assertEqual(dict(main.properties.params.items()), {'queue': 'q', 'retries': '3'})
+        self.assertEqual(main.finish_command.params.effective().get('retry.backoff'), None)
+        jobs = dict((job.name, job) for job in main.jobs)
+        self.assertNotIn('retries', dict(jobs['c0'].params.items()))
+        self.assertEqual(dict(jobs['c4'].params.items())['retries'], '5')
+        self.assertEqual(dict(jobs['c0'].params.items())['retry.backoff'], '100')
+        self.assertEqual(dict(hoisted.properties.params.items()), {'user': 'etl'})
+
+    def test_subflow_jobs(self):
+        project = Project('proj', 'desc')
+        sub = chain(Flow('sub'), Command('s1', {'command': 'echo', 'queue': 'q'}))
+        sub.finish_command.params._set('queue', 'q')
+        flow = chain(Flow('main'), Command('m1', {'command': 'echo', 'queue': 'q'}), sub)
+        flow.finish_command.params._set('queue', 'q')
+        project.add_flow(flow)
+        hoisted, _ = hoist_project(project)
+        # flow_sub.job has no queue, so queue is hoisted into sub only
+        self.assertEqual(job_params(hoisted), job_params(project))
+        main = list(hoisted.flows)[0]
+        self.assertIsNone(main.properties)
+        self.assertEqual(dict(list(job for job in main.jobs if isinstance(job, Flow))[0].properties.params.items()),
+                         {'queue': 'q'})
+
+
+if __name__ == '__main__':
+    unittest.main()
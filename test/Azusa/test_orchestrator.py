@@ -0,0 +1,148 @@
+#!/usr/local/bin/python2.7
+
+# Orchestrator against FakeAzkabanServer: concurrency limits, failures and resuming from the state file.
+#
+#   python test_orchestrator.py
+
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '../../'))
+
+import json
+import shutil
+import tempfile
+import unittest
+
+from Azusa.AzkabanFakeWeb import FakeAzkabanServer
+from Azusa.AzkabanJob import Command, Flow, Project
+from Azusa.AzkabanOrchestrator import FAILED, RUNNING, SKIPPED, SUCCEEDED, Orchestrator
+from Azusa.AzkabanWeb import AjaxAPI
+
+
+def max_overlap(executions):
+    """ Maximum number of executions running at the same time.
+    """
+    events = sorted([(e['startTime'], 1) for e in executions] + [(e['endTime'], -1) for e in executions])
+    running = peak = 0
+    for _, delta in events:
+        running += delta
+        peak = max(peak, running)
+    return peak
+
+
+class OrchestratorTest(unittest.TestCase):
+
+    FLOWS = {'etl': ['e0', 'e1', 'e2', 'e3'], 'report': ['r0', 'r1', 'r2', 'r3']}
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.state_path = os.path.join(self.tmp_dir, 'state.json')
+        self.server = FakeAzkabanServer(execution_time=0.2).start()
+        self.api = AjaxAPI(self.server.url, 'azkaban', 'azkaban', log_level='CRITICAL')
+        for project_name, flow_names in sorted(self.FLOWS.items()):
+            project = Project(project_name, 'desc')
+            for flow_name in flow_names:
+                flow = Flow(flow_name)
+                flow.register_command(Command('{0}_job'.format(flow_name), {'command': 'echo'}))
+                project.add_flow(flow)
+            self.api.create_project(project.name, project.description)
+            self.api.upload_project(project.name, project.create_zipfile(self.tmp_dir))
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.tmp_dir)
+
+    def orchestrator(self, **kwargs):
+        kwargs.setdefault('poll_interval', 0.02)
+        return Orchestrator(self.api, **kwargs)
+
+    def add_all(self, orchestrator):
+        for project_name, flow_names in sorted(self.FLOWS.items()):
+            for flow_name in flow_names:
+                orchestrator.add_flow(project_name, flow_name)
+
+    def executions(self, project_name=None):
+        return [e for e in self.server.executions.values() if project_name in (None, e['project'])]
+
+    def assertAllSucceeded(self, states):
+        self.assertEqual(set(state.status for state in states.values()), set([SUCCEEDED]))
+
+    def test_global_limit(self):
+        orchestrator = self.orchestrator(max_running=3)
+        self.add_all(orchestrator)
+        self.assertAllSucceeded(orchestrator.run())
+        self.assertEqual(len(self.executions()), 8)
+        self.assertEqual(max_overlap(self.executions()), 3)
+
+    def test_project_limits(self):
+        orchestrator = self.orchestrator(max_running=3, project_limits={'etl': 1})
+        self.add_all(orchestrator)
+        self.assertAllSucceeded(orchestrator.run())
+        self.assertEqual(max_overlap(self.executions('etl')), 1)
+        self.assertEqual(max_overlap(self.executions()), 3)
+
+    def test_dependencies(self):
+        orchestrator = self.orchestrator()
+        e0 = orchestrator.add_flow('etl', 'e0')
+        r0 = orchestrator.add_flow('report', 'r0', upstreams=[e0])
+        orchestrator.add_flow('report', 'r1', upstreams=[r0, ('etl', 'e1')])
+        self.assertAllSucceeded(orchestrator.run())
+        executions = dict((e['flow'], e) for e in self.executions())
+        self.assertGreaterEqual(executions['r0']['startTime'], executions['e0']['endTime'])
+        self.assertGreaterEqual(executions['r1']['startTime'], executions['r0']['endTime'])
+        self.assertGreaterEqual(executions['r1']['startTime'], executions['e1']['endTime'])
+
+    def test_failed_upstream(self):
+        orchestrator = self.orchestrator()
+        missing = orchestrator.add_flow('etl', 'missing')
+        r0 = orchestrator.add_flow('report', 'r0', upstreams=[missing])
+        orchestrator.add_flow('report', 'r1', upstreams=[r0])
+        orchestrator.add_flow('report', 'r2')
+        states = orchestrator.run()
+        self.assertEqual(states[missing].status, FAILED)
+        self.assertEqual(states[r0], (SKIPPED, None, 'etl.missing failed'))
+        self.assertEqual(states[('report', 'r1')].error, 'report.r0 skipped')
+        self.assertEqual(states[('report', 'r2')].status, SUCCEEDED)
+        self.assertEqual([e['flow'] for e in self.executions()], ['r2'])
+
+    def test_cycle(self):
+        orchestrator = self.orchestrator()
+        e0 = orchestrator.add_flow('etl', 'e0', upstreams=[('etl', 'e1')])
+        orchestrator.add_flow('etl', 'e1', upstreams=[e0])
+        self.assertRaises(Orchestrator.OrchestratorError, orchestrator.run)
+
+    def test_resume(self):
+        orchestrator = self.orchestrator(state_path=self.state_path)
+        self.add_all(orchestrator)
+        self.assertAllSucceeded(orchestrator.run())
+        with open(self.state_path) as f:
+            nodes = json.load(f)['nodes']
+        self.assertEqual(len(nodes), 8)
+        # succeeded flows are not executed again
+        orchestrator = self.orchestrator(state_path=self.state_path)
+        self.add_all(orchestrator)
+        self.assertAllSucceeded(orchestrator.run())
+        self.assertEqual(len(self.executions()), 8)
+
+    def test_resume_running_and_failed(self):
+        running = self.api.execute_flow('etl', 'e0')['execid']
+        nodes = [{'project': 'etl', 'flow': 'e0', 'status': RUNNING, 'execid': running, 'error': None},
+                 {'project': 'etl', 'flow': 'e1', 'status': SUCCEEDED, 'execid': 99, 'error': None},
+                 {'project': 'etl', 'flow': 'e2', 'status': FAILED, 'execid': 98, 'error': 'FAILED'},
+                 {'project': 'etl', 'flow': 'e3', 'status': SKIPPED, 'execid': None, 'error': 'etl.e2 failed'}]
+        with open(self.state_path, 'w') as f:
+            json.dump({'nodes': nodes}, f)
+        orchestrator = self.orchestrator(state_path=self.state_path)
+        for flow_name in self.FLOWS['etl']:
+            orchestrator.add_flow('etl', flow_name)
+        states = orchestrator.run()
+        self.assertAllSucceeded(states)
+        # the running execution is watched, failed and skipped flows run again
+        self.assertEqual(states[('etl', 'e0')].exec_id, running)
+        self.assertEqual(states[('etl', 'e1')].exec_id, 99)
+        self.assertEqual(sorted(e['flow'] for e in self.executions()), ['e0', 'e2', 'e3'])
+        self.assertEqual(orchestrator.load_state(), states)
+
+
+if __name__ == '__main__':
+    unittest.main()
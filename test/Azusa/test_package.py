@@ -0,0 +1,125 @@
+#!/usr/local/bin/python2.7
+
+# BatchPackager archives compared with Project.create_zipfile.
+#
+#   python test_package.py
+
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '../../'))
+
+import shutil
+import tempfile
+import threading
+import unittest
+import zipfile
+
+from Azusa import AzkabanPackage
+from Azusa.AzkabanJob import Command, Flow, Project
+from Azusa.AzkabanPackage import BatchPackager, entries_digest
+
+
+def create_projects():
+    projects = []
+    for env in ('dev', 'stg', 'prd'):
+        for n in range(3):
+            project = Project('proj{0}_{1}'.format(n, env), 'desc', properties={'env': env})
+            for name in ('extract', 'load'):
+                flow = Flow(name, properties={'queue': name})
+                previous_job = None
+                for i in range(20):
+                    job = flow.register_command(Command('{0}{1}'.format(name, i), {
+                        'command': 'python {0}.py --step {1} {2}'.format(name, i, '-v ' * 50), 'retries': n}))
+                    if previous_job is not None:
+                        flow.set_dependencies(previous_job, job)
+                    previous_job = job
+                project.add_flow(flow)
+            projects.append(project)
+    return projects
+
+
+class BatchPackagerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.projects = create_projects()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def assertSameArchives(self, compression, processes, precompressed):
+        sequential_dir = os.path.join(self.tmp_dir, 'sequential')
+        batch_dir = os.path.join(self.tmp_dir, 'batch')
+        for project in self.projects:
+            project.create_zipfile(sequential_dir, overwrite=True, compression=compression)
+        packager = BatchPackager(batch_dir, compression=compression, processes=processes, overwrite=True)
+        packager.precompressed = precompressed
+        results = packager.package(self.projects)
+        self.assertEqual([result.name for result in results], [project.name for project in self.projects])
+        for project, result in zip(self.projects, results):
+            expected = zipfile.ZipFile(os.path.join(sequential_dir, project.filename))
+            actual = zipfile.ZipFile(result.path)
+            self.assertIsNone(actual.testzip())
+            self.assertEqual(result.entries, len(expected.infolist()))
+            self.assertEqual(result.digest, entries_digest([(info.filename, expected.read(info))
+                                                            for info in expected.infolist()]))
+            self.assertEqual([info.filename for info in actual.infolist()],
+                             [info.filename for info in expected.infolist()])
+            for expected_info, actual_info in zip(expected.infolist(), actual.infolist()):
+                for attr in ('compress_type', 'external_attr', 'CRC', 'file_size', 'compress_size', 'flag_bits'):
+                    self.assertEqual(getattr(actual_info, attr), getattr(expected_info, attr), attr)
+                self.assertEqual(actual.read(actual_info), expected.read(expected_info))
+
+    def test_stored(self):
+        self.assertSameArchives(zipfile.ZIP_STORED, 2, AzkabanPackage.PRECOMPRESSED)
+
+    def test_deflated(self):
+        self.assertSameArchives(zipfile.ZIP_DEFLATED, 2, AzkabanPackage.PRECOMPRESSED)
+
+    def test_single_process(self):
+        self.assertSameArchives(zipfile.ZIP_DEFLATED, 1, AzkabanPackage.PRECOMPRESSED)
+
+    def test_writestr_fallback(self):
+        self.assertSameArchives(zipfile.ZIP_STORED, 2, False)
+        self.assertSameArchives(zipfile.ZIP_DEFLATED, 2, False)
+
+    def test_shared_texts(self):
+        results = BatchPackager(self.tmp_dir, compression=zipfile.ZIP_DEFLATED, processes=2).package(self.projects)
+        self.assertEqual([result.entries for result in results], [2 * 21 + 2 + 1] * len(self.projects))
+        # commands differ by retries only, and env only appears in the project properties
+        texts = [zipfile.ZipFile(result.path).read(info) for result in results
+                 for info in zipfile.ZipFile(result.path).infolist()]
+        self.assertEqual(len(set(texts)), 3 * 40 + 2 + 2 + 3)
+
+    def test_side_by_side(self):
+        # packagers in threads render their own projects, unpicklable ones included
+        for project in self.projects:
+            project.unpicklable = lambda: None
+        halves = [self.projects[0::2], self.projects[1::2]]
+        results = [None, None]
+
+        def package(i):
+            results[i] = BatchPackager(os.path.join(self.tmp_dir, str(i)), processes=2).package(halves[i])
+        threads = [threading.Thread(target=package, args=(i,)) for i in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for projects, project_results in zip(halves, results):
+            self.assertEqual([result.name for result in project_results], [project.name for project in projects])
+            for project, result in zip(projects, project_results):
+                self.assertIn('env={0}'.format(project.properties.params['env']),
+                              zipfile.ZipFile(result.path).read('{0}/{0}.properties'.format(project.name)))
+        self.assertEqual(AzkabanPackage._worker_projects, [])
+
+    def test_existing(self):
+        BatchPackager(self.tmp_dir).package(self.projects[:1])
+        self.assertRaises(IOError, BatchPackager(self.tmp_dir).package, self.projects[:1])
+        self.assertRaises(BatchPackager.PackageError, BatchPackager(self.tmp_dir, overwrite=True).package,
+                          self.projects[:1] * 2)
+        self.assertRaises(BatchPackager.PackageError, BatchPackager, self.tmp_dir, compression=zipfile.ZIP_BZIP2
+                          if hasattr(zipfile, 'ZIP_BZIP2') else 12)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+#!/usr/local/bin/python2.7
+
+# Tests of copy-on-write Params: given dicts are never modified and parents resolve lazily.
+#
+#   python test_params.py
+
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '../../'))
+
+import collections
+import unittest
+
+from Azusa.AzkabanJob import Command, Flow, Project, Properties
+from Azusa.AzkabanJobBase import Params
+
+
+def baseline_text(params):
+    """ Lines of the text rendered before Params became copy on write. (simple values only)
+    """
+    lines = []
+    for key, value in params.items():
+        if isinstance(value, list):
+            value = ','.join([str(x) for x in value])
+        elif isinstance(value, dict):
+            value = ','.join([k for k in value.keys()])
+        lines.append("{0}={1}".format(key, value))
+    return lines
+
+
+class ParamsTest(unittest.TestCase):
+
+    def test_given_dict_not_modified(self):
+        data = {'command': 'echo', 'dependencies': ['a']}
+        snapshot = {'command': 'echo', 'dependencies': ['a']}
+        first = Command('first', data)
+        second = Command('second', data)
+        first.params._set('retries', 3)
+        first.params._set_dependencies(Command('b', {}))
+        self.assertEqual(data, snapshot)
+        self.assertEqual(first.params['dependencies'], ['a', 'b'])
+        self.assertEqual(second.params['dependencies'], ['a'])
+        self.assertNotIn('retries', second.params)
+        first.params._remove_dependencies(Command('a', {}))
+        self.assertEqual(data, snapshot)
+
+    def test_shared_dict_in_flow(self):
+        data = {'command': 'echo'}
+        flow = Flow('flow')
+        jobs = [flow.register_command(Command('job{0}'.format(i), data)) for i in range(3)]
+        flow.set_dependencies(jobs[0], jobs[1])
+        self.assertEqual(data, {'command': 'echo'})
+        self.assertEqual(jobs[1].params['dependencies'], ['job0'])
+        self.assertNotIn('dependencies', jobs[2].params)
+
+    def test_child_writes_do_not_leak(self):
+        parent = Params({'queue': 'default', 'user': 'etl'})
+        child = Params({'command': 'echo'}, parent)
+        child._set('queue', 'high')
+        self.assertEqual(parent['queue'], 'default')
+        self.assertEqual(child.resolve('queue'), 'high')
+        self.assertEqual(child.resolve('user'), 'etl')
+        self.assertEqual(child.resolve('missing', 'none'), 'none')
+        self.assertEqual(child.effective(), {'command': 'echo', 'queue': 'high', 'user': 'etl'})
+        self.assertEqual(len(parent), 2)
+
+    def test_inherited_from_properties(self):
+        flow = Flow('flow', properties={'queue': 'q', 'retries': '1'})
+        job = flow.register_command(Command('job', {'command': 'echo', 'retries': '2'}))
+        self.assertEqual(job.params.resolve('queue'), 'q')
+        self.assertEqual(job.params.resolve('retries'), '2')
+        self.assertNotIn('queue', job.params)
+        self.assertEqual(dict(flow.properties.params.items()), {'queue': 'q', 'retries': '1'})
+
+    def test_mapping_view_sees_overlay(self):
+        params = Params({'a': 1, 'b': 2})
+        params._set('b', 3)
+        params._set('c', 4)
+        self.assertIsInstance(params, collections.Mapping)
+        self.assertIn('c', params)
+        self.assertNotIn('d', params)
+        self.assertEqual(len(params), 3)
+        self.assertEqual(sorted(params), ['a', 'b', 'c'])
+        self.assertEqual(sorted(params.keys()), ['a', 'b', 'c'])
+        self.assertEqual(sorted(params.values()), [1, 3, 4])
+        self.assertEqual(dict(params.items()), {'a': 1, 'b': 3, 'c': 4})
+        self.assertEqual(dict(params.iteritems()), {'a': 1, 'b': 3, 'c': 4})
+        self.assertEqual(params, {'a': 1, 'b': 3, 'c': 4})
+        self.assertEqual(params.get('d', 5), 5)
+
+    def test_slots(self):
+        self.assertRaises(AttributeError, setattr, Params({}), 'other', 1)
+
+    def test_text_unchanged_from_baseline(self):
+        flow = Flow('flow', properties={'queue': 'q'})
+        first = flow.register_command(Command('first', {'command': 'echo 1', 'retries': 3, 'user': {'etl': 1}}))
+        second = flow.register_command(Command('second', {'command': 'echo 2', 'dependencies': ['zero']}))
+        flow.set_dependencies(first, second)
+        project = Project('project', 'desc', properties={'user': 'etl'})
+        project.add_flow(flow)
+        for _, azkaban_file in project.zip_entries():
+            self.assertEqual(sorted(azkaban_file.text.split('\n')), sorted(baseline_text(azkaban_file.params)))
+        self.assertEqual(second.text, 'command=echo 2\ndependencies=zero,first\ntype=command')
+        self.assertEqual(Properties('p', {'b': 1, 'a': 'x'}).text, 'a=x\nb=1')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+#!/usr/local/bin/python2.7
+
+# ScheduleReconciler against FakeAzkabanServer: only the needed changes are sent.
+#
+#   python test_schedule.py
+
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '../../'))
+
+import shutil
+import tempfile
+import unittest
+from datetime import datetime
+
+from Azusa.AzkabanFakeWeb import FakeAzkabanServer
+from Azusa.AzkabanJob import Command, Flow, Project, Schedule
+from Azusa.AzkabanSchedule import CREATE, REMOVE, UPDATE, ScheduleReconciler, to_millis
+from Azusa.AzkabanWeb import AjaxAPI
+
+
+def create_project(schedules):
+    """ Project with flows 'daily', 'hourly' and 'adhoc', scheduled by flow name -> Schedule.
+    """
+    project = Project('proj', 'desc')
+    for name in ('daily', 'hourly', 'adhoc'):
+        flow = Flow(name)
+        flow.register_command(Command('{0}_job'.format(name), {'command': 'echo'}))
+        project.add_flow(flow, schedule=schedules.get(name))
+    return project
+
+
+class ScheduleReconcilerTest(unittest.TestCase):
+
+    DAILY = Schedule(datetime(2030, 1, 1, 9, 0), '1d')
+    HOURLY = Schedule(datetime(2030, 1, 1, 0, 30), '1h')
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.server = FakeAzkabanServer().start()
+        self.api = AjaxAPI(self.server.url, 'azkaban', 'azkaban', log_level='CRITICAL')
+        project = create_project({})
+        self.api.create_project(project.name, project.description)
+        self.project_id = self.api.upload_project(project.name, project.create_zipfile(self.tmp_dir))['projectId']
+        self.reconciler = ScheduleReconciler(self.api)
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.tmp_dir)
+
+    def schedules(self):
+        return dict((s['flowname'], (s['time'], s['period'])) for s in self.api.fetch_schedules())
+
+    def requests(self, action):
+        return self.server.request_count[('schedule', action)]
+
+    def actions(self, changes):
+        return sorted((change.action, change.flow) for change in changes)
+
+    def test_create(self):
+        project = create_project({'daily': self.DAILY, 'hourly': self.HOURLY})
+        changes = self.reconciler.plan([project])
+        self.assertEqual(self.actions(changes), [(CREATE, 'daily'), (CREATE, 'hourly')])
+        self.reconciler.reconcile([project])
+        self.assertEqual(self.schedules(), {'daily': (to_millis(self.DAILY.start_datetime), 86400000),
+                                            'hourly': (to_millis(self.HOURLY.start_datetime), 3600000)})
+        self.assertEqual(self.requests('scheduleFlow'), 2)
+
+    def test_no_op(self):
+        project = create_project({'daily': self.DAILY, 'hourly': self.HOURLY})
+        self.reconciler.reconcile([project])
+        self.assertEqual(self.reconciler.plan([project]), [])
+        self.assertEqual(self.reconciler.reconcile([project]), [])
+        self.assertEqual(self.requests('scheduleFlow'), 2)
+        self.assertEqual(self.requests('removeSched'), 0)
+
+    def test_update(self):
+        self.reconciler.reconcile([create_project({'daily': self.DAILY, 'hourly': self.HOURLY})])
+        later = Schedule(datetime(2030, 1, 1, 10, 0), '1d')
+        weekly = Schedule(self.HOURLY.start_datetime, '1w')
+        project = create_project({'daily': later, 'hourly': weekly})
+        self.assertEqual(self.actions(self.reconciler.plan([project])), [(UPDATE, 'daily'), (UPDATE, 'hourly')])
+        self.reconciler.reconcile([project])
+        self.assertEqual(self.schedules(), {'daily': (to_millis(later.start_datetime), 86400000),
+                                            'hourly': (to_millis(weekly.start_datetime), 7 * 86400000)})
+        self.assertEqual(self.reconciler.plan([project]), [])
+
+    def test_remove_only_with_prune(self):
+        self.reconciler.reconcile([create_project({'daily': self.DAILY, 'hourly': self.HOURLY})])
+        project = create_project({'daily': self.DAILY})
+        self.assertEqual(self.reconciler.plan([project]), [])
+        self.assertEqual(self.actions(self.reconciler.plan([project], prune=True)), [(REMOVE, 'hourly')])
+        self.reconciler.reconcile([project], prune=True)
+        self.assertEqual(sorted(self.schedules()), ['daily'])
+        self.assertEqual(self.requests('removeSched'), 1)
+
+    def test_project_without_schedules(self):
+        self.reconciler.reconcile([create_project({'daily': self.DAILY})])
+        unmanaged = create_project({})
+        self.assertEqual(self.reconciler.reconcile([unmanaged]), [])
+        self.assertEqual(sorted(self.schedules()), ['daily'])
+        self.assertEqual(self.actions(self.reconciler.plan([unmanaged], prune=True)), [(REMOVE, 'daily')])
+
+    def test_dry_run(self):
+        project = create_project({'daily': self.DAILY})
+        results = self.reconciler.reconcile([project], dry_run=True)
+        self.assertEqual([(change.action, result) for change, result in results], [(CREATE, None)])
+        self.assertEqual(self.schedules(), {})
+        self.assertEqual(self.requests('scheduleFlow'), 0)
+
+    def test_apply_with_project_ids(self):
+        project = create_project({'daily': self.DAILY})
+        changes = self.reconciler.plan([project])
+        flows_before = self.server.request_count[('manager', 'fetchprojectflows')]
+        results = self.reconciler.apply(changes, project_ids={project.name: self.project_id})
+        self.assertEqual([result.get('status') for _, result in results], ['success'])
+        self.assertEqual(self.server.request_count[('manager', 'fetchprojectflows')], flows_before)
+        # without project_ids the id is resolved once per project
+        project = create_project({'daily': self.HOURLY, 'hourly': self.HOURLY})
+        self.reconciler.apply(self.reconciler.plan([project]))
+        self.assertEqual(self.server.request_count[('manager', 'fetchprojectflows')], flows_before + 1)
+        self.assertEqual(sorted(self.schedules()), ['daily', 'hourly'])
+
+    def test_failures(self):
+        project = create_project({'daily': self.DAILY})
+        results = self.reconciler.apply(self.reconciler.plan([project]), project_ids={project.name: 999})
+        self.assertEqual(len(results), 1)
+        self.assertRaises(ScheduleReconciler.ReconcileError, self.reconciler.reconcile, [project],
+                          project_ids={project.name: 999})
+        self.assertEqual(self.schedules(), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
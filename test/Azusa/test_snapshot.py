@@ -0,0 +1,135 @@
+#!/usr/local/bin/python2.7
+# -*- coding: utf-8 -*-
+
+# Project snapshots: round trip, lazy flow loading and broken files.
+#
+#   python test_snapshot.py
+
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '../../'))
+
+import shutil
+import struct
+import tempfile
+import unittest
+import zipfile
+from datetime import datetime
+
+from Azusa import AzkabanSnapshot
+from Azusa.AzkabanJob import Command, Flow, Project, Schedule
+from Azusa.AzkabanSnapshot import ProjectSnapshot
+
+
+def create_project():
+    project = Project('proj', u'déscription', properties={'user': 'etl', 'retries': 3})
+    sub = Flow('sub', properties={'queue': 'sub'})
+    sub_jobs = [sub.register_command(Command('s{0}'.format(i), {'command': 'echo s{0}'.format(i)})) for i in range(3)]
+    sub.set_dependencies(sub_jobs[0], sub_jobs[1])
+    daily = Flow('daily', properties={'queue': 'default'})
+    first = daily.register_command(Command('first', {'command': 'echo "a=b"', 'ratio': 0.5, 'flag': True,
+                                                     'big': -(10 ** 12), 'list': ['x', u'ü']}))
+    daily.register_subflow(sub)
+    last = daily.register_command(Command('last', {'command': 'echo last', 'dependencies': ['first']}))
+    daily.set_dependencies(first, sub)
+    daily.set_dependencies(sub, last)
+    project.add_flow(daily, schedule=Schedule(datetime(2030, 1, 1, 9, 30), '1d'))
+    hourly = Flow('hourly')
+    hourly.register_command(Command('ping', {'command': 'echo ping'}))
+    project.add_flow(hourly)
+    return project
+
+
+def zip_contents(path):
+    # flows are a set, so the entry order of project zips is arbitrary
+    with zipfile.ZipFile(path) as project_zip:
+        return sorted((info.filename, project_zip.read(info)) for info in project_zip.infolist())
+
+
+class SnapshotTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'proj.azsnap')
+        self.project = create_project()
+        self.project.save_snapshot(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def rewrite(self, offset, data):
+        with open(self.path, 'r+b') as f:
+            f.seek(offset)
+            f.write(data)
+
+    def test_round_trip(self):
+        loaded = Project.load_snapshot(self.path)
+        self.assertEqual(loaded.name, self.project.name)
+        self.assertEqual(loaded.description, self.project.description)
+        self.assertEqual(dict(loaded.schedules), dict(self.project.schedules))
+        expected = self.project.create_zipfile(os.path.join(self.tmp_dir, 'expected'))
+        actual = loaded.create_zipfile(os.path.join(self.tmp_dir, 'actual'))
+        self.assertEqual(zip_contents(actual), zip_contents(expected))
+
+    def test_lazy_flow(self):
+        snapshot = ProjectSnapshot(self.path)
+        self.assertEqual(sorted(snapshot.flow_names), ['daily', 'hourly'])
+        flow = snapshot.load_flow('hourly')
+        self.assertEqual(sorted(job.name for job in flow.jobs), ['hourly', 'ping'])
+        self.assertRaises(KeyError, snapshot.load_flow, 'missing')
+        project = snapshot.load_project(['daily'])
+        self.assertEqual([flow.name for flow in project.flows], ['daily'])
+        daily = list(project.flows)[0]
+        jobs = dict((job.name, job) for job in daily.jobs)
+        self.assertEqual(jobs['first'].params['ratio'], 0.5)
+        self.assertEqual(jobs['first'].params['list'], ['x', u'ü'])
+        self.assertEqual(jobs['last'].params['dependencies'], ['first', 'flow_sub'])
+        self.assertEqual(jobs['sub'].properties.params['queue'], 'sub')
+
+    def test_bad_magic(self):
+        self.rewrite(0, 'NOTSNP')
+        self.assertRaises(ProjectSnapshot.SnapshotError, ProjectSnapshot, self.path)
+
+    def test_bad_version(self):
+        self.rewrite(len(AzkabanSnapshot.MAGIC), struct.pack('>H', AzkabanSnapshot.VERSION + 1))
+        self.assertRaises(ProjectSnapshot.SnapshotError, ProjectSnapshot, self.path)
+
+    def test_bad_header_crc(self):
+        self.rewrite(AzkabanSnapshot._PREFIX.size, 'X')
+        self.assertRaises(ProjectSnapshot.SnapshotError, ProjectSnapshot, self.path)
+
+    def test_bad_section_crc(self):
+        size = os.path.getsize(self.path)
+        with open(self.path, 'rb') as f:
+            f.seek(size - 1)
+            last = f.read(1)
+        self.rewrite(size - 1, chr(ord(last) ^ 0xff))
+        snapshot = ProjectSnapshot(self.path)
+        broken = snapshot.flow_names[-1]
+        self.assertRaises(ProjectSnapshot.SnapshotError, snapshot.load_flow, broken)
+        self.assertRaises(ProjectSnapshot.SnapshotError, Project.load_snapshot, self.path)
+
+    def test_truncated(self):
+        size = os.path.getsize(self.path)
+        for length in (3, AzkabanSnapshot._PREFIX.size + 2):
+            with open(self.path, 'rb') as f:
+                data = f.read()
+            with open(self.path, 'wb') as f:
+                f.write(data[:length])
+            self.assertRaises(ProjectSnapshot.SnapshotError, ProjectSnapshot, self.path)
+            with open(self.path, 'wb') as f:
+                f.write(data)
+        with open(self.path, 'r+b') as f:
+            f.truncate(size - 5)
+        snapshot = ProjectSnapshot(self.path)
+        self.assertRaises(ProjectSnapshot.SnapshotError, snapshot.load_flow, snapshot.flow_names[-1])
+
+    def test_truncated_varint(self):
+        # a string table count whose continuation byte is missing
+        self.assertRaises(ProjectSnapshot.SnapshotError, AzkabanSnapshot._Reader, '\x80')
+        # one string whose index is out of the table
+        self.assertRaises(ProjectSnapshot.SnapshotError, AzkabanSnapshot._Reader('\x00\x05').string)
+
+
+if __name__ == '__main__':
+    unittest.main()